@@ -0,0 +1,26 @@
+"""Compares the per-symbol read loop of get_daily_stock_data against batched reads."""
+
+import time
+
+from DataManager.database_layer.tables import DailyStockTableManager
+
+if __name__ == "__main__":
+    manager = DailyStockTableManager(timeframe="1Day")
+    symbols = sorted(manager.set_symbols)[:3000]
+    start_timestamp, end_timestamp = "2021-01-04 00:00:00", "2021-12-31 00:00:00"
+
+    for label, batch_size, n_workers in [
+        ("loop", None, 1),
+        ("batched", 200, 1),
+        ("batched + threads", 200, 4),
+    ]:
+        start = time.time()
+        manager.get_daily_stock_data(
+            list(symbols),
+            start_timestamp,
+            end_timestamp,
+            ensure_full_data=False,
+            batch_size=batch_size,
+            n_workers=n_workers,
+        )
+        print(f"{label}: {time.time() - start:.2f}s for {len(symbols)} symbols")
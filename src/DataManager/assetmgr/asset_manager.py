@@ -15,23 +15,27 @@ class Assets:
         self.assetExtraction = AssetExtractor()
 
     def update_db_alpaca_assets(self):
-        listAlpAssets = list(
-            map(
-                lambda individualAsset: {
-                    "stockSymbol": individualAsset["symbol"],
-                    "companyName": individualAsset["name"],
-                    "exchangeName": individualAsset["exchange"],
-                    "isDelisted": individualAsset["status"] != "active",
-                    "isShortable": individualAsset["shortable"],
-                    "isSuspended": not individualAsset["tradable"],
-                    "dateLastUpdated": TimeHandler.get_string_from_datetime(
-                        datetime.now(timezone.utc)
-                    ),
-                },
-                self.assetExtraction.getAllAlpacaAssets(),
-            )
+        """
+        Refreshes the Alpaca assets, writing only the assets that changed.
+        Returns the changes recorded in the asset change log.
+        """
+        listAlpAssets = [
+            {
+                "stockSymbol": individualAsset["symbol"],
+                "companyName": individualAsset["name"],
+                "exchangeName": individualAsset["exchange"],
+                "isDelisted": individualAsset["status"] != "active",
+                "isShortable": individualAsset["shortable"],
+                "isSuspended": not individualAsset["tradable"],
+            }
+            for individualAsset in self.assetExtraction.getAllAlpacaAssets()
+        ]
+        list_changes = self.asset_table_manager.refresh_assets(
+            listAlpAssets,
+            TimeHandler.get_string_from_datetime(datetime.now(timezone.utc)),
         )
-        self.asset_table_manager.insert_assets(listAlpAssets)
+        print(f"{len(list_changes)} asset change(s) recorded.")
+        return list_changes
 
     def update_all_dbs(self):
         print("Updating Assets Database...")
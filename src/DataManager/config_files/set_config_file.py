@@ -86,6 +86,7 @@ def delete_temp_files():
     threadDirPath = os.path.dirname(inspect.getfile(threadDir))
     rootDirPath = os.path.dirname(inspect.getfile(DataManager))
     files.extend(_get_files_with_ext(tempDirPath, ".db"))
+    files.extend(_get_files_with_ext(tempDirPath, ".npy"))
     files.extend(_get_files_with_ext(threadDirPath, ".db"))
     files.extend(_get_files_with_ext(rootDirPath, ".DS_Store"))
 
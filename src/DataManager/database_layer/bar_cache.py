@@ -0,0 +1,132 @@
+from collections import OrderedDict
+import threading
+from typing import Dict, Optional, Set, Tuple
+import numpy as np
+
+CacheKey = Tuple[str, str, int, int]
+
+
+class BarCache:
+    """
+    In-process LRU cache of stored bars, keyed by (symbol, timeframe,
+    start_epoch, end_epoch) and bounded by the total bytes of the cached arrays.
+
+    A lookup is served by any cached range containing the requested one, the
+    narrower window is sliced out of it with searchsorted. Writes must call
+    `invalidate` for the written symbols.
+
+    Example:
+    cache = BarCache(max_bytes=256 * 2**20)
+    bars = cache.get("AAPL", "1D", start_epoch, end_epoch)
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.n_bytes = 0
+        self._entries: "OrderedDict[CacheKey, np.ndarray]" = OrderedDict()
+        self._keys_of_symbol: Dict[Tuple[str, str], Set[CacheKey]] = {}
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def version(self, stock_symbol: str, timeframe: str) -> int:
+        """Read before querying storage and passed to `put`, see `invalidate`."""
+        return self._versions.get((stock_symbol, timeframe), 0)
+
+    def get(
+        self, stock_symbol: str, timeframe: str, start_epoch: int, end_epoch: int
+    ) -> Optional[np.ndarray]:
+        with self._lock:
+            key: Optional[CacheKey] = (stock_symbol, timeframe, start_epoch, end_epoch)
+            if key not in self._entries:
+                key = next(
+                    (
+                        other
+                        for other in self._keys_of_symbol.get(
+                            (stock_symbol, timeframe), ()
+                        )
+                        if other[2] <= start_epoch and end_epoch <= other[3]
+                    ),
+                    None,
+                )
+            if key is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            bars = self._entries[key]
+
+        if (key[2], key[3]) == (start_epoch, end_epoch):
+            return bars
+        epochs = bars["Epoch"]
+        return bars[
+            np.searchsorted(epochs, start_epoch, side="left") : np.searchsorted(
+                epochs, end_epoch, side="right"
+            )
+        ]
+
+    def put(
+        self,
+        stock_symbol: str,
+        timeframe: str,
+        start_epoch: int,
+        end_epoch: int,
+        bars: np.ndarray,
+        version: int,
+    ):
+        """
+        Caches the bars stored between start_epoch and end_epoch. Skipped if
+        the symbol was invalidated since `version` was read, the bars may be stale.
+        Views of a memory map are cached as copies.
+        """
+        if bars.nbytes > self.max_bytes:
+            return
+        if isinstance(bars, np.memmap):
+            # A cached view would keep the map and its file descriptor open
+            bars = np.array(bars)
+        key = (stock_symbol, timeframe, start_epoch, end_epoch)
+        with self._lock:
+            if self.version(stock_symbol, timeframe) != version:
+                return
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = bars
+            self._keys_of_symbol.setdefault((stock_symbol, timeframe), set()).add(key)
+            self.n_bytes += bars.nbytes
+
+            while self.n_bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, stock_symbol: str, timeframe: str):
+        with self._lock:
+            self._versions[(stock_symbol, timeframe)] = (
+                self.version(stock_symbol, timeframe) + 1
+            )
+            for key in list(self._keys_of_symbol.get((stock_symbol, timeframe), ())):
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._pop(key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.n_bytes,
+        }
+
+    def _pop(self, key: CacheKey):
+        bars = self._entries.pop(key)
+        self.n_bytes -= bars.nbytes
+        keys = self._keys_of_symbol[key[:2]]
+        keys.discard(key)
+        if not keys:
+            del self._keys_of_symbol[key[:2]]
@@ -1,4 +1,6 @@
+from contextlib import contextmanager
 import sqlite3
+import threading
 import numpy as np
 from DataManager.utils.timehandler import TimeHandler
 
@@ -6,23 +8,48 @@ from DataManager.utils.timehandler import TimeHandler
 class DatabaseManager:
     def __init__(self, database_path):
         self.connection = sqlite3.connect(database_path, check_same_thread=False)
+        # The connection is shared by threads, a transaction holds it to the end
+        self._lock = threading.RLock()
+        self._in_transaction = False
 
     def __del__(self):
         self.connection.close()
 
     def _execute(self, statement, values=None, many=False):
-        with self.connection:
-            cursor = self.connection.cursor()
-            if many:
-                cursor.executemany(statement, values or [])
-            else:
-                cursor.execute(statement, values or [])
-            return cursor
-
-    def create_table(self, table_name, columns):
+        with self._lock:
+            if self._in_transaction:
+                # Committed or rolled back as a whole by `transaction`
+                return self._execute_statement(statement, values, many)
+            with self.connection:
+                return self._execute_statement(statement, values, many)
+
+    def _execute_statement(self, statement, values=None, many=False):
+        cursor = self.connection.cursor()
+        if many:
+            cursor.executemany(statement, values or [])
+        else:
+            cursor.execute(statement, values or [])
+        return cursor
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the statements of the block in one transaction, rolled back on
+        error. Statements of other threads wait until it ends.
+        """
+        with self._lock:
+            self._in_transaction = True
+            try:
+                with self.connection:
+                    yield self
+            finally:
+                self._in_transaction = False
+
+    def create_table(self, table_name, columns, constraints=None):
         columns_with_types = [
             f"{column_name} {data_type}" for column_name, data_type in columns.items()
         ]
+        columns_with_types.extend(constraints or [])
         self._execute(
             f"""
             CREATE TABLE IF NOT EXISTS "{table_name}"
@@ -30,6 +57,14 @@ class DatabaseManager:
             """
         )
 
+    def create_index(self, table_name, index_name, columns):
+        self._execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS "{index_name}"
+            ON "{table_name}" ({', '.join(columns)});
+            """
+        )
+
     def drop_table(self, table_name):
         self._execute(f'DROP TABLE "{table_name}";')
 
@@ -76,6 +111,28 @@ class DatabaseManager:
             many=True,
         )
 
+    def upsert_many(self, table_name, data, key_columns):
+        """Inserts the rows, updating only the given columns of the rows whose key exists."""
+        column_names = list(data[0].keys())
+        placeholders = ", ".join("?" * len(column_names))
+        update_columns = ", ".join(
+            f"{column} = excluded.{column}"
+            for column in column_names
+            if column not in key_columns
+        )
+        values = [tuple(d.values()) for d in data]
+
+        self._execute(
+            f"""
+            INSERT INTO "{table_name}"
+            ({', '.join(column_names)})
+            VALUES ({placeholders})
+            ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {update_columns};
+            """,
+            values,
+            many=True,
+        )
+
     def delete(self, table_name, criteria):
         placeholders = [f"{column} = ?" for column in criteria.keys()]
         delete_criteria = " AND ".join(placeholders)
@@ -87,10 +144,10 @@ class DatabaseManager:
             tuple(criteria.values()),
         )
 
-    def select(self, table_name, criteria=None, order_by=None):
+    def select(self, table_name, criteria=None, order_by=None, columns=None):
         criteria = criteria or {}
 
-        query = f'SELECT * FROM "{table_name}"'
+        query = f'SELECT {", ".join(columns) if columns else "*"} FROM "{table_name}"'
 
         if criteria:
             placeholders = [f"{column} = ?" for column in criteria.keys()]
@@ -105,6 +162,15 @@ class DatabaseManager:
             tuple(criteria.values()),
         )
 
+    def select_from_value(self, table_name, column, value, order_by=None):
+        """Rows whose `column` is at least `value`."""
+        query = f'SELECT * FROM "{table_name}" WHERE {column} >= ?'
+
+        if order_by:
+            query += f" ORDER BY {order_by}"
+
+        return self._execute(query + ";", (value,))
+
     def select_between_range(self, table_name, criteria=None, order_by=None):
         criteria = criteria or {}
 
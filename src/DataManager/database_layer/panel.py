@@ -0,0 +1,100 @@
+from typing import Dict, List, NamedTuple, Optional
+import numpy as np
+import pandas as pd
+
+
+class StockPanel(NamedTuple):
+    """
+    Bars of many symbols aligned on one trading calendar.
+
+    `values` is a C-contiguous array of shape (len(symbols), len(dates),
+    len(fields)); sessions without a stored bar are NaN.
+
+    Example:
+    panel = data.get_stock_panel(start_timestamp, end_timestamp)
+    closes = panel.get_field("close")  # (symbols, dates) view
+    """
+
+    values: np.ndarray
+    symbols: List[str]
+    dates: pd.DatetimeIndex
+    fields: List[str]
+
+    def get_field(self, field: str) -> np.ndarray:
+        return self.values[:, :, self.fields.index(field)]
+
+    def get_symbol(self, symbol: str) -> np.ndarray:
+        return self.values[self.symbols.index(symbol), :, :]
+
+    def to_frame(self) -> pd.DataFrame:
+        """DataFrame indexed by date with (symbol, field) MultiIndex columns."""
+        n_symbols, n_dates, n_fields = self.values.shape
+        return pd.DataFrame(
+            self.values.transpose(1, 0, 2).reshape(n_dates, n_symbols * n_fields),
+            index=self.dates,
+            columns=pd.MultiIndex.from_product(
+                [self.symbols, self.fields], names=["symbol", "field"]
+            ),
+        )
+
+
+class AlignedStockData(NamedTuple):
+    """
+    Bars of many symbols reindexed onto one trading calendar, no symbol is
+    dropped for missing sessions.
+
+    `frames` maps every symbol to a DataFrame with one row per date, rows of
+    sessions without a stored bar are NaN. `mask` is a boolean array of shape
+    (len(symbols), len(dates)), True where the symbol has a bar.
+
+    Example:
+    aligned = data.get_aligned_stock_data(start_timestamp, end_timestamp)
+    aligned.get_coverage()  # n_bars, n_missing, coverage, max_gap per symbol
+    dict_of_dfs = aligned.select(min_coverage=0.95)
+    """
+
+    frames: Dict[str, pd.DataFrame]
+    mask: np.ndarray
+    symbols: List[str]
+    dates: pd.DatetimeIndex
+
+    def get_coverage(self) -> pd.DataFrame:
+        """
+        Per-symbol bars on the grid, missing sessions, covered fraction and
+        longest run of consecutive missing sessions.
+        """
+        n_symbols, n_dates = self.mask.shape
+        n_bars = self.mask.sum(axis=1)
+
+        # Gaps between consecutive bars of every row, the padding bars at
+        # both ends count the leading and trailing missing sessions
+        padded = np.ones((n_symbols, n_dates + 2), dtype=bool)
+        padded[:, 1:-1] = self.mask
+        rows, positions = np.nonzero(padded)
+        gaps = np.diff(positions) - 1
+        gaps[rows[1:] != rows[:-1]] = 0
+        max_gap = (
+            np.maximum.reduceat(gaps, np.searchsorted(rows, np.arange(n_symbols)))
+            if n_symbols
+            else np.zeros(0, dtype=np.int64)
+        )
+
+        return pd.DataFrame(
+            {
+                "n_bars": n_bars,
+                "n_missing": n_dates - n_bars,
+                "coverage": n_bars / n_dates if n_dates else np.ones(n_symbols),
+                "max_gap": max_gap,
+            },
+            index=pd.Index(self.symbols, name="symbol"),
+        )
+
+    def select(
+        self, min_coverage: float = 1.0, max_gap: Optional[int] = None
+    ) -> Dict[str, pd.DataFrame]:
+        """Frames of the symbols covering at least `min_coverage` of the dates."""
+        coverage = self.get_coverage()
+        keep = coverage["coverage"] >= min_coverage
+        if max_gap is not None:
+            keep &= coverage["max_gap"] <= max_gap
+        return {symbol: self.frames[symbol] for symbol in coverage.index[keep]}
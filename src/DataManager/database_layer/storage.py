@@ -0,0 +1,486 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import os
+import threading
+from typing import Dict, List, Optional, Set, Tuple, Union
+import numpy as np
+
+from DataManager.utils.timeframes import Timeframes
+
+MARKETSTORE_ENDPOINT = "http://alpaca-marketstore:5993/rpc"
+STORAGE_BACKENDS = ("marketstore", "parquet", "memmap")
+BAR_DTYPE = np.dtype(
+    [
+        ("Epoch", np.int64),
+        ("open", np.float64),
+        ("high", np.float64),
+        ("low", np.float64),
+        ("close", np.float64),
+        ("volume", np.int64),
+        ("trade_count", np.int64),
+        ("vmap", np.float64),
+    ]
+)
+BAR_FIELDS: Tuple[str, ...] = BAR_DTYPE.names or ()
+
+
+def to_bar_array(data: np.ndarray) -> np.ndarray:
+    """Copies the BAR_DTYPE fields of a structured array, sorted by Epoch."""
+    bars = np.empty(len(data), dtype=BAR_DTYPE)
+    for name in BAR_FIELDS:
+        bars[name] = data[name]
+    return bars[np.argsort(bars["Epoch"], kind="stable")]
+
+
+class StorageBackend(ABC):
+    """
+    Stores the bars of every (symbol, timeframe).
+
+    Bars are passed around as structured NumPy arrays with an int64 `Epoch`
+    column (unix seconds) and one column per field. Writing bars that are
+    already stored for the same epochs replaces them.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def list_symbols(self, timeframe: str) -> Set[str]:
+        """Symbols with bars stored for `timeframe`."""
+
+    @abstractmethod
+    def write(self, stock_symbol: str, timeframe: str, data: np.ndarray):
+        """Stores `data`, raises if the write failed."""
+
+    def write_many(
+        self, timeframe: str, dict_data: Dict[str, np.ndarray]
+    ) -> Dict[str, str]:
+        """
+        Stores the bars of several symbols, {symbol: data}. A failed symbol
+        does not stop the others, returns {symbol: error} of the failed ones.
+        """
+        dict_failures = {}
+        for stock_symbol, data in dict_data.items():
+            try:
+                self.write(stock_symbol, timeframe, data)
+            except Exception as e:
+                dict_failures[stock_symbol] = str(e)
+        return dict_failures
+
+    @abstractmethod
+    def read_epochs(self, stock_symbol: str, timeframe: str) -> np.ndarray:
+        """Epochs of every stored bar of the symbol."""
+
+    @abstractmethod
+    def query(
+        self,
+        list_symbols: List[str],
+        timeframe: str,
+        start_epoch: int,
+        end_epoch: int,
+        columns: Optional[List[str]] = None,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Bars between start_epoch and end_epoch (inclusive) of every symbol that
+        has some in the range, restricted to `columns` (all if None).
+        """
+
+
+class MarketstoreBackend(StorageBackend):
+    """
+    Bars kept in a marketstore server under `{symbol}/{timeframe}/OHLCV`.
+    """
+
+    name = "marketstore"
+
+    def __init__(self, endpoint: str = MARKETSTORE_ENDPOINT):
+        import pymarketstore as pymkts
+
+        self._pymkts = pymkts
+        self.pym_cli = pymkts.Client(endpoint=endpoint)
+
+    def list_symbols(self, timeframe: str) -> Set[str]:
+        suffix = f"/{timeframe}/OHLCV"
+        return set(
+            tbk[: -len(suffix)]
+            for tbk in self.pym_cli.list_symbols(
+                fmt=self._pymkts.params.ListSymbolsFormat.TBK
+            )
+            if tbk.endswith(suffix)
+        )
+
+    def _write_request(self, timeframe: str, dict_data: Dict[str, np.ndarray]):
+        """
+        Writes all symbols with a single DataService.Write request: one
+        dataset holding the concatenated bars, sliced per TBK. Returns the
+        server errors, None on success.
+        """
+        bars = np.concatenate([to_bar_array(data) for data in dict_data.values()])
+        start_index, lengths, offset = {}, {}, 0
+        for stock_symbol, data in dict_data.items():
+            tbk = f"{stock_symbol}/{timeframe}/OHLCV"
+            start_index[tbk], lengths[tbk] = offset, len(data)
+            offset += len(data)
+
+        dataset = {
+            "types": [
+                bars.dtype[name].str.replace("<", "").replace("|", "")
+                for name in BAR_FIELDS
+            ],
+            "names": BAR_FIELDS,
+            "data": [bars[name].tobytes() for name in BAR_FIELDS],
+            "length": len(bars),
+            "startindex": start_index,
+            "lengths": lengths,
+        }
+        response = self.pym_cli.client.rpc.call(
+            "DataService.Write",
+            requests=[{"dataset": dataset, "is_variable_length": True}],
+        )
+        if response is None:
+            return "No response from marketstore."
+        return response["responses"]
+
+    def write(self, stock_symbol: str, timeframe: str, data: np.ndarray):
+        errors = self._write_request(timeframe, {stock_symbol: data})
+        assert errors is None, f"Error in updating data in database: {errors}"
+
+    def write_many(
+        self, timeframe: str, dict_data: Dict[str, np.ndarray]
+    ) -> Dict[str, str]:
+        dict_data = {symbol: data for symbol, data in dict_data.items() if len(data)}
+        if not dict_data:
+            return {}
+        try:
+            errors = self._write_request(timeframe, dict_data)
+        except Exception as e:
+            errors = str(e)
+        if errors is None:
+            return {}
+        if len(dict_data) == 1:
+            return {stock_symbol: str(errors) for stock_symbol in dict_data}
+
+        # marketstore does not say which symbol failed, retried one by one
+        return super().write_many(timeframe, dict_data)
+
+    def read_epochs(self, stock_symbol: str, timeframe: str) -> np.ndarray:
+        return np.asarray(
+            self.pym_cli.sql([f"SELECT Epoch FROM `{stock_symbol}/{timeframe}/OHLCV`;"])
+            .first()
+            .array["Epoch"]
+        )
+
+    def query(
+        self,
+        list_symbols: List[str],
+        timeframe: str,
+        start_epoch: int,
+        end_epoch: int,
+        columns: Optional[List[str]] = None,
+    ) -> Dict[str, np.ndarray]:
+        this_params = self._pymkts.Params(
+            list_symbols,
+            timeframe,
+            "OHLCV",
+            int(start_epoch),
+            int(end_epoch),
+            columns=columns,
+        )
+        return {
+            symbol: dataset.array
+            for symbol, dataset in self.pym_cli.query(this_params).by_symbols().items()
+        }
+
+
+class ParquetBackend(StorageBackend):
+    """
+    Bars kept locally as Parquet files partitioned by timeframe, symbol and
+    year: `{root_dir}/{timeframe}/{symbol}/{year}.parquet`. Intraday bars are
+    partitioned by month (`{year}-{month}.parquet`) so appends rewrite less.
+
+    Range reads only open the partitions overlapping the range and push the
+    Epoch bounds down to the row groups. Needs pyarrow (`pip install DataManager[parquet]`).
+    """
+
+    name = "parquet"
+    ROW_GROUP_SIZE = 4096
+
+    def __init__(self, root_dir: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError(
+                "The parquet storage backend needs pyarrow, install it with "
+                "`pip install DataManager[parquet]`"
+            ) from e
+
+        self._pa, self._pq = pa, pq
+        self.root_dir = root_dir
+        self._write_lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _symbol_dir(self, stock_symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root_dir, timeframe, stock_symbol)
+
+    def _list_partitions(self, stock_symbol: str, timeframe: str) -> List[str]:
+        symbol_dir = self._symbol_dir(stock_symbol, timeframe)
+        if not os.path.isdir(symbol_dir):
+            return []
+        return sorted(
+            file_name[: -len(".parquet")]
+            for file_name in os.listdir(symbol_dir)
+            if file_name.endswith(".parquet")
+        )
+
+    @staticmethod
+    def _partitions_of(epochs: np.ndarray, timeframe: str) -> np.ndarray:
+        """Partition name ("2021" or "2021-06") of every epoch, they sort in time order."""
+        unit = "M" if Timeframes.is_intraday(timeframe) else "Y"
+        return epochs.astype("datetime64[s]").astype(f"datetime64[{unit}]").astype(str)
+
+    def _table_to_array(self, table) -> np.ndarray:
+        columns = {name: table.column(name).to_numpy() for name in table.column_names}
+        array = np.empty(
+            table.num_rows, dtype=[(name, col.dtype) for name, col in columns.items()]
+        )
+        for name, col in columns.items():
+            array[name] = col
+        return array
+
+    def _read_file(self, path: str, columns=None, filters=None):
+        return self._pq.read_table(path, columns=columns, filters=filters)
+
+    def list_symbols(self, timeframe: str) -> Set[str]:
+        timeframe_dir = os.path.join(self.root_dir, timeframe)
+        if not os.path.isdir(timeframe_dir):
+            return set()
+        return set(
+            stock_symbol
+            for stock_symbol in os.listdir(timeframe_dir)
+            if self._list_partitions(stock_symbol, timeframe)
+        )
+
+    def write(self, stock_symbol: str, timeframe: str, data: np.ndarray):
+        if len(data) == 0:
+            return
+        symbol_dir = self._symbol_dir(stock_symbol, timeframe)
+        os.makedirs(symbol_dir, exist_ok=True)
+        partitions = self._partitions_of(data["Epoch"], timeframe)
+
+        with self._write_lock:
+            for partition in np.unique(partitions):
+                block = data[partitions == partition]
+                path = os.path.join(symbol_dir, f"{partition}.parquet")
+                columns = {name: block[name] for name in block.dtype.names}
+                if os.path.exists(path):
+                    # Stored bars at the written epochs are replaced
+                    stored = self._table_to_array(self._read_file(path))
+                    keep = ~np.isin(stored["Epoch"], block["Epoch"])
+                    columns = {
+                        name: np.concatenate((stored[name][keep], col))
+                        for name, col in columns.items()
+                    }
+                order = np.argsort(columns["Epoch"], kind="stable")
+                table = self._pa.table(
+                    {name: col[order] for name, col in columns.items()}
+                )
+                tmp_path = f"{path}.tmp"
+                self._pq.write_table(
+                    table, tmp_path, row_group_size=self.ROW_GROUP_SIZE
+                )
+                os.replace(tmp_path, path)
+
+    def read_epochs(self, stock_symbol: str, timeframe: str) -> np.ndarray:
+        symbol_dir = self._symbol_dir(stock_symbol, timeframe)
+        list_epochs = [
+            self._read_file(
+                os.path.join(symbol_dir, f"{partition}.parquet"), columns=["Epoch"]
+            )
+            .column("Epoch")
+            .to_numpy()
+            for partition in self._list_partitions(stock_symbol, timeframe)
+        ]
+        return (
+            np.concatenate(list_epochs) if list_epochs else np.array([], dtype=np.int64)
+        )
+
+    def query(
+        self,
+        list_symbols: List[str],
+        timeframe: str,
+        start_epoch: int,
+        end_epoch: int,
+        columns: Optional[List[str]] = None,
+    ) -> Dict[str, np.ndarray]:
+        if columns is not None and "Epoch" not in columns:
+            columns = ["Epoch"] + list(columns)
+        first_partition, last_partition = self._partitions_of(
+            np.array([start_epoch, end_epoch], dtype=np.int64), timeframe
+        )
+        filters = [("Epoch", ">=", int(start_epoch)), ("Epoch", "<=", int(end_epoch))]
+
+        dict_arrays: Dict[str, np.ndarray] = {}
+        for stock_symbol in list_symbols:
+            symbol_dir = self._symbol_dir(stock_symbol, timeframe)
+            tables = [
+                self._read_file(
+                    os.path.join(symbol_dir, f"{partition}.parquet"), columns, filters
+                )
+                for partition in self._list_partitions(stock_symbol, timeframe)
+                if first_partition <= partition <= last_partition
+            ]
+            tables = [table for table in tables if table.num_rows]
+            if tables:
+                dict_arrays[stock_symbol] = self._table_to_array(
+                    self._pa.concat_tables(tables)
+                )
+        return dict_arrays
+
+
+class MemmapBackend(StorageBackend):
+    """
+    Bars kept locally as one raw file of fixed-width BAR_DTYPE records per
+    symbol, sorted by Epoch: `{root_dir}/{timeframe}/{symbol}.bars`.
+
+    Files are opened with np.memmap, a range read is two searchsorted calls
+    on the Epoch column and returns a view of the records in range, nothing
+    is parsed or copied. Bars written after the last stored one are appended
+    to the tail, other writes rewrite the file. A tail left torn by an
+    interrupted append is ignored by reads and cut by the next write.
+
+    Every map holds a file descriptor, so only the MAX_OPEN_MAPS most
+    recently read files are kept mapped. An evicted map is released once the
+    views returned from it are dropped, callers reading many symbols should
+    hold on to the results of a bounded batch at a time.
+    """
+
+    name = "memmap"
+    FILE_SUFFIX = ".bars"
+    MAX_OPEN_MAPS = 128
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        self._write_lock = threading.Lock()
+        self._maps_lock = threading.Lock()
+        self._maps: "OrderedDict[str, np.memmap]" = OrderedDict()
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _path(self, stock_symbol: str, timeframe: str) -> str:
+        return os.path.join(
+            self.root_dir, timeframe, f"{stock_symbol}{self.FILE_SUFFIX}"
+        )
+
+    def _open(self, path: str) -> np.ndarray:
+        with self._maps_lock:
+            bars = self._maps.get(path)
+            if bars is not None:
+                self._maps.move_to_end(path)
+                return bars
+        n_bars = self._n_bars(path)
+        if n_bars == 0:
+            return np.empty(0, dtype=BAR_DTYPE)
+        bars = np.memmap(path, dtype=BAR_DTYPE, mode="r", shape=(n_bars,))
+        with self._maps_lock:
+            self._maps[path] = bars
+            while len(self._maps) > self.MAX_OPEN_MAPS:
+                self._maps.popitem(last=False)
+        return bars
+
+    @staticmethod
+    def _n_bars(path: str) -> int:
+        """Whole records in the file, a torn tail is left out."""
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // BAR_DTYPE.itemsize
+
+    def _close(self, path: str):
+        with self._maps_lock:
+            self._maps.pop(path, None)
+
+    def list_symbols(self, timeframe: str) -> Set[str]:
+        timeframe_dir = os.path.join(self.root_dir, timeframe)
+        if not os.path.isdir(timeframe_dir):
+            return set()
+        return set(
+            file_name[: -len(self.FILE_SUFFIX)]
+            for file_name in os.listdir(timeframe_dir)
+            if file_name.endswith(self.FILE_SUFFIX)
+        )
+
+    def write(self, stock_symbol: str, timeframe: str, data: np.ndarray):
+        if len(data) == 0:
+            return
+        bars = to_bar_array(data)
+        path = self._path(stock_symbol, timeframe)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self._write_lock:
+            stored = self._open(path)
+            # Later reads remap the file
+            self._close(path)
+            if len(stored) == 0 or bars["Epoch"][0] > stored["Epoch"][-1]:
+                with open(path, "ab") as f:
+                    # Cut the torn tail of an interrupted append first
+                    f.truncate(len(stored) * BAR_DTYPE.itemsize)
+                    f.write(bars.tobytes())
+                return
+
+            # Stored bars at the written epochs are replaced
+            keep = ~np.isin(stored["Epoch"], bars["Epoch"])
+            merged = np.concatenate((stored[keep], bars))
+            merged = merged[np.argsort(merged["Epoch"], kind="stable")]
+            tmp_path = f"{path}.tmp"
+            merged.tofile(tmp_path)
+            os.replace(tmp_path, path)
+
+    def read_epochs(self, stock_symbol: str, timeframe: str) -> np.ndarray:
+        return np.array(self._open(self._path(stock_symbol, timeframe))["Epoch"])
+
+    def query(
+        self,
+        list_symbols: List[str],
+        timeframe: str,
+        start_epoch: int,
+        end_epoch: int,
+        columns: Optional[List[str]] = None,
+    ) -> Dict[str, np.ndarray]:
+        if columns is not None and "Epoch" not in columns:
+            columns = ["Epoch"] + list(columns)
+
+        dict_arrays: Dict[str, np.ndarray] = {}
+        for stock_symbol in list_symbols:
+            bars = self._open(self._path(stock_symbol, timeframe))
+            epochs = bars["Epoch"]
+            first = np.searchsorted(epochs, start_epoch, side="left")
+            last = np.searchsorted(epochs, end_epoch, side="right")
+            if first < last:
+                bars = bars[first:last]
+                dict_arrays[stock_symbol] = bars if columns is None else bars[columns]
+        return dict_arrays
+
+
+def create_storage_backend(
+    storage: Union[str, StorageBackend], storage_path: Optional[str] = None
+) -> StorageBackend:
+    """
+    Inputs:
+        - `storage`: a StorageBackend, or the name of one in STORAGE_BACKENDS
+        - `storage_path`: marketstore endpoint, or root directory of the local backends
+    """
+    if isinstance(storage, StorageBackend):
+        return storage
+    if storage == "marketstore":
+        return MarketstoreBackend(storage_path or MARKETSTORE_ENDPOINT)
+    if storage == "parquet":
+        if storage_path is None:
+            from DataManager.core import DATAMGR_ABS_PATH
+
+            storage_path = os.path.join(DATAMGR_ABS_PATH, "tempDir", "ParquetStore")
+        return ParquetBackend(storage_path)
+    if storage == "memmap":
+        if storage_path is None:
+            from DataManager.core import DATAMGR_ABS_PATH
+
+            storage_path = os.path.join(DATAMGR_ABS_PATH, "tempDir", "MemmapStore")
+        return MemmapBackend(storage_path)
+    raise ValueError(f"Invalid storage backend. Should be one of {STORAGE_BACKENDS}.")
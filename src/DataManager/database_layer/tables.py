@@ -1,15 +1,31 @@
-from datetime import timedelta
-from typing import Dict, List, Tuple
+import asyncio
+from datetime import datetime, timedelta, timezone
+import functools
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 import warnings
 import numpy as np
 import pandas as pd
-import pymarketstore as pymkts
 from pandas import DataFrame
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
+from DataManager.core import DATAMGR_ABS_PATH
+from DataManager.database_layer.bar_cache import BarCache
 from DataManager.database_layer.database import DatabaseManager
+from DataManager.database_layer.panel import AlignedStockData, StockPanel
+from DataManager.database_layer.storage import (
+    BAR_DTYPE,
+    BAR_FIELDS,
+    StorageBackend,
+    create_storage_backend,
+)
 from DataManager.utils.conversions import Conversions
+from DataManager.utils.intervals import Interval, Intervals
+from DataManager.utils.resampler import Resampler
+from DataManager.utils.timeframes import Timeframes
 from DataManager.utils.timehandler import TimeHandler
+from DataManager.utils.trading_calendar import TradingCalendar
 
 
 class TableManager:
@@ -24,8 +40,8 @@ class TableManager:
     def list_tables(self):
         return [e for (e,) in self.db.list_tables().fetchall()]
 
-    def create_asset_table(self, table_name, columns):
-        self.db.create_table(f"{table_name}", columns)
+    def create_asset_table(self, table_name, columns, constraints=None):
+        self.db.create_table(f"{table_name}", columns, constraints)
 
     def drop_all_tables(self, exclude: List[str] = []):
         tables = self.list_tables()
@@ -56,8 +72,13 @@ class TableManager:
 
 
 class AssetTableManager(TableManager):
+    # Symbol lists per criteria, shared by the managers of one DB file and
+    # cleared whenever this process writes to its Assets table
+    _universe_cache: Dict[str, Dict[Tuple[Any, ...], List[str]]] = {}
+
     def __init__(self, db_name):
         super().__init__(db_name)
+        self.db_name = db_name
         self.table_name = "Assets"
         self.columns = {
             "stockSymbol": "text not null primary key",
@@ -72,6 +93,158 @@ class AssetTableManager(TableManager):
             "isSuspended": "integer",
         }
         self.create_asset_table(self.table_name, self.columns)
+        # Cover the basket criteria, the status flags alone and with an exchange or index
+        for index_name, index_columns in {
+            "Assets_status": ("isDelisted", "isSuspended"),
+            "Assets_exchange": ("exchangeName", "isDelisted", "isSuspended"),
+            "Assets_index": ("index_name", "isDelisted", "isSuspended"),
+        }.items():
+            self.db.create_index(self.table_name, index_name, index_columns)
+
+        self.changes_table_name = "AssetChanges"
+        self.changes_columns = {
+            "stockSymbol": "text not null",
+            "changeType": "text not null",
+            "dateChanged": "text not null",
+        }
+        self.create_asset_table(
+            self.changes_table_name,
+            self.changes_columns,
+            ["primary key (dateChanged, stockSymbol, changeType)"],
+        )
+
+    def insert_assets(self, asset_data):
+        try:
+            super().insert_assets(asset_data)
+        finally:
+            self.invalidate_universe_cache()
+
+    def update_asset(self, asset_data):
+        try:
+            super().update_asset(asset_data)
+        finally:
+            self.invalidate_universe_cache()
+
+    def invalidate_universe_cache(self):
+        self._universe_cache.pop(self.db_name, None)
+
+    def refresh_assets(
+        self, asset_data: List[Dict[str, Any]], date_last_updated: str
+    ) -> List[Dict[str, str]]:
+        """
+        Upserts the assets whose fields differ from the stored row, in one
+        transaction, and records what changed in `AssetChanges`. Unchanged
+        rows keep their dateLastUpdated, columns missing from `asset_data`
+        are left as stored. `asset_data` is the whole listing, stored assets
+        missing from it are marked delisted.
+
+        Change types: `listed` (new active asset), `delisted`, `relisted`,
+        `suspended`, `unsuspended` and `updated` (any other field).
+        Returns the recorded changes.
+        """
+        if not asset_data:
+            return []
+        fields = [
+            column
+            for column in asset_data[0]
+            if column not in ("stockSymbol", "dateLastUpdated")
+        ]
+        dict_stored = {
+            row[0]: row[1:]
+            for row in self.db.select(
+                self.table_name, columns=["stockSymbol"] + fields
+            ).fetchall()
+        }
+
+        dict_assets = {asset["stockSymbol"]: asset for asset in asset_data}
+        list_vanished = [
+            stock_symbol
+            for (stock_symbol,) in self.db.select(
+                self.table_name, {"isDelisted": False}, columns=["stockSymbol"]
+            ).fetchall()
+            if stock_symbol not in dict_assets
+        ]
+
+        list_changed: List[Dict[str, Any]] = []
+        list_changes: List[Dict[str, str]] = [
+            {
+                "stockSymbol": stock_symbol,
+                "changeType": "delisted",
+                "dateChanged": date_last_updated,
+            }
+            for stock_symbol in list_vanished
+        ]
+        for asset in dict_assets.values():
+            # Booleans are stored as integers, compare them the same way
+            values = tuple(
+                int(value) if isinstance(value, bool) else value
+                for value in (asset[field] for field in fields)
+            )
+            stored = dict_stored.get(asset["stockSymbol"])
+            if stored == values:
+                continue
+            list_changed.append({**asset, "dateLastUpdated": date_last_updated})
+            list_changes.extend(
+                {
+                    "stockSymbol": asset["stockSymbol"],
+                    "changeType": change_type,
+                    "dateChanged": date_last_updated,
+                }
+                for change_type in self._change_types(
+                    dict(zip(fields, stored)) if stored is not None else None,
+                    dict(zip(fields, values)),
+                )
+            )
+
+        if list_changes or list_changed:
+            with self.db.transaction():
+                if list_changed:
+                    self.db.upsert_many(self.table_name, list_changed, ["stockSymbol"])
+                for stock_symbol in list_vanished:
+                    self.db.update(
+                        self.table_name,
+                        {"stockSymbol": stock_symbol},
+                        {"isDelisted": True, "dateLastUpdated": date_last_updated},
+                    )
+                if list_changes:
+                    self.db.add_many(self.changes_table_name, list_changes)
+            self.invalidate_universe_cache()
+        return list_changes
+
+    @staticmethod
+    def _change_types(
+        stored: Optional[Dict[str, Any]], values: Dict[str, Any]
+    ) -> List[str]:
+        if stored is None:
+            return [] if values.get("isDelisted") else ["listed"]
+        list_types = []
+        for column, set_type, unset_type in (
+            ("isDelisted", "delisted", "relisted"),
+            ("isSuspended", "suspended", "unsuspended"),
+        ):
+            if column in values and bool(stored[column]) != bool(values[column]):
+                list_types.append(set_type if values[column] else unset_type)
+        if any(
+            stored[column] != value
+            for column, value in values.items()
+            if column not in ("isDelisted", "isSuspended")
+        ):
+            list_types.append("updated")
+        return list_types
+
+    def get_asset_changes(self, since: Optional[str] = None) -> List[Dict[str, str]]:
+        """Recorded asset changes, oldest first, from `since` ("%Y-%m-%d %H:%M:%S") if set."""
+        if since is None:
+            cursor = self.db.select(self.changes_table_name, order_by="dateChanged")
+        else:
+            # dateChanged leads the primary key, the range is read from its index
+            cursor = self.db.select_from_value(
+                self.changes_table_name, "dateChanged", since, order_by="dateChanged"
+            )
+        list_changes: List[Dict[str, str]] = Conversions.tuples_to_dict(
+            cursor.fetchall(), self.changes_columns
+        )
+        return list_changes
 
     def get_exchange_basket(self, exchangeName, isDelisted=False, isSuspended=False):
         list_of_assets = self.db.select(
@@ -96,46 +269,286 @@ class AssetTableManager(TableManager):
         return Conversions.tuples_to_dict(list_of_assets, self.columns)
 
     def get_all_tradable_symbols(self, isDelisted=False, isSuspended=False):
-        list_of_assets = self.db.select(
-            self.table_name, {"isDelisted": isDelisted, "isSuspended": isSuspended}
-        ).fetchall()
-        return [
-            asset["stockSymbol"]
-            for asset in Conversions.tuples_to_dict(list_of_assets, self.columns)
-        ]
+        return self.get_symbols_from_criteria(
+            {"isDelisted": isDelisted, "isSuspended": isSuspended}
+        )
 
     def get_symbols_from_criteria(self, criteria):
-        list_of_assets = self.db.select(self.table_name, criteria).fetchall()
-        return [
-            asset["stockSymbol"]
-            for asset in Conversions.tuples_to_dict(list_of_assets, self.columns)
-        ]
+        """
+        Symbols of the assets matching every `{column: value}` of `criteria`.
+        Only stockSymbol is selected, and the result is cached until the
+        Assets table is written through an AssetTableManager.
+        """
+        key = tuple(sorted(criteria.items()))
+        dict_universes = self._universe_cache.setdefault(self.db_name, {})
+        if key not in dict_universes:
+            dict_universes[key] = [
+                stock_symbol
+                for (stock_symbol,) in self.db.select(
+                    self.table_name, criteria, columns=["stockSymbol"]
+                ).fetchall()
+            ]
+        return list(dict_universes[key])
+
+
+CoverageEntry = Tuple[int, int, int, str]
+TIMESTAMP_FORMATS = ("datetime", "epoch", "string")
+PANEL_FIELDS = ("open", "high", "low", "close", "volume", "trade_count", "vmap")
+
+
+class CoverageTableManager(TableManager):
+    """
+    Persistent index of the stored bars for every (symbol, timeframe).
+
+    `DataCoverage` holds a summary per symbol: first and last stored Epoch
+    (unix seconds), the number of stored sessions and the time of the last
+    update. `DataCoverageIntervals` holds the stored data as a set of runs of
+    consecutive trading sessions, so holes inside the stored range are visible.
+    Both tables are kept in memory and every lookup is a dictionary access.
+    """
+
+    def __init__(self, db_name):
+        super().__init__(db_name)
+        self.table_name = "DataCoverage"
+        self.columns = {
+            "stockSymbol": "text not null",
+            "timeframe": "text not null",
+            "dataAvailableFrom": "integer not null",
+            "dataAvailableTo": "integer not null",
+            "rowCount": "integer not null",
+            "dateLastUpdated": "text not null",
+        }
+        self.create_asset_table(
+            self.table_name,
+            self.columns,
+            ["primary key (stockSymbol, timeframe)"],
+        )
+        self.intervals_table_name = "DataCoverageIntervals"
+        self.intervals_columns = {
+            "stockSymbol": "text not null",
+            "timeframe": "text not null",
+            "intervalStart": "integer not null",
+            "intervalEnd": "integer not null",
+        }
+        self.create_asset_table(
+            self.intervals_table_name,
+            self.intervals_columns,
+            ["primary key (stockSymbol, timeframe, intervalStart)"],
+        )
+
+        self._coverage: Dict[Tuple[str, str], CoverageEntry] = {
+            (asset["stockSymbol"], asset["timeframe"]): (
+                asset["dataAvailableFrom"],
+                asset["dataAvailableTo"],
+                asset["rowCount"],
+                asset["dateLastUpdated"],
+            )
+            for asset in self.get_assets_list()
+        }
+        self._intervals: Dict[Tuple[str, str], List[Interval]] = {}
+        for stock_symbol, timeframe, interval_start, interval_end in self.db.select(
+            self.intervals_table_name, order_by="intervalStart"
+        ).fetchall():
+            self._intervals.setdefault((stock_symbol, timeframe), []).append(
+                (interval_start, interval_end)
+            )
+
+    def get_coverage(self, stock_symbol, timeframe) -> Optional[CoverageEntry]:
+        return self._coverage.get((stock_symbol, timeframe))
+
+    def get_many_coverage(
+        self, list_symbols: Iterable[str], timeframe
+    ) -> Dict[str, Optional[CoverageEntry]]:
+        return {
+            symbol: self._coverage.get((symbol, timeframe)) for symbol in list_symbols
+        }
+
+    def get_intervals(self, stock_symbol, timeframe) -> Optional[List[Interval]]:
+        if (stock_symbol, timeframe) not in self._coverage:
+            return None
+        return self._intervals.get((stock_symbol, timeframe), [])
+
+    def set_coverage(
+        self, stock_symbol, timeframe, intervals: List[Interval], row_count
+    ):
+        if not intervals:
+            return
+        date_last_updated = TimeHandler.get_string_from_datetime(
+            datetime.now(timezone.utc)
+        )
+        entry = (
+            int(intervals[0][0]),
+            int(intervals[-1][1]),
+            int(row_count),
+            date_last_updated,
+        )
+        self.insert_assets(
+            [dict(zip(self.columns.keys(), (stock_symbol, timeframe) + entry))]
+        )
+        self.db.delete(
+            self.intervals_table_name,
+            {"stockSymbol": stock_symbol, "timeframe": timeframe},
+        )
+        self.db.add_many(
+            self.intervals_table_name,
+            [
+                dict(
+                    zip(
+                        self.intervals_columns.keys(),
+                        (stock_symbol, timeframe, start, end),
+                    )
+                )
+                for start, end in intervals
+            ],
+        )
+        self._coverage[(stock_symbol, timeframe)] = entry
+        self._intervals[(stock_symbol, timeframe)] = list(intervals)
 
 
 class DailyStockTableManager:
-    def __init__(self, timeframe: str):
-        self.pym_cli = pymkts.Client(endpoint="http://alpaca-marketstore:5993/rpc")
-        self.set_symbols = set(self.pym_cli.list_symbols())
-        self.timeframe = timeframe[:2]
+    # Bytes of bars sent in one storage write, minute bars are ~400x the daily volume
+    MAX_WRITE_BYTES = 64 * 2**20
+
+    def __init__(
+        self,
+        timeframe: str,
+        coverage_db_name: Optional[str] = None,
+        exchange_name="NYSE",
+        storage: Union[str, StorageBackend] = "marketstore",
+        storage_path: Optional[str] = None,
+        cache_bytes: int = 256 * 2**20,
+    ):
+        """
+        Inputs:
+            - `storage`: "marketstore", "parquet", "memmap" or a StorageBackend instance
+            - `storage_path`: marketstore endpoint or local store directory, see create_storage_backend
+            - `coverage_db_name`: defaults to one coverage index per storage backend
+            - `cache_bytes`: size of the in-process read cache, 0 disables it
+        """
+        self.storage = create_storage_backend(storage, storage_path)
+        self.timeframe = Timeframes.storage_key(timeframe)
+        self.bar_seconds = Timeframes.bar_seconds(timeframe)
+        self.set_symbols = self.storage.list_symbols(self.timeframe)
+        self.exchange_name = exchange_name
+        if coverage_db_name is None:
+            coverage_db_name = (
+                "CoverageDB.db"
+                if self.storage.name == "marketstore"
+                else f"CoverageDB_{self.storage.name}.db"
+            )
+        self.coverage_db_name = coverage_db_name
+        self.coverage = CoverageTableManager(
+            os.path.join(DATAMGR_ABS_PATH, os.path.join("tempDir", coverage_db_name))
+        )
+        self.cache = BarCache(cache_bytes) if cache_bytes else None
+        # Managers of the timeframes materialized by get_resampled_stock_data
+        self._derived: Dict[str, "DailyStockTableManager"] = {}
+        # Writes from the async API run one at a time, off the event loop
+        self._write_executor = ThreadPoolExecutor(max_workers=1)
+
+    def _get_sessions(self, start_epoch, end_epoch) -> np.ndarray:
+        return TradingCalendar.get(self.exchange_name).epochs_in_range(
+            np.datetime64(int(start_epoch), "s"), np.datetime64(int(end_epoch), "s")
+        )
+
+    def _extend_coverage(self, stock_symbol, epochs: np.ndarray):
+        """
+        Merges the sessions of a freshly written block into the stored
+        interval set of `stock_symbol`.
+        """
+        if self.bar_seconds:
+            # Intraday coverage is tracked per session (UTC day of the bars)
+            epochs = np.unique(epochs - epochs % 86400)
+        # Bars of a session still open are stored but the session is not
+        # covered yet, the next update fetches it again
+        last_closed_session = TradingCalendar.get(
+            self.exchange_name
+        ).last_completed_session()
+        if last_closed_session is not None:
+            epochs = epochs[epochs <= last_closed_session.value // 10**9]
+        if len(epochs) == 0:
+            return
+        intervals = self.coverage.get_intervals(stock_symbol, self.timeframe) or []
+        first_epoch, last_epoch = int(np.min(epochs)), int(np.max(epochs))
+        if intervals:
+            first_epoch = min(first_epoch, intervals[0][0])
+            last_epoch = max(last_epoch, intervals[-1][1])
+        sessions = self._get_sessions(first_epoch, last_epoch)
+
+        merged = Intervals.merge(
+            intervals + Intervals.from_epochs(epochs, sessions), sessions
+        )
+        self.coverage.set_coverage(
+            stock_symbol,
+            self.timeframe,
+            merged,
+            Intervals.count(merged, sessions),
+        )
+
+    def _build_coverage_from_store(self, stock_symbol) -> Optional[List[Interval]]:
+        # One-off scan for symbols written before the coverage index existed
+        all_epochs = self.storage.read_epochs(stock_symbol, self.timeframe)
+        self._extend_coverage(stock_symbol, all_epochs)
+        return self.coverage.get_intervals(stock_symbol, self.timeframe)
+
+    def _get_stored_intervals(self, stock_symbol) -> List[Interval]:
+        intervals = self.coverage.get_intervals(stock_symbol, self.timeframe)
+        if intervals is None and stock_symbol in self.set_symbols:
+            intervals = self._build_coverage_from_store(stock_symbol)
+        return intervals or []
+
+    def get_last_stored_epoch(self, stock_symbol) -> Optional[int]:
+        """Epoch of the last stored session of the symbol, None if nothing is stored."""
+        intervals = self._get_stored_intervals(stock_symbol)
+        return intervals[-1][1] if intervals else None
+
+    def get_missing_windows(
+        self, stock_symbol, start_timestamp, end_timestamp
+    ) -> List[Tuple[datetime, datetime]]:
+        return self.get_many_missing_windows(
+            [stock_symbol], start_timestamp, end_timestamp
+        )[stock_symbol]
+
+    def get_many_missing_windows(
+        self, list_symbols: Iterable[str], start_timestamp, end_timestamp
+    ) -> Dict[str, List[Tuple[datetime, datetime]]]:
+        """
+        Trading-day windows between start_timestamp and end_timestamp that are
+        not stored yet, one entry per contiguous run of missing sessions.
+        Returns {symbol: [(window_start, window_end), ...]}; a symbol with full
+        coverage maps to an empty list.
+        """
+        sessions = self._get_sessions(
+            TimeHandler.get_unix_time_from_string(start_timestamp),
+            TimeHandler.get_unix_time_from_string(end_timestamp),
+        )
+        dict_missing_windows = {}
+        for stock_symbol in list_symbols:
+            dict_missing_windows[stock_symbol] = [
+                (
+                    TimeHandler.get_datetime_from_unix_time(window_start),
+                    TimeHandler.get_datetime_from_unix_time(window_end),
+                )
+                for window_start, window_end in Intervals.missing(
+                    self._get_stored_intervals(stock_symbol), sessions
+                )
+            ]
+        return dict_missing_windows
 
     def check_data_availability(self, stock_symbol, start_timestamp, end_timestamp):
         start_timestamp = TimeHandler.get_datetime_from_string(start_timestamp)
         end_timestamp = TimeHandler.get_datetime_from_string(end_timestamp)
 
-        if stock_symbol in self.set_symbols:
-            all_dates = list(
-                self.pym_cli.sql(
-                    [f"SELECT Epoch FROM `{stock_symbol}/{self.timeframe}/OHLCV`;"]
-                )
-                .first()
-                .df()
-                .index
-            )
-        else:
+        coverage = (
+            self.coverage.get_coverage(stock_symbol, self.timeframe)
+            if self._get_stored_intervals(stock_symbol)
+            else None
+        )
+        if coverage is None:
             return False, start_timestamp, end_timestamp
 
-        dataAvailableFrom = all_dates[0].to_pydatetime()
-        dataAvailableTo = all_dates[-1].to_pydatetime()
+        dataAvailableFrom = TimeHandler.get_datetime_from_unix_time(coverage[0])
+        dataAvailableTo = TimeHandler.get_datetime_from_unix_time(coverage[1])
 
         if (start_timestamp.date() < dataAvailableFrom.date()) and (
             end_timestamp.date() < dataAvailableFrom.date()
@@ -164,45 +577,127 @@ class DailyStockTableManager:
         else:
             return True, None, None
 
-    def update_daily_stock_data(self, list_of_tuples: List[Tuple[str, pd.DataFrame]]):
+    def update_daily_stock_data(
+        self,
+        list_of_tuples: List[Tuple[str, pd.DataFrame]],
+        verbose: bool = True,
+        batch_size: int = 200,
+    ) -> Dict[str, str]:
         """
         Input: list_of_tuples
         Format: [('SYMBOL1', pandas.Dataframe), ('SYMBOL2', pandas.Dataframe)...]
+
+        Symbols are written `batch_size` at a time (fewer once a batch holds
+        MAX_WRITE_BYTES of bars) with one storage write per batch. A symbol
+        that fails does not stop the update, returns {symbol: error} of the
+        symbols that were not written.
         """
 
-        print("Updating DailyStockTables Database...")
+        if verbose:
+            print("Updating DailyStockTables Database...")
 
+        dict_failures: Dict[str, str] = {}
+        dict_bars: Dict[str, List[np.ndarray]] = {}
         for stock_symbol, df in list_of_tuples:
-            dict_columns_type = {
-                "open": float,
-                "high": float,
-                "low": float,
-                "close": float,
-                "volume": int,
-                "trade_count": int,
-                "vwap": float,
-            }
-            df = df.astype(dict_columns_type)
-            self.update_one_stock_table(stock_symbol, df)
+            try:
+                dict_bars.setdefault(stock_symbol, []).append(
+                    self._df_to_bars(df, self.bar_seconds)
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                dict_failures[stock_symbol] = str(e)
+
+        dict_failures.update(
+            self._write_bars(
+                {
+                    stock_symbol: np.concatenate(list_arrays)
+                    for stock_symbol, list_arrays in dict_bars.items()
+                    if stock_symbol not in dict_failures
+                },
+                batch_size,
+            )
+        )
+
+        if dict_failures:
+            warnings.warn(
+                f"{len(dict_failures)} symbol(s) could not be written: {dict_failures}"
+            )
+        if verbose:
+            print("Update completed!")
+        return dict_failures
+
+    def _write_bars(
+        self,
+        dict_bars: Dict[str, np.ndarray],
+        batch_size: int = 200,
+        dict_coverage_epochs: Optional[Dict[str, np.ndarray]] = None,
+    ) -> Dict[str, str]:
+        """
+        Writes the sorted bars of every symbol in batches and extends the
+        coverage of the written symbols, by default with the bar epochs.
+        Returns {symbol: error} of the symbols that were not written.
+        """
+        list_batches: List[Dict[str, np.ndarray]] = [{}]
+        batch_bytes = 0
+        for stock_symbol, bars in dict_bars.items():
+            if list_batches[-1] and (
+                len(list_batches[-1]) >= batch_size
+                or batch_bytes + bars.nbytes > self.MAX_WRITE_BYTES
+            ):
+                list_batches.append({})
+                batch_bytes = 0
+            list_batches[-1][stock_symbol] = bars
+            batch_bytes += bars.nbytes
 
-        print("Update completed!")
+        dict_failures: Dict[str, str] = {}
+        for batch in list_batches:
+            if not batch:
+                continue
+            batch_failures = self.storage.write_many(self.timeframe, batch)
+            dict_failures.update(batch_failures)
+            for stock_symbol, bars in batch.items():
+                self._invalidate_cache(stock_symbol)
+                if stock_symbol not in batch_failures:
+                    self.set_symbols.add(stock_symbol)
+                    self._extend_coverage(
+                        stock_symbol,
+                        (dict_coverage_epochs or {}).get(stock_symbol, bars["Epoch"]),
+                    )
+        return dict_failures
 
     def update_one_stock_table(self, stock_symbol, df: DataFrame):
-        df_updated = df.reset_index()
-        df_updated["timestamp"] = df_updated["timestamp"].apply(
-            lambda d: d.replace(hour=0, minute=0, second=0).value // 10**9
-        )
-        df_updated = df_updated.rename(columns={"timestamp": "Epoch", "vwap": "vmap"})
+        bars = self._df_to_bars(df, self.bar_seconds)
+        try:
+            self.storage.write(stock_symbol, self.timeframe, bars)
+        finally:
+            self._invalidate_cache(stock_symbol)
 
-        records = df_updated.to_records(index=False)
-        data = np.array(records, dtype=records.dtype.descr)
+        self.set_symbols.add(stock_symbol)
+        self._extend_coverage(stock_symbol, bars["Epoch"])
 
-        response = self.pym_cli.write(
-            data, f"{stock_symbol}/{self.timeframe}/OHLCV", isvariablelength=True
-        )
-        assert (
-            response is not None and response["responses"] is None
-        ), "Error in updating data in database."
+    def _invalidate_cache(self, stock_symbol):
+        if self.cache is not None:
+            self.cache.invalidate(stock_symbol, self.timeframe)
+
+    @staticmethod
+    def _df_to_bars(df: DataFrame, bar_seconds: Optional[int] = None) -> np.ndarray:
+        """
+        Converts a bars DataFrame indexed by timestamp into a BAR_DTYPE array,
+        each timestamp floored to its (UTC) day in epoch seconds, or to the
+        start of its bar for intraday `bar_seconds`.
+        """
+        bars = np.empty(len(df), dtype=BAR_DTYPE)
+        # .values holds UTC datetime64[ns] for tz-aware indexes too
+        timestamps = pd.DatetimeIndex(df.index).values
+        if bar_seconds is None:
+            epochs = timestamps.astype("datetime64[D]").astype("datetime64[s]")
+        else:
+            epochs = timestamps.astype("datetime64[s]").view(np.int64)
+            epochs = epochs - epochs % bar_seconds
+        bars["Epoch"] = epochs.view(np.int64)
+        for name in BAR_FIELDS[1:]:
+            column = df["vwap" if name == "vmap" else name]
+            bars[name] = column.astype(BAR_DTYPE[name]).to_numpy()
+        return bars[np.argsort(bars["Epoch"], kind="stable")]
 
     def get_daily_stock_data(
         self,
@@ -211,13 +706,54 @@ class DailyStockTableManager:
         end_timestamp,
         ensure_full_data,
         ensure_full_date_strat: str = "mode",
+        batch_size: Optional[int] = 200,
+        n_workers: int = 1,
+        timestamp_format: str = "datetime",
     ):
-        dictStockData = {}
+        """
+        Reads the stored bars of every symbol between the two timestamps and
+        returns {symbol: pandas.DataFrame}.
+
+        With `batch_size` set, symbols are read `batch_size` at a time with
+        one storage query per batch, using up to `n_workers` threads
+        across batches. `batch_size=None` reads one symbol per query.
+
+        With `ensure_full_data`, symbols with fewer bars than the others are
+        dropped (`ensure_full_date_strat` "mode" or "max"). To keep them
+        with a validity mask, use get_aligned_stock_data instead.
+
+        `timestamp_format` selects how bar times are returned:
+            - `datetime`: tz-naive DatetimeIndex named `timestamp`
+            - `epoch`: int64 unix seconds index named `timestamp`
+            - `string`: "%Y-%m-%d %H:%M:%S" strings in a `timestamp` column
+        """
+        if timestamp_format not in TIMESTAMP_FORMATS:
+            raise ValueError(
+                f"Invalid timestamp format. Should be one of {TIMESTAMP_FORMATS}."
+            )
+
+        if ensure_full_data and ensure_full_date_strat not in ("max", "mode"):
+            raise ValueError(
+                "Invalid strategy for ensuring full data. Should be 'max' or 'mode', "
+                "use get_aligned_stock_data to mask missing bars instead."
+            )
+
         print("Reading data from database.")
-        for individual_symbol in this_list_of_symbols:
-            dictStockData[individual_symbol] = self.get_specific_stock_data(
-                individual_symbol, start_timestamp, end_timestamp
+        if batch_size:
+            dictStockData = self.get_many_stock_data(
+                this_list_of_symbols,
+                start_timestamp,
+                end_timestamp,
+                batch_size,
+                n_workers,
+                timestamp_format,
             )
+        else:
+            dictStockData = {}
+            for individual_symbol in this_list_of_symbols:
+                dictStockData[individual_symbol] = self.get_specific_stock_data(
+                    individual_symbol, start_timestamp, end_timestamp, timestamp_format
+                )
         print(
             f"Read complete! Returning dataframe(s) for {len(this_list_of_symbols)} symbols."
         )
@@ -229,56 +765,497 @@ class DailyStockTableManager:
 
         return dictStockData
 
-    def get_specific_stock_data(self, stock_name, start_timestamp, end_timestamp):
-        this_params = pymkts.Params(
-            stock_name, self.timeframe, "OHLCV", start_timestamp, end_timestamp
+    def get_many_stock_data(
+        self,
+        list_symbols: List[str],
+        start_timestamp,
+        end_timestamp,
+        batch_size: int = 200,
+        n_workers: int = 1,
+        timestamp_format: str = "datetime",
+    ) -> Dict[str, pd.DataFrame]:
+        # Pre-filled so the requested symbol order is kept
+        dictStockData = {symbol: pd.DataFrame() for symbol in list_symbols}
+
+        def on_dataset(symbol, bars):
+            dictStockData[symbol] = self._bars_to_df(bars, timestamp_format)
+
+        self._for_each_dataset(
+            list_symbols,
+            start_timestamp,
+            end_timestamp,
+            on_dataset,
+            batch_size,
+            n_workers,
+        )
+        return dictStockData
+
+    def get_grid_epochs(self, start_timestamp, end_timestamp) -> np.ndarray:
+        """
+        Sorted epochs of the sessions between the two timestamps, of their
+        regular-hours bars for an intraday timeframe.
+        """
+        if self.bar_seconds:
+            return TradingCalendar.get(self.exchange_name).bar_epochs_in_range(
+                start_timestamp, end_timestamp, self.bar_seconds
+            )
+        return self._get_sessions(
+            TimeHandler.get_unix_time_from_string(start_timestamp),
+            TimeHandler.get_unix_time_from_string(end_timestamp),
+        )
+
+    def get_aligned_stock_data(
+        self,
+        list_symbols: List[str],
+        start_timestamp,
+        end_timestamp,
+        dates: np.ndarray,
+        batch_size: int = 200,
+        n_workers: int = 1,
+        timestamp_format: str = "datetime",
+    ) -> AlignedStockData:
+        """
+        Reads the stored bars of every symbol reindexed onto `dates`, the
+        sorted grid of session epochs (see get_grid_epochs). Sessions without
+        a bar are NaN rows, so volume and trade_count are floats; no symbol is
+        dropped and the returned mask tells which bars exist.
+        """
+        if timestamp_format not in TIMESTAMP_FORMATS:
+            raise ValueError(
+                f"Invalid timestamp format. Should be one of {TIMESTAMP_FORMATS}."
+            )
+        dates = np.asarray(dates, dtype=np.int64)
+        panel = self.get_stock_panel(
+            list_symbols,
+            start_timestamp,
+            end_timestamp,
+            dates,
+            batch_size=batch_size,
+            n_workers=n_workers,
+        )
+        # Stored bars have no NaN field
+        mask = ~np.isnan(panel.values).all(axis=2)
+        frames = {
+            symbol: self._set_timestamps(
+                pd.DataFrame(panel.values[i], columns=panel.fields),
+                dates,
+                timestamp_format,
+            )
+            for i, symbol in enumerate(panel.symbols)
+        }
+        return AlignedStockData(frames, mask, panel.symbols, panel.dates)
+
+    def get_stock_panel(
+        self,
+        list_symbols: List[str],
+        start_timestamp,
+        end_timestamp,
+        dates: np.ndarray,
+        fields: Optional[List[str]] = None,
+        batch_size: int = 200,
+        n_workers: int = 1,
+        dtype=np.float64,
+    ) -> StockPanel:
+        """
+        Reads the stored bars straight into one (symbol, date, field) array.
+        `dates` is the sorted grid of session epochs (unix seconds) to align
+        on; bars off the grid are dropped and missing bars are NaN.
+        """
+        fields = list(fields or PANEL_FIELDS)
+        dates = np.asarray(dates, dtype=np.int64)
+        values = np.full((len(list_symbols), len(dates), len(fields)), np.nan, dtype)
+        row_of_symbol = {symbol: i for i, symbol in enumerate(list_symbols)}
+
+        def on_dataset(symbol, bars):
+            epochs = bars["Epoch"]
+            positions = np.clip(np.searchsorted(dates, epochs), 0, len(dates) - 1)
+            on_grid = dates[positions] == epochs
+            positions = positions[on_grid]
+            symbol_values = values[row_of_symbol[symbol]]
+            for k, field in enumerate(fields):
+                symbol_values[positions, k] = bars[field][on_grid]
+
+        if len(dates) and len(list_symbols):
+            self._for_each_dataset(
+                list_symbols,
+                start_timestamp,
+                end_timestamp,
+                on_dataset,
+                batch_size,
+                n_workers,
+                columns=["Epoch"] + fields,
+            )
+        return StockPanel(
+            values,
+            list(list_symbols),
+            TimeHandler.get_datetime_index_from_unix_times(dates),
+            fields,
+        )
+
+    def get_resampled_stock_data(
+        self,
+        list_symbols: List[str],
+        start_timestamp,
+        end_timestamp,
+        timeframe: str,
+        materialize: bool = False,
+        batch_size: int = 200,
+        n_workers: int = 1,
+        timestamp_format: str = "datetime",
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Derives `timeframe` bars from the stored bars, see Resampler, and
+        returns {symbol: pandas.DataFrame} of every bucket overlapping the
+        two timestamps. The first and last buckets are read whole.
+
+        With `materialize=True`, the derived bars of the symbols whose source
+        bars cover the buckets are written under `timeframe` in the same
+        storage, and read back from there by later calls covering the same
+        sessions. Materialized bars are not recomputed when the source bars
+        of sessions they cover are rewritten.
+
+        Example:
+        dict_weekly = daily_stocks.get_resampled_stock_data(
+            ["AAPL", "MSFT"], "2021-06-01 00:00:00", "2021-07-01 00:00:00", "1Week"
+        )
+        """
+        Resampler.check(self.timeframe, timeframe)
+        if timestamp_format not in TIMESTAMP_FORMATS:
+            raise ValueError(
+                f"Invalid timestamp format. Should be one of {TIMESTAMP_FORMATS}."
+            )
+
+        start_epoch, end_epoch = Resampler.bucket_range(
+            *self._range_epochs(start_timestamp, end_timestamp), timeframe
+        )
+        start_timestamp, end_timestamp = (
+            TimeHandler.get_string_from_datetime(
+                TimeHandler.get_datetime_from_unix_time(epoch)
+            )
+            for epoch in (start_epoch, end_epoch)
+        )
+
+        # Pre-filled so the requested symbol order is kept
+        dictStockData = {symbol: pd.DataFrame() for symbol in list_symbols}
+        list_to_resample = list(list_symbols)
+        if materialize:
+            derived = self._get_derived(timeframe)
+            dict_missing_windows = derived.get_many_missing_windows(
+                list_symbols, start_timestamp, end_timestamp
+            )
+            list_materialized = [
+                symbol for symbol in list_symbols if not dict_missing_windows[symbol]
+            ]
+            list_to_resample = [
+                symbol for symbol in list_symbols if dict_missing_windows[symbol]
+            ]
+
+            def on_derived_dataset(symbol, bars):
+                dictStockData[symbol] = self._bars_to_df(bars, timestamp_format)
+
+            derived._for_each_dataset(
+                list_materialized,
+                start_timestamp,
+                end_timestamp,
+                on_derived_dataset,
+                batch_size,
+                n_workers,
+            )
+
+        dict_resampled: Dict[str, np.ndarray] = {}
+        dict_sessions: Dict[str, np.ndarray] = {}
+
+        def on_dataset(symbol, bars):
+            dict_resampled[symbol] = Resampler.resample(bars, timeframe)
+            dict_sessions[symbol] = np.unique(bars["Epoch"] - bars["Epoch"] % 86400)
+            dictStockData[symbol] = self._bars_to_df(
+                dict_resampled[symbol], timestamp_format
+            )
+
+        self._for_each_dataset(
+            list_to_resample,
+            start_timestamp,
+            end_timestamp,
+            on_dataset,
+            batch_size,
+            n_workers,
+        )
+
+        if materialize and dict_resampled:
+            # Only fully covered buckets are kept, a partial bucket would be
+            # labelled by a later session than the complete one
+            dict_missing_windows = self.get_many_missing_windows(
+                list(dict_resampled), start_timestamp, end_timestamp
+            )
+            derived._write_bars(
+                {
+                    symbol: bars
+                    for symbol, bars in dict_resampled.items()
+                    if len(bars) and not dict_missing_windows[symbol]
+                },
+                batch_size,
+                dict_sessions,
+            )
+        return dictStockData
+
+    def _get_derived(self, timeframe: str) -> "DailyStockTableManager":
+        storage_key = Timeframes.storage_key(timeframe)
+        if storage_key not in self._derived:
+            derived = DailyStockTableManager(
+                timeframe,
+                coverage_db_name=self.coverage_db_name,
+                exchange_name=self.exchange_name,
+                storage=self.storage,
+                cache_bytes=0,
+            )
+            # Cache entries are keyed by timeframe, one budget serves both
+            derived.cache = self.cache
+            self._derived[storage_key] = derived
+        return self._derived[storage_key]
+
+    def close(self):
+        """Waits for the pending async writes and stops their thread."""
+        for derived in self._derived.values():
+            derived.close()
+        self._write_executor.shutdown(wait=True)
+
+    async def update_daily_stock_data_async(
+        self, list_of_tuples: List[Tuple[str, pd.DataFrame]], verbose: bool = True
+    ) -> Dict[str, str]:
+        """Async counterpart of update_daily_stock_data, writes run in a dedicated thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._write_executor,
+            functools.partial(self.update_daily_stock_data, list_of_tuples, verbose),
+        )
+
+    async def get_daily_stock_data_async(self, *args, **kwargs):
+        """Async counterpart of get_daily_stock_data, the blocking reads run in a worker thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self.get_daily_stock_data, *args, **kwargs)
         )
 
+    async def get_aligned_stock_data_async(self, *args, **kwargs) -> AlignedStockData:
+        """Async counterpart of get_aligned_stock_data, the blocking reads run in a worker thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self.get_aligned_stock_data, *args, **kwargs)
+        )
+
+    async def get_stock_panel_async(self, *args, **kwargs) -> StockPanel:
+        """Async counterpart of get_stock_panel, the blocking reads run in a worker thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self.get_stock_panel, *args, **kwargs)
+        )
+
+    async def get_resampled_stock_data_async(
+        self, *args, **kwargs
+    ) -> Dict[str, pd.DataFrame]:
+        """Async counterpart of get_resampled_stock_data, reads and writes run in a worker thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._write_executor,
+            functools.partial(self.get_resampled_stock_data, *args, **kwargs),
+        )
+
+    def _for_each_dataset(
+        self,
+        list_symbols: List[str],
+        start_timestamp,
+        end_timestamp,
+        on_dataset: Callable[[str, np.ndarray], None],
+        batch_size: int = 200,
+        n_workers: int = 1,
+        columns: Optional[List[str]] = None,
+    ):
+        """
+        Queries the symbols `batch_size` at a time, using up to `n_workers`
+        threads across batches, and calls `on_dataset(symbol, bars)` with the
+        structured bars array of every symbol that has stored bars in the range.
+        """
+        list_batches = [
+            list_symbols[i : i + batch_size]
+            for i in range(0, len(list_symbols), batch_size)
+        ]
+
+        def read_batch(batch):
+            for symbol, bars in self._query_batch(
+                batch, start_timestamp, end_timestamp, columns
+            ).items():
+                on_dataset(symbol, bars)
+
+        if n_workers > 1 and len(list_batches) > 1:
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                list(executor.map(read_batch, list_batches))
+        else:
+            for batch in list_batches:
+                read_batch(batch)
+
+    def _query_batch(
+        self,
+        list_symbols: List[str],
+        start_timestamp,
+        end_timestamp,
+        columns: Optional[List[str]] = None,
+    ) -> Dict[str, np.ndarray]:
+        # Unknown symbols make marketstore reject the whole query
+        stored_symbols = [s for s in list_symbols if s in self.set_symbols]
+        if not stored_symbols:
+            return {}
+        start_epoch, end_epoch = self._range_epochs(start_timestamp, end_timestamp)
+
+        if self.cache is None:
+            dict_read = self._query_storage(
+                stored_symbols, start_epoch, end_epoch, columns
+            )
+            return {s: bars for s, bars in dict_read.items() if bars is not None}
+
+        dict_bars: Dict[str, np.ndarray] = {}
+        missed_symbols = []
+        for symbol in stored_symbols:
+            bars = self.cache.get(symbol, self.timeframe, start_epoch, end_epoch)
+            if bars is None:
+                missed_symbols.append(symbol)
+            elif len(bars):
+                dict_bars[symbol] = bars
+
+        if missed_symbols:
+            versions = {
+                s: self.cache.version(s, self.timeframe) for s in missed_symbols
+            }
+            # All columns are read so the cached bars serve any projection
+            dict_read = self._query_storage(missed_symbols, start_epoch, end_epoch)
+            for symbol in missed_symbols:
+                read_bars = dict_read.get(symbol, np.empty(0, dtype=BAR_DTYPE))
+                if read_bars is None:
+                    continue
+                self.cache.put(
+                    symbol,
+                    self.timeframe,
+                    start_epoch,
+                    end_epoch,
+                    read_bars,
+                    versions[symbol],
+                )
+                if len(read_bars):
+                    dict_bars[symbol] = read_bars
+
+        if columns is not None:
+            columns = ["Epoch"] + [c for c in columns if c != "Epoch"]
+            dict_bars = {s: bars[columns] for s, bars in dict_bars.items()}
+        return dict_bars
+
+    def _range_epochs(self, start_timestamp, end_timestamp) -> Tuple[int, int]:
+        start_epoch = TimeHandler.get_unix_time_from_string(start_timestamp)
+        end_epoch = TimeHandler.get_unix_time_from_string(end_timestamp)
+        if self.bar_seconds and end_epoch % 86400 == 0:
+            # An end date at midnight includes the intraday bars of that day
+            end_epoch += 86400 - 1
+        return start_epoch, end_epoch
+
+    def _query_storage(
+        self,
+        list_symbols: List[str],
+        start_epoch: int,
+        end_epoch: int,
+        columns: Optional[List[str]] = None,
+    ) -> Dict[str, Optional[np.ndarray]]:
+        """Storage query of the batch, symbols that could not be read map to None."""
         try:
-            this_df = self.pym_cli.query(this_params).first().df().reset_index()
+            return dict(
+                self.storage.query(
+                    list_symbols, self.timeframe, start_epoch, end_epoch, columns
+                )
+            )
         except Exception as e:
-            warnings.warn(f"Error encountered: {e}")
+            if len(list_symbols) == 1:
+                warnings.warn(f"Error encountered: {e}")
+                return {list_symbols[0]: None}
+            warnings.warn(
+                f"Error encountered in batch read, reading symbols one by one: {e}"
+            )
+
+        dict_bars: Dict[str, Optional[np.ndarray]] = {}
+        for symbol in list_symbols:
+            dict_bars.update(
+                self._query_storage([symbol], start_epoch, end_epoch, columns)
+            )
+        return dict_bars
+
+    def get_specific_stock_data(
+        self, stock_name, start_timestamp, end_timestamp, timestamp_format="datetime"
+    ):
+        bars = self._query_batch([stock_name], start_timestamp, end_timestamp).get(
+            stock_name
+        )
+        if bars is None:
             return pd.DataFrame()
+        return self._bars_to_df(bars, timestamp_format)
 
-        this_df.rename(columns={"Epoch": "timestamp"}, inplace=True)
-        this_df["timestamp"] = this_df["timestamp"].apply(
-            lambda d: TimeHandler.get_string_from_datetime64(d.tz_convert(None))
+    @staticmethod
+    def _bars_to_df(array: np.ndarray, timestamp_format="datetime") -> pd.DataFrame:
+        # Built straight from the column arrays, Epoch is never
+        # converted row by row
+        this_df = pd.DataFrame(
+            {
+                column: array[column]
+                for column in array.dtype.names or ()
+                if column != "Epoch"
+            }
         )
+        return DailyStockTableManager._set_timestamps(
+            this_df, array["Epoch"], timestamp_format
+        )
+
+    @staticmethod
+    def _set_timestamps(
+        this_df: pd.DataFrame, epochs: np.ndarray, timestamp_format="datetime"
+    ) -> pd.DataFrame:
+        if timestamp_format == "epoch":
+            this_df.index = pd.Index(epochs, name="timestamp")
+        elif timestamp_format == "datetime":
+            this_df.index = TimeHandler.get_datetime_index_from_unix_times(
+                epochs
+            ).rename("timestamp")
+        else:
+            this_df.insert(
+                0,
+                "timestamp",
+                TimeHandler.get_datetime_index_from_unix_times(epochs).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                ),
+            )
         return this_df
 
     def full_data_strat(
         self, dt_df: Dict[str, pd.DataFrame], list_symbols: List[str], strat: str
     ):
+        """
+        Drops from `dt_df` and `list_symbols` (in place) the symbols with
+        fewer bars than the others, see get_aligned_stock_data to keep them.
+        """
         timeframes = [len(df) for df in dt_df.values()]
         cnts = Counter(timeframes)
 
         if strat == "max":
             # Remove dataframes with less data than the timeframe
             max_timeframe = max(timeframes)
-
-            for symbol in list(dt_df.keys()):
-                df = dt_df[symbol]
-                if len(df) < max_timeframe:
-                    dt_df.pop(symbol)
-                    list_symbols.remove(symbol)  # Hack: fix sometime
-
-            print(
-                f"Dataframes with less than {max_timeframe} entries removed. {len(list_symbols)} symbols remaining.\n"
-            )
+            set_removed = {
+                symbol for symbol, df in dt_df.items() if len(df) < max_timeframe
+            }
+            message = f"Dataframes with less than {max_timeframe} entries removed."
         elif strat == "mode":
             # Remove dataframes with less data than the mode of the timeframes
             mode_timeframe = cnts.most_common(1)[0][0]
-
-            for symbol in list(dt_df.keys()):
-                df = dt_df[symbol]
-                if len(df) != mode_timeframe:
-                    dt_df.pop(symbol)
-                    list_symbols.remove(symbol)
-
-            print(
-                f"Dataframes with != {mode_timeframe} entries removed. {len(list_symbols)} symbols remaining.\n"
-            )
+            set_removed = {
+                symbol for symbol, df in dt_df.items() if len(df) != mode_timeframe
+            }
+            message = f"Dataframes with != {mode_timeframe} entries removed."
         else:
             raise ValueError(
                 "Invalid strategy for ensuring full data. Should be 'max' or 'mode'."
             )
+
+        for symbol in set_removed:
+            dt_df.pop(symbol)
+        list_symbols[:] = [
+            symbol for symbol in list_symbols if symbol not in set_removed
+        ]
+        print(f"{message} {len(list_symbols)} symbols remaining.\n")
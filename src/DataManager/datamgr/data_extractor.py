@@ -1,15 +1,17 @@
-import copy
 from datetime import datetime
 import os
-from typing import Dict, Iterable, List, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from alpaca_trade_api.rest import REST, TimeFrame
-import asyncio
+import inspect
 import time
+import warnings
 import pandas as pd
-import pandas_market_calendars as mcal
+from DataManager.utils.async_runner import AsyncRunner
+from DataManager.utils.timeframes import Timeframes
 from DataManager.utils.timehandler import TimeHandler
+from DataManager.utils.trading_calendar import TradingCalendar
 from DataManager.assetmgr.asset_manager import Assets
-from DataManager.datamgr.historic_async import HistoricalAsync
+from DataManager.datamgr.historic_async import DataType, HistoricalAsync
 from DataManager import core
 import configparser
 
@@ -24,10 +26,29 @@ class DataExtractor:
         required_dates, TimeFrame.Day, exchangeName)
 
     Inputs:
-        - `None`
+        - `verify_calendar`: if True, trading day counts from the local exchange calendar
+            are checked against Alpaca's calendar endpoint (one extra HTTP call per count)
+        - `requests_per_minute`: Alpaca rate limit of the account, requests are scheduled to stay under it
+        - `max_concurrency`: most Alpaca requests in flight at once
+        - `request_timeout`: timeout of a single Alpaca request in seconds
+        - `symbols_per_request`: symbols sharing a window that are fetched with one multi-symbol
+            bars request (1 sends one request per symbol)
     """
 
-    def __init__(self) -> None:
+    # Alpaca returns at most 1000 bars per request
+    MAX_DAYS_PER_REQUEST = 1000
+    # Intraday windows are chunked to about one page of bars, extended hours (4:00-20:00) included
+    MAX_BARS_PER_REQUEST = 10000
+    EXTENDED_SESSION_SECONDS = 16 * 60 * 60
+
+    def __init__(
+        self,
+        verify_calendar: bool = False,
+        requests_per_minute: int = 200,
+        max_concurrency: int = 50,
+        request_timeout: float = 30,
+        symbols_per_request: int = 1,
+    ) -> None:
         self.configParse = configparser.ConfigParser()
         self.configParse.read(
             os.path.join(
@@ -36,7 +57,13 @@ class DataExtractor:
         )
         core.setEnv()
         self.AlpacaAPI = REST(raw_data=True)
-        self.AsyncObj = HistoricalAsync()
+        self.AsyncObj = HistoricalAsync(
+            requests_per_minute,
+            max_concurrency=max_concurrency,
+            request_timeout=request_timeout,
+        )
+        self.verify_calendar = verify_calendar
+        self.symbols_per_request = symbols_per_request
 
     def getOneHistoricalAlpaca(
         self, symbolName, dateFrom, dateTo, timeframe: TimeFrame, adjustment="all"
@@ -45,49 +72,213 @@ class DataExtractor:
             symbolName, timeframe, dateFrom, dateTo, adjustment=adjustment
         ).df
 
+    async def callHistoricalAlpacaAsync(
+        self,
+        listSymbols,
+        dateFrom,
+        dateTo,
+        timeframe: TimeFrame,
+        adjustment="all",
+        maxRetries=None,
+    ):
+        # The results are built for this call only, so they are handed over as is
+        return await self.AsyncObj.get_historic_bars(
+            listSymbols, dateFrom, dateTo, timeframe, adjustment, maxRetries
+        )
+
     def callHistoricalAlpaca(
-        self, listSymbols, dateFrom, dateTo, timeframe: TimeFrame, adjustment="all"
+        self,
+        listSymbols,
+        dateFrom,
+        dateTo,
+        timeframe: TimeFrame,
+        adjustment="all",
+        maxRetries=None,
     ):
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(
-            self.AsyncObj.get_historic_bars(
-                listSymbols, dateFrom, dateTo, timeframe, adjustment
+        return AsyncRunner.run(
+            self.callHistoricalAlpacaAsync(
+                listSymbols, dateFrom, dateTo, timeframe, adjustment, maxRetries
             )
         )
-        to_return = copy.deepcopy(self.AsyncObj.resultAsync)
-        self.AsyncObj.reset_async_list()
-        return to_return
+
+    async def callHistoricalMultipleAlpacaAsync(
+        self,
+        listSymbols,
+        list_dates,
+        timeframe: TimeFrame,
+        adjustment="all",
+        maxRetries=None,
+    ):
+        return await self.AsyncObj.get_multiple_dates_historic_bars(
+            listSymbols,
+            list_dates,
+            timeframe,
+            adjustment,
+            maxRetries,
+            self.symbols_per_request,
+        )
 
     def callHistoricalMultipleAlpaca(
-        self, listSymbols, list_dates, timeframe: TimeFrame, adjustment="all"
+        self,
+        listSymbols,
+        list_dates,
+        timeframe: TimeFrame,
+        adjustment="all",
+        maxRetries=None,
     ):
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(
-            self.AsyncObj.get_multiple_dates_historic_bars(
-                listSymbols, list_dates, timeframe, adjustment
+        return AsyncRunner.run(
+            self.callHistoricalMultipleAlpacaAsync(
+                listSymbols, list_dates, timeframe, adjustment, maxRetries
             )
         )
-        to_return = copy.deepcopy(self.AsyncObj.resultAsync)
-        self.AsyncObj.reset_async_list()
-        return to_return
 
     def callCalendarAlpaca(self, dateFrom, dateTo):
         return self.AlpacaAPI.get_calendar(dateFrom, dateTo)
 
+    def countTradingDays(self, dateFrom, dateTo, exchange_name="NYSE") -> int:
+        totalLength = TradingCalendar.get(exchange_name).count_days(dateFrom, dateTo)
+        if self.verify_calendar:
+            remoteLength = len(self.callCalendarAlpaca(dateFrom, dateTo))
+            if remoteLength != totalLength:
+                warnings.warn(
+                    f"CALENDAR MISMATCH: {exchange_name} calendar has {totalLength} trading days "
+                    f"between {dateFrom} and {dateTo}, Alpaca has {remoteLength}"
+                )
+        return totalLength
+
+    def maxDaysPerRequest(self, timeframe) -> int:
+        bar_seconds = Timeframes.bar_seconds(timeframe)
+        if bar_seconds is None:
+            return self.MAX_DAYS_PER_REQUEST
+        max_days = (
+            self.MAX_BARS_PER_REQUEST * bar_seconds // self.EXTENDED_SESSION_SECONDS
+        )
+        return max(1, min(self.MAX_DAYS_PER_REQUEST, max_days))
+
+    def chunkRequestDates(self, list_symbols, list_dates, exchange_name, max_days=None):
+        """
+        Snaps every (start, end) window of `list_dates` in place to its first and
+        last trading day and splits it into chunks of at most `max_days`
+        (MAX_DAYS_PER_REQUEST by default) consecutive trading days, so that each
+        chunk fits in one Alpaca request, see maxDaysPerRequest.
+
+        Returns (chunk_symbols, chunk_dates, chunk_owner), where chunk_owner[k] is
+        the index in `list_dates` of the window chunk k belongs to.
+        """
+        this_exchange = TradingCalendar.get(exchange_name)
+        max_days = max_days or self.MAX_DAYS_PER_REQUEST
+        chunk_symbols, chunk_dates, chunk_owner = [], [], []
+        for i, (stock_symbol, datePair) in enumerate(zip(list_symbols, list_dates)):
+            valid_days = this_exchange.days_in_range(datePair[0], datePair[1])
+            if len(valid_days) == 0:
+                continue
+            list_dates[i] = (
+                TimeHandler.get_alpaca_string_from_timestamp(valid_days[0]),
+                TimeHandler.get_alpaca_string_from_timestamp(valid_days[-1]),
+            )
+            for first in range(0, len(valid_days), max_days):
+                last = min(first + max_days, len(valid_days)) - 1
+                chunk_symbols.append(stock_symbol)
+                chunk_dates.append(
+                    (
+                        TimeHandler.get_alpaca_string_from_timestamp(valid_days[first]),
+                        TimeHandler.get_alpaca_string_from_timestamp(valid_days[last]),
+                    )
+                )
+                chunk_owner.append(i)
+        return chunk_symbols, chunk_dates, chunk_owner
+
+    async def fetchChunkedWindowsAsync(
+        self,
+        list_symbols,
+        list_dates,
+        timeframe: TimeFrame,
+        exchange_name,
+        adjustment="all",
+        maxRetries=3,
+    ) -> List[Tuple[str, Optional[pd.DataFrame], bool]]:
+        """
+        Fetches every (symbol, window) request, with the chunks of long windows
+        fetched concurrently under the shared rate limit and stitched back into
+        one frame. Returns (symbol, dataframe or None, is_complete) per request.
+        """
+        n_symbols, n_dates = len(list_symbols), len(list_dates)
+        assert n_symbols == n_dates, "Length mismatch between symbols and dates"
+
+        chunk_symbols, chunk_dates, chunk_owner = self.chunkRequestDates(
+            list_symbols, list_dates, exchange_name, self.maxDaysPerRequest(timeframe)
+        )
+        exchange_tz = TradingCalendar.get(exchange_name).tz
+        # Each request is retried on its own by the async scheduler (backoff on
+        # 429s, 5xx responses and timeouts), so a single pass is enough here
+        chunk_output = await self.callHistoricalMultipleAlpacaAsync(
+            chunk_symbols, chunk_dates, timeframe, adjustment, maxRetries
+        )
+
+        list_frames: List[List[pd.DataFrame]] = [[] for _ in list_symbols]
+        n_chunks, n_complete = [0] * len(list_symbols), [0] * len(list_symbols)
+        # Responses come back in request order, so the chunks of a window are
+        # stitched in time order and a symbol requested for several windows is
+        # matched to each of its windows separately
+        for owner, date_pair, response in zip(chunk_owner, chunk_dates, chunk_output):
+            n_chunks[owner] += 1
+            if isinstance(response, Exception) or response[1].empty:
+                continue
+            list_frames[owner].append(response[1])
+            n_complete[owner] += self.isCompleteResponse(
+                response[1], date_pair, exchange_tz
+            )
+
+        results = []
+        for i, stock_symbol in enumerate(list_symbols):
+            if not list_frames[i]:
+                results.append((stock_symbol, None, False))
+                continue
+            fetched_df = (
+                list_frames[i][0]
+                if len(list_frames[i]) == 1
+                else pd.concat(list_frames[i])
+            )
+            results.append((stock_symbol, fetched_df, n_complete[i] == n_chunks[i] > 0))
+        return results
+
+    @staticmethod
+    def isCompleteResponse(
+        fetched_df: pd.DataFrame, date_pair, exchange_tz=None
+    ) -> bool:
+        # Dates are taken in the exchange timezone when given, so extended-hours
+        # bars past midnight UTC still belong to their session
+        first_bar, last_bar = fetched_df.index[0], fetched_df.index[-1]
+        if exchange_tz is not None:
+            first_bar, last_bar = (
+                (bar if bar.tzinfo is not None else bar.tz_localize("UTC")).tz_convert(
+                    exchange_tz
+                )
+                for bar in (first_bar, last_bar)
+            )
+        return bool(
+            (
+                TimeHandler.get_alpaca_string_from_timestamp(first_bar),
+                TimeHandler.get_alpaca_string_from_timestamp(last_bar),
+            )
+            == date_pair
+        )
+
     """
-        Extracts data from Alpaca asynchronously. Retries if some calls to Alpaca fail.
+        Extracts data from Alpaca asynchronously. Failed calls are retried per symbol with backoff.
+        Windows longer than MAX_DAYS_PER_REQUEST trading days are fetched in chunks and stitched.
 
         Example:
         complete_data, partial_data = getMultipleListHistoricalAlpaca(list_symbols, list_dates, TimeFrame.day,
                                         exchange_name, adjustment='all', maxRetries=3)
 
         Inputs:
-            - `list_symbols`: list of symbols to get data from (can be duplicated)
+            - `list_symbols`: list of symbols to get data from (can be duplicated, once per window)
             - `list_dates`: appropriate dates for the symbols to get data from (indices match with list_symbols list)
             - `timeframe`: timeframe to get data in (days, hours, months)
             - `adjustment`: adjustment for stock data
             - `exchange_name`: exchange to check against for output validation
-            - `maxRetries`: number of times to retry Alpaca calls when encountering exceptions
+            - `maxRetries`: number of times to retry a call on 429s, 5xx responses and timeouts
     """
 
     def getMultipleListHistoricalAlpaca(
@@ -99,95 +290,143 @@ class DataExtractor:
         adjustment="all",
         maxRetries=3,
     ):
-        this_exchange = mcal.get_calendar(exchange_name)
-        min_date_timeframe = False
-        max_date_timeframe = False
-        for i, datePair in enumerate(list_dates):
-            if not max_date_timeframe:
-                max_date_timeframe = datePair[1]
-            if not min_date_timeframe:
-                min_date_timeframe = datePair[0]
-            max_date_timeframe = max(max_date_timeframe, datePair[1])
-            min_date_timeframe = min(min_date_timeframe, datePair[0])
-            valid_days = this_exchange.valid_days(datePair[0], datePair[1])
-            list_dates[i] = (
-                TimeHandler.get_alpaca_string_from_timestamp(valid_days[0]),
-                TimeHandler.get_alpaca_string_from_timestamp(valid_days[-1]),
+        return AsyncRunner.run(
+            self.getMultipleListHistoricalAlpacaAsync(
+                list_symbols,
+                list_dates,
+                timeframe,
+                exchange_name,
+                adjustment,
+                maxRetries,
             )
+        )
 
-        totalLength = len(
-            self.callCalendarAlpaca(min_date_timeframe, max_date_timeframe)
-        )
-        if totalLength > 1000:
-            raise Exception("Alpaca only has data on past 1000 trading days")
-
-        def fix_output(
-            list_tuples: Iterable[Tuple[str, pd.DataFrame]]
-        ) -> Dict[str, pd.DataFrame]:
-            dict_stocks_df = {}
-            for individual_tup in list_tuples:
-                df_this = individual_tup[1]
-                symbol_this = individual_tup[0]
-                if symbol_this not in dict_stocks_df:
-                    dict_stocks_df[symbol_this] = df_this
-                else:
-                    dict_stocks_df[symbol_this].update(df_this)
-            return dict_stocks_df
-
-        currentRetries = 0
+    async def getMultipleListHistoricalAlpacaAsync(
+        self,
+        list_symbols,
+        list_dates,
+        timeframe: TimeFrame,
+        exchange_name,
+        adjustment="all",
+        maxRetries=3,
+    ):
+        """Async counterpart of getMultipleListHistoricalAlpaca."""
         valid_tuples: List[Tuple[str, pd.DataFrame]] = []
         empty_symbols, partial_symbols = set(), set()
-        this_list_symbols = list_symbols
-        this_list_dates = list_dates
 
-        assert len(this_list_symbols) == len(this_list_dates), "Length mismatch between symbols and dates"
+        fetched_windows = await self.fetchChunkedWindowsAsync(
+            list_symbols, list_dates, timeframe, exchange_name, adjustment, maxRetries
+        )
+        for stock_symbol, fetched_df, is_complete in fetched_windows:
+            if fetched_df is None:
+                empty_symbols.add(stock_symbol)
+            elif is_complete:
+                valid_tuples.append((stock_symbol, fetched_df))
+            else:
+                partial_symbols.add(stock_symbol)
 
-        while (
-            currentRetries <= maxRetries
-            and len(valid_tuples) != len(list_symbols)
-            and len(this_list_symbols) != 0
-        ):
-            current_output = self.callHistoricalMultipleAlpaca(
-                this_list_symbols, this_list_dates, timeframe, adjustment
-            )
-            cleaned_output = [
-                df_tuple
-                for df_tuple in current_output
-                if not isinstance(df_tuple, Exception)
-            ]
-            current_output = fix_output(cleaned_output)
-            list_failed_symbols = []
-            list_failed_dates = []
-
-            for stock_symbol, date_pair in zip(this_list_symbols, this_list_dates):
-                if stock_symbol not in current_output:
-                    list_failed_symbols.append(stock_symbol)
-                    list_failed_dates.append(date_pair)
-                    continue
-
-                fetched_df = current_output[stock_symbol]
-
-                if fetched_df.empty:
-                    list_failed_symbols.append(stock_symbol)
-                    list_failed_dates.append(date_pair)
-                elif (
-                    TimeHandler.get_alpaca_string_from_timestamp(fetched_df.index[0]),
-                    TimeHandler.get_alpaca_string_from_timestamp(fetched_df.index[-1]),
-                ) == date_pair:
-                    valid_tuples.append((stock_symbol, fetched_df))
-                else:
-                    partial_symbols.add(stock_symbol)
-
-            this_list_symbols = list_failed_symbols
-            this_list_dates = list_failed_dates
-            empty_symbols = set(list_failed_symbols)
-            currentRetries += 1
-            time.sleep(60)  # 1 min between consecutive requests
-
-        print(f"{len(valid_tuples)=} ,{len(partial_symbols)=}, {len(empty_symbols)=}")
+        print(
+            f"{len(valid_tuples)} complete, {len(partial_symbols)} partial and "
+            f"{len(empty_symbols)} empty symbol(s)"
+        )
         partial_symbols.update(empty_symbols)
         return valid_tuples, list(partial_symbols)
-    
+
+    """
+        Streams data from Alpaca: `on_complete(symbol, dataframe, date_pair)` is called for
+        every complete response as soon as it arrives, while at most `max_in_flight`
+        responses are held in memory. Long windows are split into chunks of at most
+        MAX_DAYS_PER_REQUEST trading days and each chunk is handed over on its own,
+        with `date_pair` set to the chunk's first and last trading day.
+
+        Example:
+        n_complete, partial_data = streamMultipleListHistoricalAlpaca(list_symbols, list_dates, TimeFrame.day,
+                                        exchange_name, on_complete, max_in_flight=100)
+
+        Inputs:
+            - same as getMultipleListHistoricalAlpaca
+            - `on_complete`: callback receiving each complete (symbol, dataframe, date_pair)
+            - `max_in_flight`: most requests pending or waiting to be processed at once
+    """
+
+    def streamMultipleListHistoricalAlpaca(
+        self,
+        list_symbols,
+        list_dates,
+        timeframe: TimeFrame,
+        exchange_name,
+        on_complete: Callable[[str, pd.DataFrame, Tuple[str, str]], Any],
+        adjustment="all",
+        maxRetries=3,
+        max_in_flight=100,
+    ):
+        return AsyncRunner.run(
+            self.streamMultipleListHistoricalAlpacaAsync(
+                list_symbols,
+                list_dates,
+                timeframe,
+                exchange_name,
+                on_complete,
+                adjustment,
+                maxRetries,
+                max_in_flight,
+            )
+        )
+
+    async def streamMultipleListHistoricalAlpacaAsync(
+        self,
+        list_symbols,
+        list_dates,
+        timeframe: TimeFrame,
+        exchange_name,
+        on_complete: Callable[[str, pd.DataFrame, Tuple[str, str]], Any],
+        adjustment="all",
+        maxRetries=3,
+        max_in_flight=100,
+    ):
+        """
+        Async counterpart of streamMultipleListHistoricalAlpaca. `on_complete` may
+        also be a coroutine function, the next responses are only consumed once
+        it has finished.
+        """
+        n_symbols, n_dates = len(list_symbols), len(list_dates)
+        assert n_symbols == n_dates, "Length mismatch between symbols and dates"
+
+        chunk_symbols, chunk_dates, _ = self.chunkRequestDates(
+            list_symbols, list_dates, exchange_name, self.maxDaysPerRequest(timeframe)
+        )
+        exchange_tz = TradingCalendar.get(exchange_name).tz
+
+        n_complete = 0
+        empty_symbols, partial_symbols = set(), set()
+        async for i, response in self.AsyncObj.stream_historic_data_multiple_base(
+            chunk_symbols,
+            DataType.Bars,
+            chunk_dates,
+            timeframe,
+            adjustment,
+            maxRetries,
+            max_in_flight,
+            self.symbols_per_request,
+        ):
+            stock_symbol = chunk_symbols[i]
+            if isinstance(response, Exception) or response[1].empty:
+                empty_symbols.add(stock_symbol)
+            elif self.isCompleteResponse(response[1], chunk_dates[i], exchange_tz):
+                result = on_complete(stock_symbol, response[1], chunk_dates[i])
+                if inspect.isawaitable(result):
+                    await result
+                n_complete += 1
+            else:
+                partial_symbols.add(stock_symbol)
+
+        print(
+            f"{n_complete} complete window(s), {len(partial_symbols)} partial and "
+            f"{len(empty_symbols)} empty symbol(s)"
+        )
+        partial_symbols.update(empty_symbols)
+        return n_complete, list(partial_symbols)
+
     def getListLiveAlpaca(self, listSymbols) -> Dict[str, dict]:
         return self.AlpacaAPI.get_latest_bars(listSymbols)
 
@@ -199,38 +438,60 @@ class DataExtractor:
         timeframe: TimeFrame,
         adjustment="all",
         maxRetries=3,
+        exchange_name="NYSE",
     ):
-        totalLength = len(self.AlpacaAPI.get_calendar(dateFrom, dateTo))
+        return AsyncRunner.run(
+            self.getListHistoricalAlpacaAsync(
+                listSymbols,
+                dateFrom,
+                dateTo,
+                timeframe,
+                adjustment,
+                maxRetries,
+                exchange_name,
+            )
+        )
 
-        if totalLength > 1000:
-            raise Exception("Alpaca only has data on past 5 years")
+    async def getListHistoricalAlpacaAsync(
+        self,
+        listSymbols,
+        dateFrom,
+        dateTo,
+        timeframe: TimeFrame,
+        adjustment="all",
+        maxRetries=3,
+        exchange_name="NYSE",
+    ):
+        """Async counterpart of getListHistoricalAlpaca."""
+        is_intraday = Timeframes.is_intraday(timeframe)
+        totalLength = self.countTradingDays(dateFrom, dateTo, exchange_name)
 
-        currentRetries = 0
-        thisListSymbols = set(listSymbols)
-        initialDfs = []
-        while currentRetries <= maxRetries and len(thisListSymbols) != 0:
-            currentOutput = self.callHistoricalAlpaca(
-                list(thisListSymbols), dateFrom, dateTo, timeframe, adjustment
-            )
-            initialDfs.extend(
-                [e for e in currentOutput if not isinstance(e, Exception)]
-            )
-            thisSucceededStocks = set(
-                [
-                    f.__getitem__(0)
-                    for f in currentOutput
-                    if not isinstance(f, Exception)
-                ]
-            )
-            thisListSymbols = thisListSymbols.difference(thisSucceededStocks)
-            currentRetries += 1
+        list_dates = [(dateFrom, dateTo) for _ in listSymbols]
         validDfs, partialDfs = [], []
-
-        for df in initialDfs:
-            if len(df.__getitem__(1).index) != totalLength:
-                partialDfs.append(df)
+        for (
+            stock_symbol,
+            fetched_df,
+            is_complete,
+        ) in await self.fetchChunkedWindowsAsync(
+            list(listSymbols),
+            list_dates,
+            timeframe,
+            exchange_name,
+            adjustment,
+            maxRetries,
+        ):
+            if fetched_df is None:
+                continue
+            # Intraday sessions hold a varying number of bars, only the first
+            # and last session of those windows are checked
+            if is_intraday:
+                is_partial = not is_complete
+            else:
+                is_partial = len(fetched_df.index) != totalLength
+            if is_partial:
+                partialDfs.append((stock_symbol, fetched_df))
             else:
-                validDfs.append(df)
+                validDfs.append((stock_symbol, fetched_df))
 
         return validDfs, partialDfs
 
@@ -1,12 +1,25 @@
-from pandas import Index, Timestamp
-from typing import Any, Dict, List, Tuple
+import asyncio
+import functools
+from datetime import datetime, timedelta, timezone
+import json
+from pandas import DatetimeIndex
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
 import warnings
+import numpy as np
 import pandas as pd
-import pandas_market_calendars as mcal
+from DataManager.database_layer.panel import AlignedStockData, StockPanel
 from DataManager.database_layer.tables import DailyStockTableManager
+from DataManager.utils.async_runner import AsyncRunner
+from DataManager.utils.gap_fill import GapFill
+from DataManager.utils.resampler import Resampler
+from DataManager.utils.timeframes import Timeframes
+from DataManager.utils.trading_calendar import TradingCalendar
 from DataManager.utils.timehandler import TimeHandler
 from DataManager.assetmgr.asset_manager import Assets
 from DataManager.datamgr.data_extractor import DataExtractor
+from DataManager.core import DATAMGR_ABS_PATH
 
 
 class DataManager:
@@ -16,6 +29,7 @@ class DataManager:
     Example:
     data = DataManager(limit=10, update_before=True, exchangeName = 'NYSE', isDelisted=True)
     list_of_final_symbols = data.list_of_symbols
+    data.close()  # once done, stops the thread of the async writes
 
     Inputs:
         - Keyword args **criteria:
@@ -26,8 +40,22 @@ class DataManager:
             - `index_name` (optional) (N/A)
         - `limit`: sets a limit on the number of symbols used
         - `asset_db_name`: fully qualified path to the AssetDB
+        - `coverage_db_name`: name of the DB holding the per-symbol coverage index
+            (defaults to one per storage backend)
         - `stock_db_name`: fully qualified path to the Stock_DataDB
         - `update_before`: if True, updates AssetsDB upon instantiation (defaults to False)
+        - `freq_data`: bar timeframe, "1Day" (default) or intraday like "1Min", "5Min", "1Hour"
+        - `storage`: where bars are stored, "marketstore" (default), "parquet", "memmap" or a StorageBackend
+        - `storage_path`: marketstore endpoint, or directory of the local store
+        - `read_batch_size`: symbols per storage query when reading (`None` reads one symbol per query)
+        - `read_workers`: number of threads used across read batches
+        - `read_cache_bytes`: size of the in-process cache of read bars, 0 disables it
+        - `requests_per_minute`: Alpaca rate limit of the account used when fetching
+        - `max_concurrency`: most Alpaca requests in flight at once when fetching
+        - `request_timeout`: timeout of a single Alpaca request in seconds
+        - `max_frames_in_flight`: most fetch requests held in memory at once with `stream=True`
+        - `symbols_per_request`: symbols sharing a missing window fetched with one multi-symbol
+            request (1 sends one request per symbol)
     """
 
     def __init__(
@@ -36,11 +64,26 @@ class DataManager:
         asset_db_name="AssetDB.db",
         update_before=False,
         freq_data="1Day",
+        coverage_db_name=None,
+        storage="marketstore",
+        storage_path=None,
+        read_batch_size=200,
+        read_workers=1,
+        read_cache_bytes=256 * 2**20,
+        requests_per_minute=200,
+        max_concurrency=50,
+        request_timeout=30,
+        max_frames_in_flight=100,
+        symbols_per_request=1,
         **criteria,
     ):
         self._assets = Assets(asset_db_name)
-        self._extractor = DataExtractor()
-        self._daily_stocks = DailyStockTableManager(timeframe=freq_data)
+        self._extractor = DataExtractor(
+            requests_per_minute=requests_per_minute,
+            max_concurrency=max_concurrency,
+            request_timeout=request_timeout,
+            symbols_per_request=symbols_per_request,
+        )
 
         if update_before:
             self._assets.update_all_dbs()
@@ -70,12 +113,32 @@ class DataManager:
                     "Limit is greater than available symbols for defined criteria"
                 )
 
+        self._calendar = TradingCalendar.get(
+            self._exchange_name, os.path.join(DATAMGR_ABS_PATH, "tempDir")
+        )
+        self._daily_stocks = DailyStockTableManager(
+            timeframe=freq_data,
+            coverage_db_name=coverage_db_name,
+            exchange_name=self._exchange_name,
+            storage=storage,
+            storage_path=storage_path,
+            cache_bytes=read_cache_bytes,
+        )
+
         self.freq_data = freq_data
-        self._required_symbols_data, self._required_dates = [], dict()
+        self.read_batch_size = read_batch_size
+        self.read_workers = read_workers
+        self.max_frames_in_flight = max_frames_in_flight
         self.list_of_symbols = []
 
-    def reset_required_vars(self):
-        self._required_symbols_data, self._required_dates = [], dict()
+    def get_read_cache_stats(self) -> Optional[Dict[str, int]]:
+        """Hits, misses, evictions, entries and bytes of the read cache, None if disabled."""
+        cache = self._daily_stocks.cache
+        return cache.stats() if cache is not None else None
+
+    def close(self):
+        """Waits for the pending writes of the async API and stops their thread."""
+        self._daily_stocks.close()
 
     def validate_timestamps(
         self, start_timestamp, end_timestamp
@@ -87,8 +150,7 @@ class DataManager:
                 "DateOutOfRange: start timestamp cannot be later than end timestamp"
             )
 
-        thisExchange = mcal.get_calendar(self._exchange_name)
-        valid_dates_for_ex = thisExchange.valid_days(
+        valid_dates_for_ex = self._calendar.days_in_range(
             TimeHandler.get_alpaca_string_from_string(start_timestamp),
             TimeHandler.get_alpaca_string_from_string(end_timestamp),
         )
@@ -114,178 +176,761 @@ class DataManager:
         fill_data: int = 3,
         fetch_data: bool = True,
         ensure_full_data: bool = True,
+        timestamp_format: str = "datetime",
+        stream: bool = False,
+    ):
+        """
+        Returns {symbol: pandas.DataFrame} of bars between the two timestamps,
+        fetching whatever is missing from `api` first.
+
+        With `stream=True`, every fetched frame is validated, filled and
+        written as soon as it arrives instead of after the whole fetch.
+
+        `timestamp_format` is `datetime` (tz-naive DatetimeIndex), `epoch`
+        (int64 unix seconds index) or `string` (legacy "%Y-%m-%d %H:%M:%S"
+        strings in a `timestamp` column).
+
+        Inside a running event loop, await `get_stock_data_async` instead.
+        """
+        return AsyncRunner.run(
+            self.get_stock_data_async(
+                start_timestamp,
+                end_timestamp,
+                api,
+                fill_data,
+                fetch_data,
+                ensure_full_data,
+                timestamp_format,
+                stream,
+            )
+        )
+
+    async def get_stock_data_async(
+        self,
+        start_timestamp,
+        end_timestamp,
+        api="Alpaca",
+        fill_data: int = 3,
+        fetch_data: bool = True,
+        ensure_full_data: bool = True,
+        timestamp_format: str = "datetime",
+        stream: bool = False,
+    ):
+        """
+        Async counterpart of `get_stock_data`. Fetches run on the caller's
+        event loop and storage reads and writes in worker threads, so several
+        baskets can be fetched concurrently.
+
+        Example:
+        dict_nyse, dict_nasdaq = await asyncio.gather(
+            nyse_manager.get_stock_data_async(start_timestamp, end_timestamp),
+            nasdaq_manager.get_stock_data_async(start_timestamp, end_timestamp),
+        )
+        """
+        (
+            start_timestamp,
+            end_timestamp,
+            _,
+            list_of_symbols,
+        ) = await self._prepare_stock_data_async(
+            start_timestamp, end_timestamp, api, fill_data, fetch_data, stream
+        )
+        return await self._daily_stocks.get_daily_stock_data_async(
+            list_of_symbols,
+            start_timestamp,
+            end_timestamp,
+            ensure_full_data,
+            batch_size=self.read_batch_size,
+            n_workers=self.read_workers,
+            timestamp_format=timestamp_format,
+        )
+
+    def get_stock_panel(
+        self,
+        start_timestamp,
+        end_timestamp,
+        api="Alpaca",
+        fill_data: int = 3,
+        fetch_data: bool = True,
+        fields: Optional[List[str]] = None,
+        dtype=np.float64,
+        stream: bool = False,
+    ) -> StockPanel:
+        """
+        Same as `get_stock_data` but returns one StockPanel aligned on the
+        exchange trading days between the two timestamps (on the regular-hours
+        bars of those days for an intraday `freq_data`). Stored bars are
+        read directly into the panel array; sessions without a bar are NaN.
+        Every symbol of the basket has a row, including those whose bars
+        were partial or not fetched.
+
+        Example:
+        panel = data.get_stock_panel(start_timestamp, end_timestamp, fields=["close"])
+        closes = panel.get_field("close")  # (symbols, dates)
+        """
+        return AsyncRunner.run(
+            self.get_stock_panel_async(
+                start_timestamp,
+                end_timestamp,
+                api,
+                fill_data,
+                fetch_data,
+                fields,
+                dtype,
+                stream,
+            )
+        )
+
+    async def get_stock_panel_async(
+        self,
+        start_timestamp,
+        end_timestamp,
+        api="Alpaca",
+        fill_data: int = 3,
+        fetch_data: bool = True,
+        fields: Optional[List[str]] = None,
+        dtype=np.float64,
+        stream: bool = False,
+    ) -> StockPanel:
+        """Async counterpart of `get_stock_panel`."""
+        start_timestamp, end_timestamp, _, _ = await self._prepare_stock_data_async(
+            start_timestamp, end_timestamp, api, fill_data, fetch_data, stream
+        )
+        return await self._daily_stocks.get_stock_panel_async(
+            sorted(self._basket_of_symbols),
+            start_timestamp,
+            end_timestamp,
+            self._daily_stocks.get_grid_epochs(start_timestamp, end_timestamp),
+            fields=fields,
+            batch_size=self.read_batch_size,
+            n_workers=self.read_workers,
+            dtype=dtype,
+        )
+
+    def get_aligned_stock_data(
+        self,
+        start_timestamp,
+        end_timestamp,
+        api="Alpaca",
+        fill_data: int = 3,
+        fetch_data: bool = True,
+        timestamp_format: str = "datetime",
+        stream: bool = False,
+    ) -> AlignedStockData:
+        """
+        Same as `get_stock_data` but no symbol is dropped for missing bars:
+        every DataFrame is reindexed onto the exchange trading days between
+        the two timestamps (their regular-hours bars for an intraday
+        `freq_data`), with NaN rows where a bar is missing. Symbols whose
+        fetch was partial, or skipped with `fetch_data=False`, keep whatever
+        bars are stored. The returned mask and coverage stats let the caller
+        choose its own threshold.
+
+        Example:
+        aligned = data.get_aligned_stock_data(start_timestamp, end_timestamp)
+        dict_of_dfs = aligned.select(min_coverage=0.95, max_gap=2)
+        """
+        return AsyncRunner.run(
+            self.get_aligned_stock_data_async(
+                start_timestamp,
+                end_timestamp,
+                api,
+                fill_data,
+                fetch_data,
+                timestamp_format,
+                stream,
+            )
+        )
+
+    async def get_aligned_stock_data_async(
+        self,
+        start_timestamp,
+        end_timestamp,
+        api="Alpaca",
+        fill_data: int = 3,
+        fetch_data: bool = True,
+        timestamp_format: str = "datetime",
+        stream: bool = False,
+    ) -> AlignedStockData:
+        """Async counterpart of `get_aligned_stock_data`."""
+        start_timestamp, end_timestamp, _, _ = await self._prepare_stock_data_async(
+            start_timestamp, end_timestamp, api, fill_data, fetch_data, stream
+        )
+        return await self._daily_stocks.get_aligned_stock_data_async(
+            sorted(self._basket_of_symbols),
+            start_timestamp,
+            end_timestamp,
+            self._daily_stocks.get_grid_epochs(start_timestamp, end_timestamp),
+            batch_size=self.read_batch_size or 1,
+            n_workers=self.read_workers,
+            timestamp_format=timestamp_format,
+        )
+
+    def get_resampled_stock_data(
+        self,
+        start_timestamp,
+        end_timestamp,
+        timeframe: str,
+        api="Alpaca",
+        fill_data: int = 3,
+        fetch_data: bool = True,
+        materialize: bool = False,
+        timestamp_format: str = "datetime",
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Returns {symbol: pandas.DataFrame} of `timeframe` bars derived locally
+        from the stored `freq_data` bars, which are fetched first like in
+        `get_stock_data`. `timeframe` should be coarser than `freq_data`,
+        e.g. "1Hour" from "5Min" or "1Week" from "1Day".
+
+        With `materialize=True` the derived bars are also stored, so later
+        calls over the same sessions read them instead of resampling again.
+
+        Example:
+        dict_weekly = data.get_resampled_stock_data(start_timestamp, end_timestamp, "1Week")
+        """
+        return AsyncRunner.run(
+            self.get_resampled_stock_data_async(
+                start_timestamp,
+                end_timestamp,
+                timeframe,
+                api,
+                fill_data,
+                fetch_data,
+                materialize,
+                timestamp_format,
+            )
+        )
+
+    async def get_resampled_stock_data_async(
+        self,
+        start_timestamp,
+        end_timestamp,
+        timeframe: str,
+        api="Alpaca",
+        fill_data: int = 3,
+        fetch_data: bool = True,
+        materialize: bool = False,
+        timestamp_format: str = "datetime",
+    ) -> Dict[str, pd.DataFrame]:
+        """Async counterpart of `get_resampled_stock_data`."""
+        Resampler.check(self.freq_data, timeframe)
+        if not Timeframes.is_intraday(timeframe):
+            # The first and last buckets are fetched whole, up to today
+            requested_end = TimeHandler.get_unix_time_from_string(end_timestamp)
+            start_epoch, end_epoch = Resampler.bucket_range(
+                TimeHandler.get_unix_time_from_string(start_timestamp),
+                requested_end,
+                timeframe,
+            )
+            today = int(datetime.now(timezone.utc).timestamp()) // 86400 * 86400
+            end_epoch = max(min(end_epoch - end_epoch % 86400, today), requested_end)
+            start_timestamp, end_timestamp = (
+                TimeHandler.get_string_from_datetime(
+                    TimeHandler.get_datetime_from_unix_time(epoch)
+                )
+                for epoch in (start_epoch, end_epoch)
+            )
+
+        (
+            start_timestamp,
+            end_timestamp,
+            _,
+            list_of_symbols,
+        ) = await self._prepare_stock_data_async(
+            start_timestamp, end_timestamp, api, fill_data, fetch_data
+        )
+        return await self._daily_stocks.get_resampled_stock_data_async(
+            list_of_symbols,
+            start_timestamp,
+            end_timestamp,
+            timeframe,
+            materialize=materialize,
+            batch_size=self.read_batch_size,
+            n_workers=self.read_workers,
+            timestamp_format=timestamp_format,
+        )
+
+    def prepare_stock_data(
+        self,
+        start_timestamp,
+        end_timestamp,
+        api="Alpaca",
+        fill_data: int = 3,
+        fetch_data: bool = True,
+        stream: bool = False,
     ):
+        """
+        Validates the timestamps, fetches and stores the missing windows and
+        sets `list_of_symbols` to the symbols that can be read. Returns the
+        validated (start_timestamp, end_timestamp, valid_dates).
+        """
+        return AsyncRunner.run(
+            self.prepare_stock_data_async(
+                start_timestamp, end_timestamp, api, fill_data, fetch_data, stream
+            )
+        )
+
+    async def prepare_stock_data_async(
+        self,
+        start_timestamp,
+        end_timestamp,
+        api="Alpaca",
+        fill_data: int = 3,
+        fetch_data: bool = True,
+        stream: bool = False,
+    ):
+        """Async counterpart of `prepare_stock_data`."""
+        (
+            start_timestamp,
+            end_timestamp,
+            valid_dates,
+            _,
+        ) = await self._prepare_stock_data_async(
+            start_timestamp, end_timestamp, api, fill_data, fetch_data, stream
+        )
+        return start_timestamp, end_timestamp, valid_dates
+
+    async def _prepare_stock_data_async(
+        self,
+        start_timestamp,
+        end_timestamp,
+        api="Alpaca",
+        fill_data: int = 3,
+        fetch_data: bool = True,
+        stream: bool = False,
+    ):
+        """
+        Returns (start_timestamp, end_timestamp, valid_dates, list_of_symbols).
+        The required windows are kept local to the call, so concurrent calls
+        on one DataManager do not share state; `list_of_symbols` is still set
+        for the synchronous API.
+        """
         print("Validating Dates...")
-        start_timestamp, end_timestamp, _ = self.validate_timestamps(
+        start_timestamp, end_timestamp, valid_dates = self.validate_timestamps(
             start_timestamp, end_timestamp
         )
         print("Finished validating date\n")
 
         print("Checking dates availability...")
-        for stock in self._basket_of_symbols:
-            self.get_one_stock_data(stock, start_timestamp, end_timestamp)
+        # Coverage can be rebuilt from storage, keep it off the event loop
+        dict_missing_windows = await asyncio.get_running_loop().run_in_executor(
+            None,
+            functools.partial(
+                self._daily_stocks.get_many_missing_windows,
+                self._basket_of_symbols,
+                start_timestamp,
+                end_timestamp,
+            ),
+        )
+        required_dates = {
+            stock: self.get_alpaca_windows(missing_windows)
+            for stock, missing_windows in dict_missing_windows.items()
+            if missing_windows
+        }
         print("Finished checking dates availability!\n")
 
         # No data needs to be fetched
-        if len(self._required_dates) == 0 or fetch_data is False:
+        if len(required_dates) == 0 or fetch_data is False:
             print("All data is available locally or fetch_data set to False")
             self.list_of_symbols = list(
-                set(self._basket_of_symbols) - set(self._required_symbols_data)
-            )
-            return self._daily_stocks.get_daily_stock_data(
-                self.list_of_symbols, start_timestamp, end_timestamp, ensure_full_data
+                set(self._basket_of_symbols) - set(required_dates)
             )
+            return start_timestamp, end_timestamp, valid_dates, self.list_of_symbols
 
         print("Getting data from API.")
+        partial_list_symbols = await self._fetch_and_store_async(
+            api, required_dates, fill_data, stream
+        )
 
-        type_data = self.freq_data
+        self.list_of_symbols = list(
+            set(self._basket_of_symbols).difference(set(partial_list_symbols))
+        )
+        return start_timestamp, end_timestamp, valid_dates, self.list_of_symbols
 
-        # TODO: pass in max retries
-        list_tuples, partial_list_symbols = getattr(
-            self._extractor, f"getMultipleListHistorical{api}"
+    async def _fetch_and_store_async(
+        self,
+        api,
+        required_dates: Dict[str, List[Tuple[str, str]]],
+        fill_data: int = 3,
+        stream: bool = False,
+    ) -> List[str]:
+        """
+        Fetches, fills and writes the required windows, {symbol: [(start, end), ...]}.
+        Returns the symbols whose data was partial or could not be written.
+        """
+        # One request per missing window, a symbol can have several of them
+        list_request_symbols, list_request_dates = [], []
+        for stock, windows in required_dates.items():
+            list_request_symbols.extend([stock] * len(windows))
+            list_request_dates.extend(windows)
+        print(
+            f"Fetching {len(list_request_dates)} missing window(s) for {len(required_dates)} symbol(s)"
+        )
+
+        partial_list_symbols: List[str]
+        if stream:
+            partial_list_symbols = await self.stream_to_storage_async(
+                api, list_request_symbols, list_request_dates, fill_data
+            )
+            print("Finished getting data from API!\n")
+            return partial_list_symbols
+
+        list_tuples, partial_list_symbols = await getattr(
+            self._extractor, f"getMultipleListHistorical{api}Async"
         )(
-            self._required_symbols_data,
-            list(self._required_dates.values()),
-            type_data,
+            list_request_symbols,
+            list_request_dates,
+            self.freq_data,
             self._exchange_name,
         )
 
-        final_list_tuples, ext_partial_symbols = self.fill_list_tuples(
-            list_tuples, fill_data, self._required_dates
+        (
+            final_list_tuples,
+            ext_partial_symbols,
+        ) = await asyncio.get_running_loop().run_in_executor(
+            None,
+            functools.partial(
+                self.fill_list_tuples, list_tuples, fill_data, required_dates
+            ),
         )
         partial_list_symbols.extend(ext_partial_symbols)
         print("Finished getting data from API!\n")
 
         if len(final_list_tuples) != 0:
-            self._daily_stocks.update_daily_stock_data(final_list_tuples)
+            dict_failures = await self._daily_stocks.update_daily_stock_data_async(
+                final_list_tuples
+            )
+            partial_list_symbols.extend(dict_failures)
         else:
             print("All extracted data was found to be partial.")
+        return partial_list_symbols
 
-        self.reset_required_vars()
-        self._extractor.AsyncObj.reset_async_list()
+    def update_bars(
+        self,
+        end_timestamp: Optional[str] = None,
+        default_start_timestamp: str = "2016-01-04 00:00:00",
+        n_workers: int = 4,
+        batch_size: int = 100,
+        checkpoint_path: Optional[str] = None,
+        resume: bool = True,
+        api="Alpaca",
+        fill_data: int = 3,
+    ) -> Dict[str, List[str]]:
+        """
+        Brings the stored bars of every symbol in the basket up to
+        `end_timestamp` (defaults to the last session that has closed, kept
+        in the checkpoint), fetching only the bars after the last stored one
+        of each symbol. Symbols with nothing stored start at
+        `default_start_timestamp`.
+
+        The basket is split into batches of `batch_size` symbols and up to
+        `n_workers` batches are fetched and written concurrently. Finished
+        batches are recorded in the checkpoint file, so with `resume=True` an
+        interrupted run skips them. The checkpoint is removed once all batches
+        are done.
+
+        Returns {"updated": [...], "up_to_date": [...], "partial": [...]}.
+        """
+        return AsyncRunner.run(
+            self.update_bars_async(
+                end_timestamp,
+                default_start_timestamp,
+                n_workers,
+                batch_size,
+                checkpoint_path,
+                resume,
+                api,
+                fill_data,
+            )
+        )
 
-        self.list_of_symbols = list(
-            set(self._basket_of_symbols).difference(set(partial_list_symbols))
+    async def update_bars_async(
+        self,
+        end_timestamp: Optional[str] = None,
+        default_start_timestamp: str = "2016-01-04 00:00:00",
+        n_workers: int = 4,
+        batch_size: int = 100,
+        checkpoint_path: Optional[str] = None,
+        resume: bool = True,
+        api="Alpaca",
+        fill_data: int = 3,
+    ) -> Dict[str, List[str]]:
+        """Async counterpart of `update_bars`."""
+        if checkpoint_path is None:
+            checkpoint_path = os.path.join(
+                DATAMGR_ABS_PATH,
+                "tempDir",
+                f"UpdateBars_{self._daily_stocks.storage.name}_{self._daily_stocks.timeframe}.json",
+            )
+        checkpoint = self._load_checkpoint(checkpoint_path) if resume else None
+
+        if end_timestamp is None and checkpoint is not None:
+            end_timestamp = checkpoint["end_timestamp"]
+        elif end_timestamp is None:
+            # Sessions still open (or not open yet) would be fetched incomplete
+            last_closed_session = self._calendar.last_completed_session()
+            if last_closed_session is None:
+                raise ValueError(f"No completed {self._exchange_name} session yet.")
+            end_timestamp = TimeHandler.get_string_from_timestamp(last_closed_session)
+        _, end_timestamp, _ = self.validate_timestamps(
+            default_start_timestamp, end_timestamp
+        )
+        if checkpoint is not None and checkpoint["end_timestamp"] == end_timestamp:
+            print(
+                f"Resuming update to {end_timestamp}, {len(checkpoint['done'])} symbol(s) already done"
+            )
+        else:
+            checkpoint = {"end_timestamp": end_timestamp, "done": [], "partial": []}
+
+        list_symbols = sorted(set(self._basket_of_symbols) - set(checkpoint["done"]))
+        list_batches = [
+            list_symbols[i : i + batch_size]
+            for i in range(0, len(list_symbols), batch_size)
+        ]
+        dict_results: Dict[str, List[str]] = {
+            "updated": [],
+            "up_to_date": [],
+            "partial": [],
+        }
+        semaphore = asyncio.Semaphore(n_workers)
+
+        def get_required_dates(batch):
+            required_dates = {}
+            for stock in batch:
+                last_epoch = self._daily_stocks.get_last_stored_epoch(stock)
+                start_timestamp = (
+                    default_start_timestamp
+                    if last_epoch is None
+                    else TimeHandler.get_string_from_datetime(
+                        TimeHandler.get_datetime_from_unix_time(last_epoch)
+                        + timedelta(days=1)
+                    )
+                )
+                missing_windows = self._daily_stocks.get_missing_windows(
+                    stock, start_timestamp, end_timestamp
+                )
+                if missing_windows:
+                    required_dates[stock] = self.get_alpaca_windows(missing_windows)
+                else:
+                    dict_results["up_to_date"].append(stock)
+            return required_dates
+
+        async def update_batch(batch):
+            async with semaphore:
+                # Storage reads, run them off the event loop
+                required_dates = await asyncio.get_running_loop().run_in_executor(
+                    None, get_required_dates, batch
+                )
+
+                partial_symbols = set()
+                if required_dates:
+                    partial_symbols = set(
+                        await self._fetch_and_store_async(
+                            api, required_dates, fill_data
+                        )
+                    )
+                dict_results["updated"].extend(
+                    s for s in required_dates if s not in partial_symbols
+                )
+                dict_results["partial"].extend(partial_symbols)
+
+                checkpoint["done"].extend(batch)
+                checkpoint["partial"].extend(partial_symbols)
+                self._save_checkpoint(checkpoint_path, checkpoint)
+                print(
+                    f"Updated {len(checkpoint['done'])}/{len(self._basket_of_symbols)} symbol(s)"
+                )
+
+        await asyncio.gather(*(update_batch(batch) for batch in list_batches))
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        return dict_results
+
+    @staticmethod
+    def _load_checkpoint(checkpoint_path) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(checkpoint_path):
+            return None
+        with open(checkpoint_path) as f:
+            checkpoint: Dict[str, Any] = json.load(f)
+        return checkpoint
+
+    @staticmethod
+    def _save_checkpoint(checkpoint_path, checkpoint: Dict[str, Any]):
+        # Written aside and swapped in, an interrupted save keeps the last checkpoint
+        tmp_path = f"{checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, checkpoint_path)
+
+    def stream_to_storage(
+        self, api, list_request_symbols, list_request_dates, fill_data: int
+    ) -> List[str]:
+        """
+        Fetches the requested windows and fills and writes each frame as soon
+        as it arrives, keeping at most `max_frames_in_flight` frames in memory.
+        Returns the symbols whose data was partial.
+        """
+        return AsyncRunner.run(
+            self.stream_to_storage_async(
+                api, list_request_symbols, list_request_dates, fill_data
+            )
         )
-        return self._daily_stocks.get_daily_stock_data(
-            self.list_of_symbols, start_timestamp, end_timestamp, ensure_full_data
+
+    async def stream_to_storage_async(
+        self, api, list_request_symbols, list_request_dates, fill_data: int
+    ) -> List[str]:
+        """Async counterpart of `stream_to_storage`."""
+        partial_list_symbols: List[str] = []
+        n_written = 0
+
+        async def on_complete(tick, df, date_pair):
+            nonlocal n_written
+            # Long windows arrive in chunks, each one is filled on its own sessions
+            (
+                final_list_tuples,
+                ext_partial_symbols,
+            ) = await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(
+                    self.fill_list_tuples,
+                    [(tick, df)],
+                    fill_data,
+                    {tick: [date_pair]},
+                    verbose=False,
+                ),
+            )
+            partial_list_symbols.extend(ext_partial_symbols)
+            if final_list_tuples:
+                dict_failures = await self._daily_stocks.update_daily_stock_data_async(
+                    final_list_tuples, verbose=False
+                )
+                partial_list_symbols.extend(dict_failures)
+                n_written += 1
+
+        fetch_partial_symbols: List[str]
+        _, fetch_partial_symbols = await getattr(
+            self._extractor, f"streamMultipleListHistorical{api}Async"
+        )(
+            list_request_symbols,
+            list_request_dates,
+            self.freq_data,
+            self._exchange_name,
+            on_complete,
+            max_in_flight=self.max_frames_in_flight,
         )
+        print(f"Wrote {n_written} fetched window(s) to the database")
+        return fetch_partial_symbols + partial_list_symbols
 
-    def fill_list_tuples(self, list_tuples, fill_val, dict_of_req_dates):
+    def fill_list_tuples(
+        self, list_tuples, fill_val, dict_of_req_dates, verbose: bool = True
+    ):
+        """
+        Validates fetched frames against the exchange calendar and forward
+        fills up to `fill_val` missing sessions per frame, for the whole
+        basket in one pass. `dict_of_req_dates` maps every symbol to the list
+        of windows requested for it; each frame is checked against the window
+        it starts in.
+        """
         final_list_tuples = []
         partial_symbols = []
-        thisExchange = mcal.get_calendar(self._exchange_name)
-        needed_timeframes = set(dict_of_req_dates.values())
-        timeframe_to_valid_dates: Dict[str, List[Timestamp]] = dict()
+        needed_timeframes = set(
+            window for windows in dict_of_req_dates.values() for window in windows
+        )
+        bar_seconds = Timeframes.bar_seconds(self.freq_data)
+        timeframe_to_valid_dates: Dict[Tuple[str, str], DatetimeIndex] = dict()
+        # Intraday frames are filled on the regular-hours bars of their sessions
+        timeframe_to_slots: Dict[Tuple[str, str], DatetimeIndex] = dict()
+        max_fill = fill_val
+        # Slots that have not ended yet are not expected, nor filled
+        now = time.time()
+        last_closed_session = self._calendar.last_completed_session(now)
+        if last_closed_session is None:
+            raise ValueError(f"No completed {self._exchange_name} session yet.")
+        # Bars of the session still open may not be published yet
+        open_session_start = np.datetime64(last_closed_session.date(), "D") + 1
         for timeframe in needed_timeframes:
-            valid_dates_for_ex = thisExchange.valid_days(timeframe[0], timeframe[1])
+            valid_dates_for_ex = self._calendar.days_in_range(
+                timeframe[0], timeframe[1]
+            )
             timeframe_to_valid_dates[timeframe] = valid_dates_for_ex
-
-        for i, (tick, df) in enumerate(list_tuples):
-            valid_dates_for_ex = timeframe_to_valid_dates[dict_of_req_dates[tick]]
-            n_valid_dates = len(valid_dates_for_ex)
-            min_len_req = n_valid_dates - fill_val
-            len_df = len(df)
-            if len_df < min_len_req:  # reject this tuple
-                partial_symbols.append(tick)
-            elif len_df < n_valid_dates:  # to fix the df
-                this_df_dates = set(
-                    [TimeHandler.get_string_from_timestamp(date) for date in df.index]
+            timeframe_to_slots[timeframe] = valid_dates_for_ex[
+                valid_dates_for_ex.tz_convert(None) <= last_closed_session
+            ]
+            if bar_seconds and len(valid_dates_for_ex):
+                bar_epochs = self._calendar.bar_epochs_in_range(
+                    timeframe[0], timeframe[1], bar_seconds
                 )
-                valid_dates_for_ex = set(
-                    [
-                        TimeHandler.get_string_from_timestamp(date)
-                        for date in valid_dates_for_ex
-                    ]
+                timeframe_to_slots[timeframe] = (
+                    TimeHandler.get_datetime_index_from_unix_times(
+                        bar_epochs[bar_epochs + bar_seconds <= now]
+                    ).tz_localize("UTC")
                 )
-                missing_dates = valid_dates_for_ex.difference(this_df_dates)
-                missing_dates = list(missing_dates)
-                missing_dates.sort()
-                df = self.fill_missing_dates(df, missing_dates)
-                final_list_tuples.append((tick, df))
+                # `fill_val` counts sessions, in bars that is a full session each
+                bars_per_session = -(-len(bar_epochs) // len(valid_dates_for_ex))
+                max_fill = max(max_fill, fill_val * bars_per_session)
+
+        def window_of(tick, df):
+            first_date = TimeHandler.get_alpaca_string_from_timestamp(df.index[0])
+            for window in dict_of_req_dates[tick]:
+                valid_dates = timeframe_to_valid_dates[window]
+                if (
+                    len(valid_dates)
+                    and TimeHandler.get_alpaca_string_from_timestamp(valid_dates[0])
+                    == first_date
+                ):
+                    return window
+            return None
+
+        list_ticks, list_frames, list_sessions = [], [], []
+        for tick, df in list_tuples:
+            window = window_of(tick, df)
+            if window is None:  # does not line up with any requested window
+                partial_symbols.append(tick)
+                continue
+            list_ticks.append(tick)
+            list_frames.append(df)
+            list_sessions.append(timeframe_to_slots[window])
+
+        list_filled, list_masks = GapFill.fill_frames(
+            list_frames,
+            list_sessions,
+            max_fill=max_fill,
+            bar_seconds=bar_seconds,
+            open_session_start=open_session_start,
+        )
+        n_filled_rows = 0
+        for tick, df, was_filled in zip(list_ticks, list_filled, list_masks):
+            if df is None or was_filled is None:  # too many missing sessions
+                partial_symbols.append(tick)
             else:
+                n_filled_rows += int(was_filled.sum())
                 final_list_tuples.append((tick, df))
+        if verbose:
+            print(f"Filled {n_filled_rows} missing bar(s) from previous bars")
 
         return final_list_tuples, partial_symbols
 
     def fill_missing_dates(self, df: pd.DataFrame, missing_dates: List[str]):
-        df["timestamp_strings"] = df.index
-        df["timestamp_strings"] = df["timestamp_strings"].apply(
-            TimeHandler.get_string_from_timestamp
-        )
-        timestamp_series = df["timestamp_strings"]
-        fallback_timestamp_strings = []
-        for missing_date in missing_dates:
-            fallback_vals = timestamp_series[timestamp_series < missing_date]
-            assert (
-                len(fallback_vals) > 0
-            ), f"LENGTH ERROR: {missing_date=} does not have a fallback value in the dataframe"
-            if fallback_vals.empty:
-                fallback_timestamp_strings.append("")
-            else:
-                fallback_timestamp_strings.append(fallback_vals[-1])
-
-        for to_insert_timestamp_str, fallback_timestamp_str in zip(
-            missing_dates, fallback_timestamp_strings
-        ):
-            if not fallback_timestamp_str:
-                continue
-            df_temp = df.loc[df["timestamp_strings"] == fallback_timestamp_str].copy()
-            t1 = pd.Timestamp(to_insert_timestamp_str).tz_localize("UTC")
-            index: Index = [t1]
-            df_temp.index = index
-            df_temp.index.name = "timestamp"
-            df_temp.drop("timestamp_strings", axis=1, inplace=True)
-            df = pd.concat([df, df_temp], axis=0)
-        df.drop("timestamp_strings", axis=1, inplace=True)
-        df.sort_index(inplace=True)
-        return df
-
-    def get_one_stock_data(self, stock_symbol, start_timestamp, end_timestamp):
-        (
-            statusTimestamp,
-            req_start,
-            req_end,
-        ) = self._daily_stocks.check_data_availability(
-            stock_symbol, start_timestamp, end_timestamp
-        )
-        if statusTimestamp:
-
-            if req_start and req_end:
-                self._required_symbols_data.append(stock_symbol)
-                self._required_dates[stock_symbol] = (
-                    TimeHandler.get_alpaca_string_from_string(
-                        TimeHandler.get_string_from_datetime(req_start)
-                    ),
-                    TimeHandler.get_alpaca_string_from_string(
-                        TimeHandler.get_string_from_datetime(req_end)
-                    ),
-                )
-
-            elif req_start:
-                self._required_symbols_data.append(stock_symbol)
-                self._required_dates[stock_symbol] = (
-                    TimeHandler.get_alpaca_string_from_string(start_timestamp),
-                    TimeHandler.get_alpaca_string_from_string(
-                        TimeHandler.get_string_from_datetime(req_start)
-                    ),
-                )
-
-            elif req_end:
-                self._required_symbols_data.append(stock_symbol)
-                self._required_dates[stock_symbol] = (
-                    TimeHandler.get_alpaca_string_from_string(
-                        TimeHandler.get_string_from_datetime(req_end)
-                    ),
-                    TimeHandler.get_alpaca_string_from_string(end_timestamp),
-                )
-
-        else:
-            self._required_symbols_data.append(stock_symbol)
-            self._required_dates[stock_symbol] = (
-                TimeHandler.get_alpaca_string_from_string(start_timestamp),
-                TimeHandler.get_alpaca_string_from_string(end_timestamp),
+        valid_dates = GapFill.get_session_dates(df.index).union(
+            GapFill.get_session_dates(DatetimeIndex(missing_dates))
+        )
+        (filled_df,), _ = GapFill.fill_frames([df], [valid_dates])
+        assert (
+            filled_df is not None
+        ), "LENGTH ERROR: missing dates do not have a fallback value in the dataframe"
+        return filled_df
+
+    @staticmethod
+    def get_alpaca_windows(missing_windows) -> List[Tuple[str, str]]:
+        return [
+            (
+                TimeHandler.get_alpaca_string_from_datetime(window_start),
+                TimeHandler.get_alpaca_string_from_datetime(window_end),
             )
+            for window_start, window_end in missing_windows
+        ]
 
 
 if __name__ == "__main__":
@@ -308,4 +953,5 @@ if __name__ == "__main__":
     )
 
     list_of_final_symbols = this_manager.list_of_symbols
+    this_manager.close()
     assert len(set([len(df) for _, df in dict_of_dfs.items()])) == 1
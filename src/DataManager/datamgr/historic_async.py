@@ -1,11 +1,18 @@
+import contextlib
+import functools
 from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+import aiohttp
 import alpaca_trade_api as tradeapi
 import asyncio
 import sys
 from alpaca_trade_api.rest import TimeFrame, URL
-from alpaca_trade_api.rest_async import gather_with_concurrency, AsyncRest
+from alpaca_trade_api.entity_v2 import BarsV2
+from alpaca_trade_api.rest_async import AsyncRest
 from DataManager import core
+from DataManager.datamgr.request_scheduler import AlpacaHTTPError, RequestScheduler
 import os
+import pandas as pd
 
 
 class DataType(str, Enum):
@@ -14,24 +21,177 @@ class DataType(str, Enum):
     Quotes = "Quotes"
 
 
+class ScheduledAsyncRest(AsyncRest):
+    """
+    AsyncRest that takes a token from the scheduler before every page request
+    and raises AlpacaHTTPError on error responses instead of yielding them as
+    empty pages.
+
+    Requests share one pooled keep-alive session while a `pooled_session`
+    block is open, with at most `max_concurrency` requests in flight and a
+    `request_timeout` (seconds) on each of them.
+    """
+
+    # Most bars Alpaca returns in one page
+    MAX_PAGE_SIZE = 10000
+
+    def __init__(
+        self,
+        scheduler: RequestScheduler,
+        *args,
+        max_concurrency: int = 50,
+        request_timeout: float = 30,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._session_users = 0
+
+    @contextlib.asynccontextmanager
+    async def pooled_session(self):
+        if self._session is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            )
+        self._session_users += 1
+        try:
+            yield self._session
+        finally:
+            self._session_users -= 1
+            if self._session_users == 0:
+                session, self._session = self._session, None
+                await session.close()
+
+    async def _request(self, url, payload):
+        opts = self._get_opts(payload)
+        async with self.pooled_session() as session:
+            # Created with the session, so it belongs to the running loop
+            semaphore = self._semaphore
+            assert semaphore is not None
+            while 1:
+                async with semaphore:
+                    await self.scheduler.bucket.acquire()
+                    async with session.get(url, **opts) as response:
+                        self.scheduler.update_from_headers(response.headers)
+                        if response.status >= 400:
+                            retry_after = response.headers.get("Retry-After")
+                            raise AlpacaHTTPError(
+                                response.status,
+                                await response.text(),
+                                (
+                                    float(retry_after)
+                                    if retry_after and retry_after.isdigit()
+                                    else None
+                                ),
+                            )
+                        response = await response.json()
+
+                page_token = response.get("next_page_token")
+                payload["page_token"] = page_token
+                yield response
+
+                if not page_token:
+                    break
+
+    async def get_bars_async(
+        self, symbol, start, end, timeframe, limit=None, adjustment="raw"
+    ):
+        """
+        Bars of one symbol over one window, following every page of the
+        single-symbol endpoint. AsyncRest stops at its default `limit` of 1000
+        bars, here `limit` caps the result only when set.
+        """
+        payload = {
+            "adjustment": adjustment,
+            "start": start,
+            "end": end,
+            "timeframe": timeframe,
+            "limit": min(limit or self.MAX_PAGE_SIZE, self.MAX_PAGE_SIZE),
+        }
+        bars: List[Dict[str, Any]] = []
+        async for packet in self._request(
+            self._get_historic_url("bars", symbol), payload
+        ):
+            bars.extend(packet.get("bars") or [])
+            if limit is not None and len(bars) >= limit:
+                bars = bars[:limit]
+                break
+        return symbol, BarsV2(bars).df if bars else pd.DataFrame({})
+
+    def _get_multi_historic_url(self, _type):
+        return f"{self._data_url}/v2/stocks/{_type}"
+
+    async def get_multi_bars_async(
+        self, symbols, start, end, timeframe, adjustment="raw", limit=MAX_PAGE_SIZE
+    ):
+        """
+        Bars of many symbols over one window with a single paginated request
+        to the multi-symbol endpoint. Returns [(symbol, dataframe)] for every
+        requested symbol, with an empty frame for symbols without bars.
+        """
+        payload = {
+            "symbols": ",".join(symbols),
+            "adjustment": adjustment,
+            "start": start,
+            "end": end,
+            "timeframe": timeframe,
+            "limit": limit,
+        }
+        symbol_bars: Dict[str, List[Dict[str, Any]]] = {
+            symbol: [] for symbol in symbols
+        }
+        async for packet in self._request(
+            self._get_multi_historic_url("bars"), payload
+        ):
+            for symbol, bars in (packet.get("bars") or {}).items():
+                symbol_bars.setdefault(symbol, []).extend(bars)
+
+        return [
+            (symbol, BarsV2(bars).df if bars else pd.DataFrame({}))
+            for symbol, bars in symbol_bars.items()
+        ]
+
+
 class HistoricalAsync:
-    def __init__(self):
+    """
+    Inputs:
+        - `requests_per_minute`: Alpaca rate limit of the account, the token bucket refills at this rate
+        - `max_retries`: retries per request on 429s, 5xx responses and timeouts
+        - `max_concurrency`: most requests in flight at once over the pooled session
+        - `request_timeout`: timeout of a single HTTP request in seconds
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = 200,
+        max_retries: int = 3,
+        max_concurrency: int = 50,
+        request_timeout: float = 30,
+    ):
         core.setEnv()
         api_key_id = os.environ.get("APCA_API_KEY_ID")
         api_secret = os.environ.get("APCA_API_SECRET_KEY")
         base_url = os.environ.get("APCA_API_BASE_URL")
 
-        self.rest = AsyncRest(key_id=api_key_id, secret_key=api_secret)
+        self.scheduler = RequestScheduler(requests_per_minute, max_retries)
+        self.rest = ScheduledAsyncRest(
+            self.scheduler,
+            key_id=api_key_id,
+            secret_key=api_secret,
+            max_concurrency=max_concurrency,
+            request_timeout=request_timeout,
+        )
 
         self.api = tradeapi.REST(
             key_id=api_key_id, secret_key=api_secret, base_url=URL(base_url)
         )
 
-        self.resultAsync = []
-
-    def reset_async_list(self):
-        self.resultAsync = []
-
     def get_data_method(self, data_type: DataType):
         if data_type == DataType.Bars:
             return self.rest.get_bars_async
@@ -50,10 +210,12 @@ class HistoricalAsync:
         end,
         timeframe: TimeFrame = None,
         adjustmentInput="raw",
+        max_retries=None,
     ):
         """
         base function to use with all
         :param adjustmentInput:
+        :param max_retries: retries per symbol (scheduler default if None)
         :param symbols:
         :param start:
         :param end:
@@ -76,13 +238,19 @@ class HistoricalAsync:
                 [symbol, start, end, timeframe] if timeframe else [symbol, start, end]
             )
             tasks.append(
-                self.get_data_method(data_type)(*args, adjustment=adjustmentInput)
+                self.scheduler.run(
+                    functools.partial(
+                        self.get_data_method(data_type),
+                        *args,
+                        adjustment=adjustmentInput,
+                    ),
+                    max_retries,
+                )
             )
 
-        if minor >= 8:
+        # Concurrency is bounded by the rest client, all tasks share its session
+        async with self.rest.pooled_session():
             results = await asyncio.gather(*tasks, return_exceptions=True)
-        else:
-            results = await gather_with_concurrency(500, *tasks)
 
         bad_requests = 0
         for response in results:
@@ -98,6 +266,62 @@ class HistoricalAsync:
 
         return results
 
+    def _build_requests(
+        self,
+        symbols,
+        data_type: DataType,
+        list_dates,
+        timeframe: TimeFrame = None,
+        adjustmentInput="raw",
+        symbols_per_request: int = 1,
+    ) -> List[Tuple[List[int], Callable[[], Awaitable[List[Any]]]]]:
+        """
+        One (indices, make_request) pair per HTTP request to send, where
+        make_request() returns the responses of the `symbols` at `indices`.
+        With `symbols_per_request` > 1, bar requests of symbols sharing the same
+        (start, end) window are grouped into multi-symbol requests.
+        """
+        data_method = self.get_data_method(data_type)
+
+        def single_request(i):
+            args = (
+                [symbols[i], list_dates[i][0], list_dates[i][1], timeframe]
+                if timeframe
+                else [symbols[i], list_dates[i][0], list_dates[i][1]]
+            )
+
+            async def make_request():
+                return [await data_method(*args, adjustment=adjustmentInput)]
+
+            return [i], make_request
+
+        def batch_request(indices, window):
+            async def make_request():
+                frames = dict(
+                    await self.rest.get_multi_bars_async(
+                        list(dict.fromkeys(symbols[i] for i in indices)),
+                        window[0],
+                        window[1],
+                        timeframe,
+                        adjustment=adjustmentInput,
+                    )
+                )
+                return [(symbols[i], frames[symbols[i]]) for i in indices]
+
+            return indices, make_request
+
+        if symbols_per_request <= 1 or data_type != DataType.Bars:
+            return [single_request(i) for i in range(len(symbols))]
+
+        windows: Dict[Tuple[str, str], List[int]] = {}
+        for i, date_pair in enumerate(list_dates):
+            windows.setdefault(tuple(date_pair), []).append(i)
+        return [
+            batch_request(indices[k : k + symbols_per_request], window)
+            for window, indices in windows.items()
+            for k in range(0, len(indices), symbols_per_request)
+        ]
+
     async def get_historic_data_multiple_base(
         self,
         symbols,
@@ -105,10 +329,14 @@ class HistoricalAsync:
         list_dates,
         timeframe: TimeFrame = None,
         adjustmentInput="raw",
+        max_retries=None,
+        symbols_per_request: int = 1,
     ):
         """
         base function to use with all
         :param adjustmentInput:
+        :param max_retries: retries per request (scheduler default if None)
+        :param symbols_per_request: symbols per multi-symbol bars request (1 for one request per symbol)
         :param symbols:
         :param start:
         :param end:
@@ -119,27 +347,33 @@ class HistoricalAsync:
         minor = sys.version_info.minor
         if major < 3 or minor < 6:
             raise Exception("asyncio is not support in your python version")
+        requests = self._build_requests(
+            symbols,
+            data_type,
+            list_dates,
+            timeframe,
+            adjustmentInput,
+            symbols_per_request,
+        )
         msg = f"Getting {data_type} data for {len(symbols)} symbols"
         msg += f", timeframe: {timeframe}" if timeframe else ""
-        msg += " between dates specified in the list"
+        msg += f" between dates specified in the list ({len(requests)} requests)"
         print(msg)
 
-        tasks = []
-
-        for i, symbol in enumerate(symbols):
-            args = (
-                [symbol, list_dates[i][0], list_dates[i][1], timeframe]
-                if timeframe
-                else [symbol, list_dates[i][0], list_dates[i][1]]
-            )
-            tasks.append(
-                self.get_data_method(data_type)(*args, adjustment=adjustmentInput)
+        # Concurrency is bounded by the rest client, all tasks share its session
+        async with self.rest.pooled_session():
+            outputs = await asyncio.gather(
+                *[
+                    self.scheduler.run(make_request, max_retries)
+                    for _, make_request in requests
+                ],
+                return_exceptions=True,
             )
 
-        if minor >= 8:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-        else:
-            results = await gather_with_concurrency(500, *tasks)
+        results: List[Any] = [None] * len(symbols)
+        for (indices, _), output in zip(requests, outputs):
+            for i, response in zip(indices, self._scatter(output, indices)):
+                results[i] = response
 
         bad_requests = 0
         for response in results:
@@ -155,22 +389,106 @@ class HistoricalAsync:
 
         return results
 
+    @staticmethod
+    def _scatter(
+        output: Union[List[Any], BaseException], indices: List[int]
+    ) -> List[Any]:
+        """Responses of one request, or its exception repeated for every symbol in it."""
+        if isinstance(output, BaseException):
+            return [output] * len(indices)
+        return output
+
+    async def stream_historic_data_multiple_base(
+        self,
+        symbols,
+        data_type: DataType,
+        list_dates,
+        timeframe: TimeFrame = None,
+        adjustmentInput="raw",
+        max_retries=None,
+        max_in_flight: int = 100,
+        symbols_per_request: int = 1,
+    ):
+        """
+        Same requests as get_historic_data_multiple_base, but yields
+        (index, response) pairs as soon as each request completes. At most
+        `max_in_flight` requests are pending or waiting for the consumer, so
+        new requests only start once finished responses have been consumed.
+        :param max_in_flight: bound on requests whose responses are held in memory at once
+        :return: async generator of (index in `symbols`, response or Exception)
+        """
+        requests = self._build_requests(
+            symbols,
+            data_type,
+            list_dates,
+            timeframe,
+            adjustmentInput,
+            symbols_per_request,
+        )
+        msg = f"Streaming {data_type} data for {len(symbols)} symbols"
+        msg += f", timeframe: {timeframe}" if timeframe else ""
+        msg += f" between dates specified in the list ({len(requests)} requests)"
+        print(msg)
+
+        pending: Dict["asyncio.Future[Any]", List[int]] = {}
+        next_request = 0
+        async with self.rest.pooled_session():
+            try:
+                while next_request < len(requests) or pending:
+                    while next_request < len(requests) and len(pending) < max_in_flight:
+                        indices, make_request = requests[next_request]
+                        future: "asyncio.Future[Any]" = asyncio.ensure_future(
+                            self.scheduler.run(make_request, max_retries)
+                        )
+                        pending[future] = indices
+                        next_request += 1
+                    done, _ = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        indices = pending.pop(future)
+                        exception = future.exception()
+                        output = exception if exception is not None else future.result()
+                        for i, response in zip(indices, self._scatter(output, indices)):
+                            yield i, response
+            finally:
+                for future in pending:
+                    future.cancel()
+
     async def get_historic_bars(
-        self, symbols, start, end, timeframe: TimeFrame, adjustmentInput="raw"
+        self,
+        symbols,
+        start,
+        end,
+        timeframe: TimeFrame,
+        adjustmentInput="raw",
+        max_retries=None,
     ):
-        self.resultAsync = await self.get_historic_data_base(
-            symbols, DataType.Bars, start, end, timeframe, adjustmentInput
+        return await self.get_historic_data_base(
+            symbols, DataType.Bars, start, end, timeframe, adjustmentInput, max_retries
         )
 
     async def get_multiple_dates_historic_bars(
-        self, symbols, list_dates, timeframe: TimeFrame, adjustmentInput="raw"
+        self,
+        symbols,
+        list_dates,
+        timeframe: TimeFrame,
+        adjustmentInput="raw",
+        max_retries=None,
+        symbols_per_request: int = 1,
     ):
-        self.resultAsync = await self.get_historic_data_multiple_base(
-            symbols, DataType.Bars, list_dates, timeframe, adjustmentInput
+        return await self.get_historic_data_multiple_base(
+            symbols,
+            DataType.Bars,
+            list_dates,
+            timeframe,
+            adjustmentInput,
+            max_retries,
+            symbols_per_request,
         )
 
     async def get_historic_trades(self, symbols, start, end, timeframe: TimeFrame):
-        await self.get_historic_data_base(symbols, DataType.Trades, start, end)
+        return await self.get_historic_data_base(symbols, DataType.Trades, start, end)
 
     async def get_historic_quotes(self, symbols, start, end, timeframe: TimeFrame):
-        await self.get_historic_data_base(symbols, DataType.Quotes, start, end)
+        return await self.get_historic_data_base(symbols, DataType.Quotes, start, end)
@@ -0,0 +1,133 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+import aiohttp
+
+T = TypeVar("T")
+
+
+class AlpacaHTTPError(Exception):
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Asyncio token bucket sized to a requests-per-minute limit.
+
+    `acquire` reserves a token before waiting, so concurrent callers queue up
+    in order without a lock and never exceed the configured rate.
+    """
+
+    def __init__(self, requests_per_minute: int = 200):
+        self.set_limit(requests_per_minute)
+        self._tokens = float(self.capacity)
+        self._last_refill = time.monotonic()
+
+    def set_limit(self, requests_per_minute: int):
+        self.capacity = max(int(requests_per_minute), 1)
+        self.rate = self.capacity / 60.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._last_refill) * self.rate
+        )
+        self._last_refill = now
+
+    async def acquire(self):
+        self._refill()
+        self._tokens -= 1
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+    def pause(self, seconds: float):
+        """Holds every caller back for at least `seconds` (e.g. after a 429)."""
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, keyed on the error class.
+
+    429s wait for the server's Retry-After when given, 5xx responses and
+    timeouts/connection errors back off exponentially, other errors (4xx,
+    parsing errors) are not retried.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @staticmethod
+    def is_retryable(error: BaseException) -> bool:
+        if isinstance(error, AlpacaHTTPError):
+            return error.status == 429 or error.status >= 500
+        return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectionError))
+
+    def get_delay(self, error: BaseException, attempt: int) -> float:
+        backoff = min(self.max_delay, self.base_delay * 2**attempt)
+        if isinstance(error, AlpacaHTTPError) and error.status == 429:
+            if error.retry_after is not None:
+                return error.retry_after + random.uniform(0, self.base_delay)
+            # Rate limited: back off harder than for a transient server error
+            backoff = min(self.max_delay, backoff * 2)
+        return random.uniform(0, backoff)
+
+
+class RequestScheduler:
+    """
+    Runs requests under a shared token bucket and retries each one on its
+    own with the retry policy, instead of sleeping a fixed amount between
+    rounds of requests.
+
+    Inputs:
+        - `requests_per_minute`: the account's Alpaca rate limit
+        - `max_retries`: retries per request for retryable errors
+    """
+
+    def __init__(self, requests_per_minute: int = 200, max_retries: int = 3):
+        self.bucket = TokenBucket(requests_per_minute)
+        self.retry_policy = RetryPolicy(max_retries=max_retries)
+
+    def update_from_headers(self, headers):
+        """Follows the X-RateLimit-* headers Alpaca sends with every response."""
+        limit = headers.get("X-RateLimit-Limit")
+        if limit and limit.isdigit() and int(limit) != self.bucket.capacity:
+            self.bucket.set_limit(int(limit))
+        remaining, reset = headers.get("X-RateLimit-Remaining"), headers.get(
+            "X-RateLimit-Reset"
+        )
+        if remaining == "0" and reset and reset.isdigit():
+            self.bucket.pause(max(int(reset) - time.time(), 0))
+
+    async def run(
+        self,
+        make_request: Callable[[], Awaitable[T]],
+        max_retries: Optional[int] = None,
+    ) -> T:
+        max_retries = (
+            self.retry_policy.max_retries if max_retries is None else max_retries
+        )
+        attempt = 0
+        while True:
+            try:
+                return await make_request()
+            except Exception as e:
+                if attempt >= max_retries or not self.retry_policy.is_retryable(e):
+                    raise
+                delay = self.retry_policy.get_delay(e, attempt)
+                if isinstance(e, AlpacaHTTPError) and e.status == 429:
+                    self.bucket.pause(delay)
+                attempt += 1
+                await asyncio.sleep(delay)
@@ -1,3 +1,4 @@
+from typing import Optional
 import typer
 import DataManager.config_files.set_config_file as cfg_setter
 
@@ -41,6 +42,56 @@ def uninstall():
     print_msg_typer(*(cfg_setter.delete_temp_files()))
 
 
+@app.command()
+def update_bars(
+    end: Optional[str] = typer.Option(
+        None,
+        help="Last day to update, YYYY-MM-DD (defaults to the last closed session)",
+    ),
+    start: str = typer.Option(
+        "2016-01-04", help="First day fetched for symbols with no stored bars"
+    ),
+    exchange: str = typer.Option("NYSE", help="Exchange of the symbols to update"),
+    limit: Optional[int] = typer.Option(None, help="Update at most this many symbols"),
+    workers: int = typer.Option(4, help="Batches fetched and written concurrently"),
+    batch_size: int = typer.Option(100, help="Symbols per checkpointed batch"),
+    storage: str = typer.Option("marketstore", help="marketstore, parquet or memmap"),
+    storage_path: Optional[str] = typer.Option(
+        None, help="marketstore endpoint or local store directory"
+    ),
+    update_assets: bool = typer.Option(
+        False, help="Refresh the asset DB before updating"
+    ),
+    restart: bool = typer.Option(
+        False, help="Ignore the checkpoint left by an interrupted run"
+    ),
+):
+    # Imported here so the config commands work without the data stack
+    from DataManager.datamgr.data_manager import DataManager
+
+    manager = DataManager(
+        limit=limit,
+        update_before=update_assets,
+        exchangeName=exchange,
+        isDelisted=False,
+        storage=storage,
+        storage_path=storage_path,
+    )
+    dict_results = manager.update_bars(
+        end_timestamp=f"{end} 00:00:00" if end else None,
+        default_start_timestamp=f"{start} 00:00:00",
+        n_workers=workers,
+        batch_size=batch_size,
+        resume=not restart,
+    )
+    print_msg_typer(
+        True,
+        f"{len(dict_results['updated'])} symbol(s) updated, "
+        f"{len(dict_results['up_to_date'])} already up to date, "
+        f"{len(dict_results['partial'])} partial",
+    )
+
+
 def print_msg_typer(success, msg):
     if not success:
         typer.echo(f"ERROR: {msg}")
@@ -0,0 +1,26 @@
+import asyncio
+from typing import Any, Coroutine, TypeVar
+
+T = TypeVar("T")
+
+
+class AsyncRunner:
+    """
+    Runs the async API from synchronous code.
+
+    Example:
+    data = AsyncRunner.run(manager.get_stock_data_async(start_timestamp, end_timestamp))
+    """
+
+    @staticmethod
+    def run(coro: Coroutine[Any, Any, T]) -> T:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+
+        coro.close()
+        raise RuntimeError(
+            "The synchronous API cannot be used inside a running event loop, "
+            "await its *_async counterpart instead."
+        )
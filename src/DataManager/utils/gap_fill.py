@@ -0,0 +1,127 @@
+import functools
+from typing import List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+
+class GapFill:
+    """
+    Forward fills bar frames onto their trading-session grids.
+
+    Every frame is reindexed against its own sorted sessions in a single
+    stacked reindex + grouped forward fill over the whole basket, instead of
+    inserting missing rows one at a time.
+    """
+
+    @staticmethod
+    def get_session_dates(index: pd.DatetimeIndex) -> pd.DatetimeIndex:
+        """tz-naive UTC midnight of every timestamp in `index`."""
+        if index.tz is not None:
+            index = index.tz_convert(None)
+        return index.normalize()
+
+    @staticmethod
+    def get_bar_starts(index: pd.DatetimeIndex, bar_seconds: int) -> pd.DatetimeIndex:
+        """tz-naive UTC start of the `bar_seconds` long bar of every timestamp in `index`."""
+        if index.tz is not None:
+            index = index.tz_convert(None)
+        return index.floor(f"{bar_seconds}s")
+
+    @staticmethod
+    def fill_frames(
+        list_frames: List[pd.DataFrame],
+        list_sessions: List[pd.DatetimeIndex],
+        max_fill: Optional[int] = None,
+        bar_seconds: Optional[int] = None,
+        open_session_start: Optional[np.datetime64] = None,
+    ) -> Tuple[List[Optional[pd.DataFrame]], List[Optional[np.ndarray]]]:
+        """
+        Inputs:
+            - `list_frames`: bar frames indexed by timestamp
+            - `list_sessions`: the sessions each frame should cover (same order)
+            - `max_fill`: most sessions that may be filled in one frame (no limit if None)
+            - `bar_seconds`: for intraday frames, `list_sessions` holds the bar
+                start times to cover instead of sessions
+            - `open_session_start`: tz-naive UTC start of the sessions that are
+                still open, their bars past the last one of a frame are not filled
+
+        Returns (filled_frames, was_filled_masks). Frames are indexed by the
+        UTC midnight of each session; a frame that needs more than `max_fill`
+        fills, or whose first session is missing, is returned as None.
+        Intraday frames are indexed by bar start, bars missing before the
+        first one of a frame (or after its last one in an open session) are
+        dropped instead of rejecting the frame.
+        """
+        if bar_seconds is None:
+            slots_of = GapFill.get_session_dates
+        else:
+            slots_of = functools.partial(
+                GapFill.get_bar_starts, bar_seconds=bar_seconds
+            )
+
+        n_frames = len(list_frames)
+        if n_frames == 0:
+            return [], []
+
+        keys = np.arange(n_frames)
+        stacked = pd.concat(
+            [df.set_axis(slots_of(df.index), axis=0) for df in list_frames],
+            keys=keys,
+            names=["key", "timestamp"],
+        )
+        stacked = stacked[~stacked.index.duplicated(keep="last")]
+
+        lengths = np.array([len(sessions) for sessions in list_sessions])
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        session_dates = np.concatenate(
+            [slots_of(pd.DatetimeIndex(s)).values for s in list_sessions]
+        )
+        target = pd.MultiIndex.from_arrays(
+            [np.repeat(keys, lengths), pd.DatetimeIndex(session_dates)],
+            names=["key", "timestamp"],
+        )
+
+        reindexed = stacked.reindex(target)
+        was_filled = reindexed.isna().all(axis=1).to_numpy()
+        filled = reindexed.groupby(level="key").ffill()
+
+        # Leading slots of a frame that are left unfilled (intraday only)
+        n_lead = np.zeros(n_frames, dtype=np.int64)
+        # Trailing slots of an open session that are left unfilled (intraday only)
+        n_trail = np.zeros(n_frames, dtype=np.int64)
+        if bar_seconds is not None:
+            for key in keys[lengths > 0]:
+                present = ~was_filled[offsets[key] : offsets[key + 1]]
+                n_lead[key] = np.argmax(present) if present.any() else lengths[key]
+                if open_session_start is not None and present.any():
+                    n_open = lengths[key] - np.searchsorted(
+                        session_dates[offsets[key] : offsets[key + 1]],
+                        open_session_start,
+                    )
+                    n_trail[key] = min(n_open, np.argmax(present[::-1]))
+
+        n_filled = np.add.reduceat(
+            np.append(was_filled, False).astype(np.int64), offsets[:-1]
+        )
+        n_filled[lengths == 0] = 0
+        n_filled -= n_lead + n_trail
+        has_slots = lengths > n_lead + n_trail
+        has_first = np.ones(n_frames, dtype=bool)
+        has_first[has_slots] = ~was_filled[(offsets[:-1] + n_lead)[has_slots]]
+        accepted = has_first & has_slots
+        if max_fill is not None:
+            accepted &= n_filled <= max_fill
+
+        list_filled: List[Optional[pd.DataFrame]] = []
+        list_masks: List[Optional[np.ndarray]] = []
+        for key in keys:
+            if not accepted[key]:
+                list_filled.append(None)
+                list_masks.append(None)
+                continue
+            start, end = offsets[key] + n_lead[key], offsets[key + 1] - n_trail[key]
+            df = filled.iloc[start:end].droplevel("key")
+            df.index = df.index.tz_localize("UTC")
+            list_filled.append(df)
+            list_masks.append(was_filled[start:end])
+        return list_filled, list_masks
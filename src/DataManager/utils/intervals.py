@@ -0,0 +1,83 @@
+from typing import List, Tuple
+import numpy as np
+
+Interval = Tuple[int, int]
+
+
+class Intervals:
+    """
+    Helpers for sets of closed intervals of trading sessions.
+
+    Intervals are (first_epoch, last_epoch) pairs where both ends are session
+    epochs (unix seconds) taken from a sorted `sessions` array. Two intervals
+    are contiguous when no session lies between them, so weekends and holidays
+    never show up as holes.
+    """
+
+    @staticmethod
+    def _runs(positions: np.ndarray) -> List[Tuple[int, int]]:
+        if len(positions) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(positions) != 1)
+        run_starts = np.concatenate(([0], breaks + 1))
+        run_ends = np.concatenate((breaks, [len(positions) - 1]))
+        return [
+            (int(positions[s]), int(positions[e])) for s, e in zip(run_starts, run_ends)
+        ]
+
+    @staticmethod
+    def _covered_mask(intervals: List[Interval], sessions: np.ndarray) -> np.ndarray:
+        if not intervals or len(sessions) == 0:
+            return np.zeros(len(sessions), dtype=bool)
+        starts = np.array([start for start, _ in intervals], dtype=np.int64)
+        ends = np.array([end for _, end in intervals], dtype=np.int64)
+        idx = np.searchsorted(starts, sessions, side="right") - 1
+        return (idx >= 0) & (sessions <= ends[np.maximum(idx, 0)])
+
+    @staticmethod
+    def from_epochs(epochs: np.ndarray, sessions: np.ndarray) -> List[Interval]:
+        """Runs of consecutive sessions present in `epochs`."""
+        if len(epochs) == 0 or len(sessions) == 0:
+            return []
+        positions = np.searchsorted(sessions, epochs)
+        in_range = positions < len(sessions)
+        positions = positions[in_range]
+        positions = np.unique(positions[sessions[positions] == epochs[in_range]])
+        return [
+            (int(sessions[s]), int(sessions[e])) for s, e in Intervals._runs(positions)
+        ]
+
+    @staticmethod
+    def merge(intervals: List[Interval], sessions: np.ndarray) -> List[Interval]:
+        """Union of intervals, joining the ones with no session between them."""
+        if not intervals:
+            return []
+        positions = [
+            (
+                int(np.searchsorted(sessions, start, side="left")),
+                int(np.searchsorted(sessions, end, side="right")) - 1,
+            )
+            for start, end in sorted(intervals)
+        ]
+        merged: List[List[int]] = []
+        for start_pos, end_pos in positions:
+            if end_pos < start_pos:
+                continue
+            if merged and start_pos <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end_pos)
+            else:
+                merged.append([start_pos, end_pos])
+        return [(int(sessions[s]), int(sessions[e])) for s, e in merged]
+
+    @staticmethod
+    def missing(intervals: List[Interval], sessions: np.ndarray) -> List[Interval]:
+        """Runs of `sessions` that are not covered by any interval."""
+        covered = Intervals._covered_mask(intervals, sessions)
+        return [
+            (int(sessions[s]), int(sessions[e]))
+            for s, e in Intervals._runs(np.flatnonzero(~covered))
+        ]
+
+    @staticmethod
+    def count(intervals: List[Interval], sessions: np.ndarray) -> int:
+        return int(np.count_nonzero(Intervals._covered_mask(intervals, sessions)))
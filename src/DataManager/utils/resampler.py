@@ -0,0 +1,113 @@
+from typing import Tuple
+import numpy as np
+
+from DataManager.utils.timeframes import Timeframes
+
+SECONDS_PER_DAY = 86400
+
+
+class Resampler:
+    """
+    Aggregates sorted bar arrays (structured arrays with Epoch, open, high,
+    low, close, volume, trade_count and vmap fields) into coarser bars.
+
+    Open is the first open of a bucket, close the last close, high and low
+    the extremes, volume and trade_count are summed and vmap is the volume
+    weighted average of the bar vmaps. Intraday buckets are labelled with
+    their start, daily and coarser ones with the session of their first bar.
+
+    Example:
+    Resampler.check("1Min", "1Hour")
+    hourly_bars = Resampler.resample(minute_bars, "1Hour")
+    """
+
+    @staticmethod
+    def check(source_timeframe, target_timeframe):
+        """Raises if `target_timeframe` cannot be derived from `source_timeframe` bars."""
+        source_seconds = Timeframes.bar_seconds(source_timeframe)
+        target_seconds = Timeframes.bar_seconds(target_timeframe)
+        if Timeframes.nominal_seconds(target_timeframe) <= Timeframes.nominal_seconds(
+            source_timeframe
+        ):
+            raise ValueError(
+                f"Cannot resample {source_timeframe} bars to {target_timeframe}, "
+                f"the target timeframe should be coarser."
+            )
+        if target_seconds is not None and (
+            source_seconds is None or target_seconds % source_seconds
+        ):
+            raise ValueError(
+                f"Cannot resample {source_timeframe} bars to {target_timeframe}, "
+                f"the target bar length should be a multiple of the source one."
+            )
+        if target_seconds is None and Timeframes.parse(target_timeframe)[0] != 1:
+            raise ValueError(
+                "Only 1Day, 1Week and 1Month are supported above intraday."
+            )
+
+    @staticmethod
+    def bucket_starts(epochs: np.ndarray, timeframe) -> np.ndarray:
+        """Start epoch of the `timeframe` bucket of every epoch."""
+        bar_seconds = Timeframes.bar_seconds(timeframe)
+        if bar_seconds is not None:
+            starts: np.ndarray = epochs - epochs % bar_seconds
+            return starts
+        unit = Timeframes.parse(timeframe)[1]
+        days = epochs // SECONDS_PER_DAY
+        if unit in ("Day", "D"):
+            return days * SECONDS_PER_DAY
+        if unit in ("Week", "W"):
+            # Day 0 (1970-01-01) is a Thursday, weeks start on Mondays
+            mondays: np.ndarray = days - (days + 3) % 7
+            return mondays * SECONDS_PER_DAY
+        return (
+            epochs.astype("datetime64[s]")
+            .astype("datetime64[M]")
+            .astype("datetime64[s]")
+            .astype(np.int64)
+        )
+
+    @staticmethod
+    def bucket_range(start_epoch: int, end_epoch: int, timeframe) -> Tuple[int, int]:
+        """First and last epoch of the buckets overlapping [start_epoch, end_epoch]."""
+        first, last = Resampler.bucket_starts(
+            np.array([start_epoch, end_epoch], dtype=np.int64), timeframe
+        )
+        # The start of the bucket after `last`, found past its longest length
+        after_last = Resampler.bucket_starts(
+            np.array([last + Timeframes.nominal_seconds(timeframe)], dtype=np.int64),
+            timeframe,
+        )[0]
+        return int(first), int(after_last) - 1
+
+    @staticmethod
+    def resample(bars: np.ndarray, timeframe) -> np.ndarray:
+        if len(bars) == 0:
+            return bars[:0].copy()
+        epochs = bars["Epoch"]
+        buckets = Resampler.bucket_starts(epochs, timeframe)
+        first = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+        last = np.append(first[1:], len(bars)) - 1
+
+        resampled = np.empty(len(first), dtype=bars.dtype)
+        if Timeframes.is_intraday(timeframe):
+            resampled["Epoch"] = buckets[first]
+        else:
+            resampled["Epoch"] = epochs[first] - epochs[first] % SECONDS_PER_DAY
+        resampled["open"] = bars["open"][first]
+        resampled["high"] = np.maximum.reduceat(bars["high"], first)
+        resampled["low"] = np.minimum.reduceat(bars["low"], first)
+        resampled["close"] = bars["close"][last]
+        volume = np.add.reduceat(bars["volume"], first)
+        resampled["volume"] = volume
+        resampled["trade_count"] = np.add.reduceat(bars["trade_count"], first)
+
+        # Buckets without volume fall back to their close
+        notional = np.add.reduceat(bars["vmap"] * bars["volume"], first)
+        resampled["vmap"] = np.divide(
+            notional,
+            volume,
+            out=resampled["close"].astype(np.float64),
+            where=volume > 0,
+        )
+        return resampled
@@ -0,0 +1,69 @@
+import re
+from typing import Optional, Tuple
+
+
+class Timeframes:
+    """
+    Bar timeframes as written for Alpaca ("1Min", "15Min", "1Hour", "1Day",
+    "1Week", "1Month"); the short forms of the storage keys ("1H", "1D", ...)
+    are accepted too.
+
+    Example:
+    Timeframes.storage_key("1Hour")  # "1H"
+    Timeframes.bar_seconds("5Min")  # 300
+    Timeframes.bar_seconds("1Day")  # None, bars are one per session or coarser
+    """
+
+    # unit: (storage key unit, seconds per bar for intraday units)
+    _UNITS = {
+        "Min": ("Min", 60),
+        "T": ("Min", 60),
+        "Hour": ("H", 3600),
+        "H": ("H", 3600),
+        "Day": ("D", None),
+        "D": ("D", None),
+        "Week": ("W", None),
+        "W": ("W", None),
+        "Month": ("Month", None),
+    }
+
+    _NOMINAL_SECONDS = {
+        "Day": 86400,
+        "D": 86400,
+        "Week": 7 * 86400,
+        "W": 7 * 86400,
+        "Month": 31 * 86400,
+    }
+
+    @staticmethod
+    def parse(timeframe) -> Tuple[int, str]:
+        match = re.fullmatch(r"(\d+)(Min|T|Hour|H|Day|D|Week|W|Month)", str(timeframe))
+        if match is None:
+            raise ValueError(
+                f"Invalid timeframe {timeframe}. Should look like 1Min, 15Min, 1Hour, 1Day, 1Week or 1Month."
+            )
+        return int(match.group(1)), match.group(2)
+
+    @staticmethod
+    def storage_key(timeframe) -> str:
+        """Timeframe part of the storage keys, distinct for every timeframe."""
+        amount, unit = Timeframes.parse(timeframe)
+        return f"{amount}{Timeframes._UNITS[unit][0]}"
+
+    @staticmethod
+    def bar_seconds(timeframe) -> Optional[int]:
+        """Length of an intraday bar in seconds, None for daily and coarser bars."""
+        amount, unit = Timeframes.parse(timeframe)
+        seconds = Timeframes._UNITS[unit][1]
+        return amount * seconds if seconds is not None else None
+
+    @staticmethod
+    def nominal_seconds(timeframe) -> int:
+        """Approximate bar length in seconds, only meant to order timeframes."""
+        amount, unit = Timeframes.parse(timeframe)
+        seconds = Timeframes._UNITS[unit][1] or Timeframes._NOMINAL_SECONDS[unit]
+        return amount * seconds
+
+    @staticmethod
+    def is_intraday(timeframe) -> bool:
+        return Timeframes.bar_seconds(timeframe) is not None
@@ -1,6 +1,6 @@
 from datetime import datetime
 import numpy as np
-from pandas import Timestamp
+from pandas import DatetimeIndex, Timestamp
 
 
 class TimeHandler:
@@ -21,6 +21,22 @@ class TimeHandler:
             )
         ).strftime("%Y-%m-%d %H:%M:%S")
 
+    @staticmethod
+    def get_datetime_from_unix_time(inputEpoch: int) -> datetime:
+        return datetime.utcfromtimestamp(inputEpoch)
+
+    @staticmethod
+    def get_unix_times_from_datetime_index(inputIndex: DatetimeIndex) -> np.ndarray:
+        if inputIndex.tz is not None:
+            inputIndex = inputIndex.tz_convert(None)
+        return np.asarray(inputIndex.values, dtype="datetime64[s]").astype(np.int64)
+
+    @staticmethod
+    def get_datetime_index_from_unix_times(inputEpochs: np.ndarray) -> DatetimeIndex:
+        return DatetimeIndex(
+            np.asarray(inputEpochs, dtype="int64").astype("datetime64[s]")
+        )
+
     @staticmethod
     def get_datetime64_from_string(inputString: str) -> np.datetime64:
         return np.datetime64(inputString)
@@ -0,0 +1,224 @@
+from datetime import datetime, timedelta, timezone
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+import pandas_market_calendars as mcal
+
+
+class TradingCalendar:
+    """
+    Process-wide, memoized trading days of one exchange.
+
+    The sessions are computed once with pandas_market_calendars as a sorted
+    datetime64[D] array (optionally cached on disk) and every query is
+    answered with a binary search on it.
+
+    Example:
+    calendar = TradingCalendar.get("NYSE")
+    valid_days = calendar.days_in_range("2021-06-01", "2021-07-01")
+    n_days = calendar.count_days("2021-06-01", "2021-07-01")
+    minute_bars = calendar.bar_epochs_in_range("2021-06-01", "2021-07-01", 60)
+
+    Inputs:
+        - `exchange_name`: name of the exchange in pandas_market_calendars
+        - `cache_dir`: directory for the on-disk session cache (no disk cache if None)
+    """
+
+    DEFAULT_START = np.datetime64("2000-01-01", "D")
+    CACHE_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+
+    _calendars: Dict[str, "TradingCalendar"] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, exchange_name, cache_dir: Optional[str] = None):
+        self.exchange_name = exchange_name
+        self.cache_dir = cache_dir
+        self._range_lock = threading.Lock()
+        self.sessions = np.array([], dtype="datetime64[D]")
+        self._first_day: np.datetime64 = np.datetime64("NaT", "D")
+        self._last_day: np.datetime64 = np.datetime64("NaT", "D")
+        # Regular session open and close epochs, only computed for intraday use
+        self._schedule: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._tz = None
+        if not self._load_cache():
+            self._compute(
+                self.DEFAULT_START,
+                np.datetime64(
+                    datetime.now(timezone.utc).date() + timedelta(days=2 * 366), "D"
+                ),
+            )
+            self._save_cache()
+
+    @classmethod
+    def get(cls, exchange_name, cache_dir: Optional[str] = None) -> "TradingCalendar":
+        calendar = cls._calendars.get(exchange_name)
+        if calendar is None:
+            with cls._lock:
+                calendar = cls._calendars.get(exchange_name)
+                if calendar is None:
+                    calendar = cls(exchange_name, cache_dir)
+                    cls._calendars[exchange_name] = calendar
+        return calendar
+
+    @property
+    def _cache_path(self) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, f"{self.exchange_name}_sessions.npy")
+
+    def _load_cache(self) -> bool:
+        cache_path = self._cache_path
+        if cache_path is None or not os.path.exists(cache_path):
+            return False
+        if time.time() - os.path.getmtime(cache_path) > self.CACHE_MAX_AGE_SECONDS:
+            return False
+        try:
+            cached = np.load(cache_path)
+        except (OSError, ValueError):
+            return False
+        # First two entries are the computed range, the rest are the sessions
+        self._first_day, self._last_day = cached[0], cached[1]
+        self.sessions = cached[2:]
+        return True
+
+    def _save_cache(self):
+        cache_path = self._cache_path
+        if cache_path is None:
+            return
+        try:
+            np.save(
+                cache_path,
+                np.concatenate(([self._first_day, self._last_day], self.sessions)),
+            )
+        except OSError:
+            pass
+
+    def _compute(self, first_day: np.datetime64, last_day: np.datetime64):
+        valid_days = mcal.get_calendar(self.exchange_name).valid_days(
+            str(first_day), str(last_day)
+        )
+        self.sessions = valid_days.tz_convert(None).values.astype("datetime64[D]")
+        self._first_day, self._last_day = first_day, last_day
+        self._schedule = None
+
+    def _ensure_range(self, first_day: np.datetime64, last_day: np.datetime64):
+        if first_day >= self._first_day and last_day <= self._last_day:
+            return
+        with self._range_lock:
+            if first_day < self._first_day or last_day > self._last_day:
+                self._compute(
+                    min(first_day, self._first_day), max(last_day, self._last_day)
+                )
+                self._save_cache()
+
+    @staticmethod
+    def to_day(value) -> np.datetime64:
+        """Calendar day of a date string, datetime, Timestamp or datetime64."""
+        timestamp = pd.Timestamp(value)
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.tz_convert(None)
+        return np.datetime64(timestamp.date(), "D")
+
+    def _bounds(self, start, end) -> Tuple[int, int]:
+        first_day, last_day = self.to_day(start), self.to_day(end)
+        self._ensure_range(first_day, last_day)
+        return (
+            int(np.searchsorted(self.sessions, first_day, side="left")),
+            int(np.searchsorted(self.sessions, last_day, side="right")),
+        )
+
+    def days_in_range(self, start, end) -> pd.DatetimeIndex:
+        """Sessions between start and end (inclusive) as UTC midnights, like mcal's valid_days."""
+        i, j = self._bounds(start, end)
+        return pd.DatetimeIndex(
+            self.sessions[i:j].astype("datetime64[ns]")
+        ).tz_localize("UTC")
+
+    def epochs_in_range(self, start, end) -> np.ndarray:
+        """Sessions between start and end (inclusive) as unix seconds."""
+        i, j = self._bounds(start, end)
+        return self.sessions[i:j].astype("datetime64[s]").astype("int64")
+
+    @property
+    def tz(self):
+        """Local timezone of the exchange."""
+        if self._tz is None:
+            self._tz = mcal.get_calendar(self.exchange_name).tz
+        return self._tz
+
+    def _get_schedule(self) -> Tuple[np.ndarray, np.ndarray]:
+        schedule = self._schedule
+        if schedule is None:
+            with self._range_lock:
+                schedule = self._schedule
+                if schedule is None:
+                    schedule_df = (
+                        mcal.get_calendar(self.exchange_name)
+                        .schedule(str(self._first_day), str(self._last_day))
+                        .reindex(
+                            pd.DatetimeIndex(self.sessions.astype("datetime64[ns]"))
+                        )
+                    )
+                    schedule = tuple(
+                        schedule_df[column]
+                        .dt.tz_convert(None)
+                        .values.astype("datetime64[s]")
+                        .astype(np.int64)
+                        for column in ("market_open", "market_close")
+                    )
+                    self._schedule = schedule
+        return schedule
+
+    def bar_epochs_in_range(self, start, end, bar_seconds: int) -> np.ndarray:
+        """
+        Start epochs (unix seconds) of the regular-hours bars of every session
+        between start and end (inclusive). Bars are aligned on multiples of
+        `bar_seconds`, early closes end their session early.
+        """
+        i, j = self._bounds(start, end)
+        opens, closes = (values[i:j] for values in self._get_schedule())
+        first_bars = opens - opens % bar_seconds
+        counts = -((first_bars - closes) // bar_seconds)
+        offsets = np.arange(counts.sum()) - np.repeat(
+            np.cumsum(counts) - counts, counts
+        )
+        bar_epochs: np.ndarray = np.repeat(first_bars, counts) + offsets * bar_seconds
+        return bar_epochs
+
+    def last_completed_session(
+        self, now: Optional[float] = None
+    ) -> Optional[pd.Timestamp]:
+        """Last session whose regular close is before `now` (unix seconds, defaults to the current time)."""
+        now = time.time() if now is None else now
+        day = np.datetime64(int(now), "s").astype("datetime64[D]")
+        self._ensure_range(day - 30, day + 1)
+        closes = self._get_schedule()[1]
+        i = int(np.searchsorted(closes, now, side="right")) - 1
+        return pd.Timestamp(self.sessions[i]) if i >= 0 else None
+
+    def count_days(self, start, end) -> int:
+        i, j = self._bounds(start, end)
+        return max(j - i, 0)
+
+    def snap_forward(self, value) -> Optional[pd.Timestamp]:
+        """First session on or after `value`."""
+        day = self.to_day(value)
+        self._ensure_range(day, day + 30)
+        i = int(np.searchsorted(self.sessions, day, side="left"))
+        return pd.Timestamp(self.sessions[i]) if i < len(self.sessions) else None
+
+    def snap_backward(self, value) -> Optional[pd.Timestamp]:
+        """Last session on or before `value`."""
+        day = self.to_day(value)
+        self._ensure_range(day - 30, day)
+        i = int(np.searchsorted(self.sessions, day, side="right")) - 1
+        return pd.Timestamp(self.sessions[i]) if i >= 0 else None
+
+    def is_session(self, value) -> bool:
+        day = self.to_day(value)
+        self._ensure_range(day, day)
+        i = int(np.searchsorted(self.sessions, day, side="left"))
+        return i < len(self.sessions) and self.sessions[i] == day
@@ -0,0 +1,79 @@
+import numpy as np
+
+from DataManager.database_layer.bar_cache import BarCache
+from DataManager.database_layer.storage import BAR_DTYPE
+
+DAY = 86400
+
+
+def make_bars(first_day, n_days):
+    bars = np.zeros(n_days, dtype=BAR_DTYPE)
+    bars["Epoch"] = (first_day + np.arange(n_days)) * DAY
+    bars["close"] = np.arange(n_days)
+    return bars
+
+
+def test_get_slices_a_contained_range():
+    cache = BarCache(max_bytes=2**20)
+    bars = make_bars(100, 10)
+    cache.put("AAA", "1D", 100 * DAY, 109 * DAY, bars, cache.version("AAA", "1D"))
+
+    assert cache.get("AAA", "1D", 100 * DAY, 109 * DAY) is bars
+    inner = cache.get("AAA", "1D", 103 * DAY, 105 * DAY)
+    assert list(inner["close"]) == [3, 4, 5]
+    assert cache.get("AAA", "1D", 95 * DAY, 105 * DAY) is None
+    assert cache.get("AAA", "5Min", 103 * DAY, 105 * DAY) is None
+    assert cache.get("BBB", "1D", 103 * DAY, 105 * DAY) is None
+    assert (cache.hits, cache.misses) == (2, 3)
+
+
+def test_least_recently_used_entries_are_evicted_past_max_bytes():
+    bars = make_bars(100, 10)
+    cache = BarCache(max_bytes=2 * bars.nbytes)
+    for symbol in ("AAA", "BBB"):
+        cache.put(symbol, "1D", 100 * DAY, 109 * DAY, bars, 0)
+    # AAA becomes the most recently used
+    assert cache.get("AAA", "1D", 100 * DAY, 109 * DAY) is not None
+
+    cache.put("CCC", "1D", 100 * DAY, 109 * DAY, bars, 0)
+
+    assert cache.get("BBB", "1D", 100 * DAY, 109 * DAY) is None
+    assert cache.get("AAA", "1D", 100 * DAY, 109 * DAY) is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 2 * bars.nbytes
+
+
+def test_arrays_larger_than_the_cache_are_not_kept():
+    bars = make_bars(100, 10)
+    cache = BarCache(max_bytes=bars.nbytes - 1)
+    cache.put("AAA", "1D", 100 * DAY, 109 * DAY, bars, 0)
+
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate_drops_the_symbol_and_rejects_stale_puts():
+    cache = BarCache(max_bytes=2**20)
+    bars = make_bars(100, 10)
+    version = cache.version("AAA", "1D")
+    cache.put("AAA", "1D", 100 * DAY, 109 * DAY, bars, version)
+    cache.put("BBB", "1D", 100 * DAY, 109 * DAY, bars, version)
+
+    cache.invalidate("AAA", "1D")
+    assert cache.get("AAA", "1D", 100 * DAY, 109 * DAY) is None
+    assert cache.get("BBB", "1D", 100 * DAY, 109 * DAY) is not None
+
+    # Read before the write that invalidated it, these bars may be stale
+    cache.put("AAA", "1D", 100 * DAY, 109 * DAY, bars, version)
+    assert cache.get("AAA", "1D", 100 * DAY, 109 * DAY) is None
+
+
+def test_views_of_a_memory_map_are_cached_as_copies(tmp_path):
+    path = str(tmp_path / "AAA.bars")
+    make_bars(100, 10).tofile(path)
+    bars = np.memmap(path, dtype=BAR_DTYPE, mode="r")
+    cache = BarCache(max_bytes=2**20)
+    cache.put("AAA", "1D", 100 * DAY, 109 * DAY, bars[2:], 0)
+
+    cached = cache.get("AAA", "1D", 100 * DAY, 109 * DAY)
+    assert not isinstance(cached, np.memmap)
+    assert list(cached["close"]) == list(range(2, 10))
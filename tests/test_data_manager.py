@@ -0,0 +1,240 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from DataManager.database_layer.tables import DailyStockTableManager
+from DataManager.datamgr.data_manager import DataManager
+from DataManager.utils.trading_calendar import TradingCalendar
+
+
+def make_frame(start, end, skip=()):
+    # Daily bars are stamped at 05:00 UTC, like the ones returned by Alpaca
+    sessions = TradingCalendar.get("NYSE").days_in_range(start, end)
+    index = (sessions + pd.Timedelta(hours=5)).rename("timestamp")
+    df = pd.DataFrame(
+        {
+            "open": 1.0,
+            "high": 2.0,
+            "low": 0.5,
+            "close": np.arange(len(index), dtype=np.float64),
+            "volume": 10,
+            "trade_count": 3,
+            "vwap": 1.5,
+        },
+        index=index,
+    )
+    return df.drop(index[list(skip)])
+
+
+class FakeExtractor:
+    def __init__(self):
+        self.list_requests = []
+        # Sessions left out of the frames returned for a symbol
+        self.dict_skipped = {}
+        self.fail_on = None
+
+    async def getMultipleListHistoricalAlpacaAsync(
+        self, list_symbols, list_dates, freq_data, exchange_name
+    ):
+        if self.fail_on in list_symbols:
+            raise ConnectionError(f"Interrupted while fetching {self.fail_on}")
+        self.list_requests.extend(zip(list_symbols, list_dates))
+        list_tuples = [
+            (symbol, make_frame(start, end, self.dict_skipped.get(symbol, ())))
+            for symbol, (start, end) in zip(list_symbols, list_dates)
+        ]
+        return list_tuples, []
+
+    async def streamMultipleListHistoricalAlpacaAsync(
+        self,
+        list_symbols,
+        list_dates,
+        freq_data,
+        exchange_name,
+        on_complete,
+        max_in_flight,
+    ):
+        list_tuples, _ = await self.getMultipleListHistoricalAlpacaAsync(
+            list_symbols, list_dates, freq_data, exchange_name
+        )
+        for (symbol, df), date_pair in zip(list_tuples, list_dates):
+            await on_complete(symbol, df, date_pair)
+        return len(list_tuples), []
+
+
+@pytest.fixture
+def manager(tmp_path):
+    # Built without __init__, which reads the asset database
+    data = object.__new__(DataManager)
+    data._daily_stocks = DailyStockTableManager(
+        "1Day",
+        coverage_db_name=str(tmp_path / "Coverage.db"),
+        storage="parquet",
+        storage_path=str(tmp_path / "bars"),
+    )
+    data._basket_of_symbols = {"AAA", "BBB"}
+    data._exchange_name = "NYSE"
+    data._calendar = TradingCalendar.get("NYSE")
+    data._extractor = FakeExtractor()
+    data.freq_data = "1Day"
+    data.read_batch_size = 200
+    data.read_workers = 1
+    data.max_frames_in_flight = 10
+    return data
+
+
+def test_panel_keeps_a_row_for_symbols_with_partial_data(manager):
+    # Too many missing sessions, BBB is not written
+    manager._extractor.dict_skipped["BBB"] = range(1, 5)
+
+    panel = manager.get_stock_panel(
+        "2021-03-01 00:00:00", "2021-03-05 00:00:00", fields=["close"]
+    )
+
+    assert panel.symbols == ["AAA", "BBB"]
+    closes = panel.get_field("close")
+    assert list(closes[0]) == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert np.isnan(closes[1]).all()
+
+
+def test_aligned_data_masks_the_bars_missing_from_partial_symbols(manager):
+    manager.get_stock_data("2021-03-01 00:00:00", "2021-03-05 00:00:00")
+    # The second week of BBB is too sparse to be written
+    manager._extractor.dict_skipped["BBB"] = range(1, 5)
+
+    aligned = manager.get_aligned_stock_data(
+        "2021-03-01 00:00:00", "2021-03-12 00:00:00"
+    )
+
+    assert aligned.symbols == ["AAA", "BBB"]
+    assert aligned.mask[0].all()
+    assert list(aligned.mask[1]) == [True] * 5 + [False] * 5
+    assert list(aligned.frames["BBB"]["close"][:5]) == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+    # Without fetching, the symbols without stored bars are kept as well
+    manager._basket_of_symbols.add("CCC")
+    aligned = manager.get_aligned_stock_data(
+        "2021-03-01 00:00:00", "2021-03-12 00:00:00", fetch_data=False
+    )
+    assert aligned.symbols == ["AAA", "BBB", "CCC"]
+    assert not aligned.mask[2].any()
+
+
+def test_interrupted_update_resumes_from_its_checkpoint(manager, tmp_path):
+    checkpoint_path = str(tmp_path / "UpdateBars.json")
+    manager._basket_of_symbols = {f"S{i}" for i in range(7)}
+    manager._extractor.fail_on = "S6"
+
+    with pytest.raises(ConnectionError):
+        manager.update_bars(
+            "2021-03-12 00:00:00",
+            "2021-03-01 00:00:00",
+            n_workers=1,
+            batch_size=3,
+            checkpoint_path=checkpoint_path,
+        )
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    assert checkpoint["end_timestamp"] == "2021-03-12 00:00:00"
+    assert sorted(checkpoint["done"]) == [f"S{i}" for i in range(6)]
+
+    manager._extractor.fail_on = None
+    manager._extractor.list_requests.clear()
+    # The end of the interrupted run is kept
+    dict_results = manager.update_bars(
+        default_start_timestamp="2021-03-01 00:00:00",
+        batch_size=3,
+        checkpoint_path=checkpoint_path,
+    )
+
+    assert manager._extractor.list_requests == [("S6", ("2021-03-01", "2021-03-12"))]
+    assert dict_results["updated"] == ["S6"]
+    assert not (tmp_path / "UpdateBars.json").exists()
+
+
+def test_update_without_a_completed_session_is_rejected(manager, monkeypatch):
+    monkeypatch.setattr(manager._calendar, "last_completed_session", lambda: None)
+
+    with pytest.raises(ValueError, match="No completed NYSE session"):
+        manager.update_bars(resume=False)
+
+
+def test_close_stops_the_write_thread(manager):
+    manager.get_stock_data("2021-03-01 00:00:00", "2021-03-05 00:00:00")
+    manager.close()
+
+    with pytest.raises(RuntimeError):
+        manager._daily_stocks._write_executor.submit(print)
+
+
+def test_only_the_missing_windows_are_fetched(manager):
+    manager.get_stock_data("2021-03-03 00:00:00", "2021-03-09 00:00:00")
+    manager._extractor.list_requests.clear()
+
+    manager.get_stock_data("2021-03-01 00:00:00", "2021-03-12 00:00:00")
+
+    assert sorted(manager._extractor.list_requests) == [
+        ("AAA", ("2021-03-01", "2021-03-02")),
+        ("AAA", ("2021-03-10", "2021-03-12")),
+        ("BBB", ("2021-03-01", "2021-03-02")),
+        ("BBB", ("2021-03-10", "2021-03-12")),
+    ]
+
+
+@pytest.mark.parametrize(
+    "timestamp_format, first_timestamp",
+    [
+        ("datetime", pd.Timestamp("2021-03-01")),
+        ("epoch", 18687 * 86400),
+        ("string", "2021-03-01 00:00:00"),
+    ],
+)
+def test_stock_data_timestamp_formats(manager, timestamp_format, first_timestamp):
+    dict_of_dfs = manager.get_stock_data(
+        "2021-03-01 00:00:00",
+        "2021-03-05 00:00:00",
+        timestamp_format=timestamp_format,
+    )
+
+    df = dict_of_dfs["AAA"]
+    timestamps = df["timestamp"] if timestamp_format == "string" else df.index
+    assert len(timestamps) == 5
+    assert timestamps[0] == first_timestamp
+    assert list(df["close"]) == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+def test_prepare_without_fetching_keeps_the_stored_symbols(manager):
+    manager._basket_of_symbols = {"AAA"}
+    manager.prepare_stock_data("2021-03-01 00:00:00", "2021-03-05 00:00:00")
+    manager._basket_of_symbols = {"AAA", "BBB"}
+    manager._extractor.list_requests.clear()
+
+    start_timestamp, end_timestamp, valid_dates = manager.prepare_stock_data(
+        "2021-02-27 00:00:00", "2021-03-05 00:00:00", fetch_data=False
+    )
+
+    # Moved to the first session
+    assert start_timestamp == "2021-03-01 00:00:00"
+    assert len(valid_dates) == 5
+    assert manager.list_of_symbols == ["AAA"]
+    assert manager._extractor.list_requests == []
+
+
+def test_streamed_windows_are_filled_and_written(manager):
+    manager._extractor.dict_skipped = {"AAA": [2], "BBB": range(1, 5)}
+
+    dict_of_dfs = manager.get_stock_data(
+        "2021-03-01 00:00:00",
+        "2021-03-05 00:00:00",
+        ensure_full_data=False,
+        stream=True,
+    )
+
+    # The missing session of AAA is filled, BBB is too sparse to be written
+    assert list(dict_of_dfs) == ["AAA"]
+    assert list(dict_of_dfs["AAA"]["close"]) == [0.0, 1.0, 1.0, 3.0, 4.0]
+    assert manager._daily_stocks.get_missing_windows(
+        "BBB", "2021-03-01 00:00:00", "2021-03-05 00:00:00"
+    )
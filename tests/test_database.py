@@ -0,0 +1,22 @@
+import threading
+
+import pytest
+
+from DataManager.database_layer.database import DatabaseManager
+
+
+def test_statements_of_other_threads_wait_for_the_transaction(tmp_path):
+    db = DatabaseManager(str(tmp_path / "Test.db"))
+    db.create_table("Rows", {"name": "text not null"})
+    writer = threading.Thread(target=db.add, args=("Rows", {"name": "other"}))
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.add("Rows", {"name": "rolled back"})
+            writer.start()
+            writer.join(0.2)
+            assert writer.is_alive()
+            raise RuntimeError("rolled back")
+    writer.join()
+
+    assert db.select("Rows").fetchall() == [("other",)]
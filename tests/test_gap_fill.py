@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from DataManager.utils.gap_fill import GapFill
+
+
+def make_frame(timestamps, close):
+    index = pd.DatetimeIndex(timestamps, tz="UTC", name="timestamp")
+    return pd.DataFrame({"close": close, "volume": 10}, index=index)
+
+
+def test_daily_frames_are_forward_filled_on_their_sessions():
+    sessions = pd.DatetimeIndex(["2021-03-01", "2021-03-02", "2021-03-03"], tz="UTC")
+    # Daily bars are stamped at 05:00 UTC, they belong to the session of that day
+    frame = make_frame(["2021-03-01 05:00", "2021-03-03 05:00"], [1.0, 3.0])
+
+    list_filled, list_masks = GapFill.fill_frames([frame], [sessions])
+
+    assert list(list_filled[0].index) == list(sessions)
+    assert list(list_filled[0]["close"]) == [1.0, 1.0, 3.0]
+    assert list(list_masks[0]) == [False, True, False]
+
+
+def test_frames_missing_their_first_session_or_too_many_are_rejected():
+    sessions = pd.DatetimeIndex(
+        ["2021-03-01", "2021-03-02", "2021-03-03", "2021-03-04"], tz="UTC"
+    )
+    late_start = make_frame(["2021-03-02", "2021-03-04"], [2.0, 4.0])
+    sparse = make_frame(["2021-03-01"], [1.0])
+    complete = make_frame(list(sessions), [1.0, 2.0, 3.0, 4.0])
+
+    list_filled, list_masks = GapFill.fill_frames(
+        [late_start, sparse, complete], [sessions] * 3, max_fill=2
+    )
+
+    assert list_filled[0] is None and list_masks[0] is None
+    assert list_filled[1] is None
+    assert not list_masks[2].any()
+
+
+def test_intraday_frames_drop_leading_bars_and_open_session_tail():
+    bar_seconds = 300
+    slots = pd.date_range("2021-03-01 14:30", periods=6, freq="5min", tz="UTC")
+    # The first bar is missing and the session is still open after the fourth one
+    frame = make_frame(slots[[1, 3]], [2.0, 4.0])
+
+    list_filled, list_masks = GapFill.fill_frames(
+        [frame],
+        [slots],
+        bar_seconds=bar_seconds,
+        open_session_start=np.datetime64("2021-03-01"),
+    )
+
+    assert list(list_filled[0].index) == list(slots[1:4])
+    assert list(list_filled[0]["close"]) == [2.0, 2.0, 4.0]
+    assert list(list_masks[0]) == [False, True, False]
+
+    # Once the session has closed, the tail is filled like any other gap
+    list_filled, _ = GapFill.fill_frames([frame], [slots], bar_seconds=bar_seconds)
+    assert list(list_filled[0].index) == list(slots[1:])
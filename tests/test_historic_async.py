@@ -0,0 +1,139 @@
+import pandas as pd
+
+from DataManager.datamgr.data_extractor import DataExtractor
+from DataManager.datamgr.historic_async import HistoricalAsync, ScheduledAsyncRest
+from DataManager.datamgr.request_scheduler import RequestScheduler
+
+PAGE_SIZE = 1000
+
+
+def make_minute_bars(symbol, sessions):
+    """Regular-hours 1Min bars of `symbol` in Alpaca's raw format (14:30-21:00 UTC in winter)."""
+    bars = []
+    for session in sessions:
+        for minute in pd.date_range(
+            f"{session} 14:30", f"{session} 20:59", freq="1min"
+        ):
+            bars.append(
+                {
+                    "t": minute.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "o": 1.0,
+                    "h": 2.0,
+                    "l": 0.5,
+                    "c": 1.5,
+                    "v": 100,
+                    "n": 10,
+                    "vw": 1.2,
+                }
+            )
+    return bars
+
+
+def make_extractor(monkeypatch, bars, symbols_per_request=1):
+    """DataExtractor without credentials whose HTTP pages are served from `bars`."""
+    list_payloads = []
+
+    async def fake_request(self, url, payload):
+        list_payloads.append({**payload, "url": url})
+        limit = min(payload["limit"], PAGE_SIZE)
+        start = int(payload.get("page_token") or 0)
+        while True:
+            page = bars[start : start + limit]
+            start += limit
+            page_token = str(start) if start < len(bars) else None
+            payload["page_token"] = page_token
+            # The multi-symbol endpoint keys the bars by symbol
+            page_bars = {"AAA": page} if "symbols" in payload else page
+            yield {"bars": page_bars, "next_page_token": page_token}
+            if not page_token:
+                break
+
+    monkeypatch.setattr(ScheduledAsyncRest, "_request", fake_request)
+
+    scheduler = RequestScheduler(requests_per_minute=10**6)
+    async_obj = object.__new__(HistoricalAsync)
+    async_obj.scheduler = scheduler
+    async_obj.rest = ScheduledAsyncRest(scheduler, key_id="key", secret_key="secret")
+
+    extractor = object.__new__(DataExtractor)
+    extractor.AsyncObj = async_obj
+    extractor.verify_calendar = False
+    extractor.symbols_per_request = symbols_per_request
+    return extractor, list_payloads
+
+
+def test_single_symbol_intraday_request_follows_pages(monkeypatch):
+    sessions = ["2021-12-06", "2021-12-07", "2021-12-08", "2021-12-09", "2021-12-10"]
+    bars = make_minute_bars("AAA", sessions)
+    extractor, list_payloads = make_extractor(monkeypatch, bars)
+
+    complete_data, partial_data = extractor.getMultipleListHistoricalAlpaca(
+        ["AAA"], [("2021-12-06", "2021-12-10")], "1Min", "NYSE"
+    )
+
+    assert partial_data == []
+    assert [symbol for symbol, _ in complete_data] == ["AAA"]
+    assert len(complete_data[0][1]) == len(bars) == 1950
+    assert list_payloads[0]["limit"] == 10000
+    # One request per symbol keeps the single-symbol endpoint
+    assert all(p["url"].endswith("/v2/stocks/AAA/bars") for p in list_payloads)
+
+
+def test_multi_symbol_request_matches_single_symbol(monkeypatch):
+    bars = make_minute_bars("AAA", ["2021-12-06", "2021-12-07"])
+    extractor, list_payloads = make_extractor(monkeypatch, bars, symbols_per_request=10)
+
+    complete_data, partial_data = extractor.getMultipleListHistoricalAlpaca(
+        ["AAA"], [("2021-12-06", "2021-12-07")], "1Min", "NYSE"
+    )
+
+    assert partial_data == []
+    assert len(complete_data[0][1]) == len(bars)
+    assert list_payloads[0]["url"].endswith("/v2/stocks/bars")
+
+
+def test_intraday_list_request_is_checked_on_its_sessions(monkeypatch):
+    sessions = ["2021-12-06", "2021-12-07", "2021-12-08"]
+    extractor, _ = make_extractor(monkeypatch, make_minute_bars("AAA", sessions))
+
+    valid_data, partial_data = extractor.getListHistoricalAlpaca(
+        ["AAA"], "2021-12-06", "2021-12-08", "1Min"
+    )
+    assert [symbol for symbol, _ in valid_data] == ["AAA"]
+    assert partial_data == []
+
+    # The last session is missing
+    valid_data, partial_data = extractor.getListHistoricalAlpaca(
+        ["AAA"], "2021-12-06", "2021-12-09", "1Min"
+    )
+    assert valid_data == []
+    assert [symbol for symbol, _ in partial_data] == ["AAA"]
+
+
+def test_stream_keeps_at_most_max_in_flight_responses(monkeypatch):
+    sessions = ["2021-12-06", "2021-12-07"]
+    extractor, _ = make_extractor(monkeypatch, make_minute_bars("AAA", sessions))
+    fake_request = ScheduledAsyncRest._request
+    list_started, list_done, list_pending = [], [], []
+
+    async def counting_request(self, url, payload):
+        list_started.append(url)
+        list_pending.append(len(list_started) - len(list_done))
+        async for page in fake_request(self, url, payload):
+            yield page
+
+    monkeypatch.setattr(ScheduledAsyncRest, "_request", counting_request)
+    list_symbols = [f"S{i}" for i in range(8)]
+
+    n_complete, partial_data = extractor.streamMultipleListHistoricalAlpaca(
+        list_symbols,
+        [("2021-12-06", "2021-12-07")] * len(list_symbols),
+        "1Min",
+        "NYSE",
+        lambda symbol, df, date_pair: list_done.append((symbol, len(df))),
+        max_in_flight=3,
+    )
+
+    assert (n_complete, partial_data) == (8, [])
+    assert sorted(list_done) == [(symbol, 780) for symbol in list_symbols]
+    assert max(list_pending) <= 3
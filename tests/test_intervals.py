@@ -0,0 +1,63 @@
+import numpy as np
+
+from DataManager.utils.intervals import Intervals
+
+DAY = 86400
+# Mon 2021-03-01 to Fri 2021-03-12, the weekend in between is not a session
+SESSIONS = np.array(
+    [(18687 + i) * DAY for i in (0, 1, 2, 3, 4, 7, 8, 9, 10, 11)], dtype=np.int64
+)
+
+
+def test_from_epochs_joins_runs_over_weekends():
+    epochs = SESSIONS[[0, 1, 3, 4, 5, 6, 9]]
+
+    assert Intervals.from_epochs(epochs, SESSIONS) == [
+        (SESSIONS[0], SESSIONS[1]),
+        (SESSIONS[3], SESSIONS[6]),
+        (SESSIONS[9], SESSIONS[9]),
+    ]
+
+
+def test_from_epochs_ignores_epochs_that_are_not_sessions():
+    epochs = np.array([SESSIONS[0], SESSIONS[4] + DAY, SESSIONS[-1] + DAY])
+
+    assert Intervals.from_epochs(epochs, SESSIONS) == [(SESSIONS[0], SESSIONS[0])]
+    assert Intervals.from_epochs(np.array([], dtype=np.int64), SESSIONS) == []
+
+
+def test_merge_joins_overlapping_and_adjacent_intervals():
+    intervals = [
+        (SESSIONS[5], SESSIONS[6]),
+        (SESSIONS[0], SESSIONS[2]),
+        (SESSIONS[1], SESSIONS[3]),
+        # Adjacent over the weekend, no session lies between them
+        (SESSIONS[4], SESSIONS[4]),
+        (SESSIONS[8], SESSIONS[9]),
+    ]
+
+    assert Intervals.merge(intervals, SESSIONS) == [
+        (SESSIONS[0], SESSIONS[6]),
+        (SESSIONS[8], SESSIONS[9]),
+    ]
+
+
+def test_merge_drops_intervals_without_sessions():
+    saturday = SESSIONS[4] + DAY
+    intervals = [(saturday, saturday + DAY), (SESSIONS[2], SESSIONS[2])]
+
+    assert Intervals.merge(intervals, SESSIONS) == [(SESSIONS[2], SESSIONS[2])]
+    assert Intervals.merge([], SESSIONS) == []
+
+
+def test_missing_is_the_complement_of_the_coverage():
+    intervals = [(SESSIONS[1], SESSIONS[2]), (SESSIONS[5], SESSIONS[7])]
+
+    assert Intervals.missing(intervals, SESSIONS) == [
+        (SESSIONS[0], SESSIONS[0]),
+        (SESSIONS[3], SESSIONS[4]),
+        (SESSIONS[8], SESSIONS[9]),
+    ]
+    assert Intervals.count(intervals, SESSIONS) == 5
+    assert Intervals.missing([], SESSIONS) == [(SESSIONS[0], SESSIONS[-1])]
+    assert Intervals.missing([(SESSIONS[0], SESSIONS[-1])], SESSIONS) == []
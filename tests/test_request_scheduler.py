@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from DataManager.datamgr.historic_async import ScheduledAsyncRest
+from DataManager.datamgr.request_scheduler import (
+    AlpacaHTTPError,
+    RequestScheduler,
+    RetryPolicy,
+    TokenBucket,
+)
+
+
+@pytest.mark.parametrize(
+    "error, retryable",
+    [
+        (AlpacaHTTPError(429, "too many requests"), True),
+        (AlpacaHTTPError(503, "unavailable"), True),
+        (AlpacaHTTPError(404, "not found"), False),
+        (asyncio.TimeoutError(), True),
+        (ValueError("unexpected payload"), False),
+    ],
+)
+def test_retryable_errors(error, retryable):
+    assert RetryPolicy.is_retryable(error) is retryable
+
+
+def test_delays_follow_retry_after_and_back_off():
+    policy = RetryPolicy(base_delay=1.0, max_delay=8.0)
+
+    for attempt in range(6):
+        assert 5.0 <= policy.get_delay(AlpacaHTTPError(429, "", 5.0), attempt) <= 6.0
+        assert 0.0 <= policy.get_delay(AlpacaHTTPError(503, ""), attempt) <= 8.0
+        assert policy.get_delay(AlpacaHTTPError(503, ""), 0) <= 1.0
+
+
+def test_token_bucket_waits_past_its_capacity(monkeypatch):
+    list_sleeps = []
+
+    async def fake_sleep(seconds):
+        list_sleeps.append(seconds)
+
+    bucket = TokenBucket(requests_per_minute=60)
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+
+    async def acquire_all():
+        for _ in range(62):
+            await bucket.acquire()
+
+    asyncio.run(acquire_all())
+
+    # One token per second once the first 60 are spent
+    assert list_sleeps == [pytest.approx(1.0, abs=0.01), pytest.approx(2.0, abs=0.01)]
+
+
+def test_run_retries_until_success_or_gives_up(monkeypatch):
+    scheduler = RequestScheduler(max_retries=2)
+    monkeypatch.setattr(scheduler.retry_policy, "get_delay", lambda error, attempt: 0)
+    list_errors = [AlpacaHTTPError(503, ""), AlpacaHTTPError(502, "")]
+
+    async def flaky_request():
+        if list_errors:
+            raise list_errors.pop(0)
+        return "bars"
+
+    assert asyncio.run(scheduler.run(flaky_request)) == "bars"
+
+    n_attempts = 0
+
+    async def failing_request():
+        nonlocal n_attempts
+        n_attempts += 1
+        raise AlpacaHTTPError(500, "")
+
+    with pytest.raises(AlpacaHTTPError):
+        asyncio.run(scheduler.run(failing_request))
+    assert n_attempts == 3
+
+    n_attempts = 0
+    with pytest.raises(AlpacaHTTPError):
+        asyncio.run(scheduler.run(failing_request, max_retries=0))
+    assert n_attempts == 1
+
+
+def test_rate_limited_request_waits_for_retry_after():
+    scheduler = RequestScheduler(requests_per_minute=10**6)
+    list_delays = []
+
+    def get_delay(error, attempt):
+        list_delays.append((error.status, error.retry_after))
+        return 0
+
+    scheduler.retry_policy.get_delay = get_delay
+    n_requests = 0
+
+    async def bars(request):
+        nonlocal n_requests
+        n_requests += 1
+        if n_requests == 1:
+            return web.Response(status=429, headers={"Retry-After": "3"})
+        return web.json_response({"bars": [], "next_page_token": None})
+
+    async def fetch():
+        app = web.Application()
+        app.router.add_get("/v2/stocks/AAA/bars", bars)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        rest = ScheduledAsyncRest(
+            scheduler,
+            key_id="key",
+            secret_key="secret",
+            data_url=f"http://127.0.0.1:{port}",
+        )
+        try:
+            return await scheduler.run(
+                lambda: rest.get_bars_async("AAA", "2021-03-01", "2021-03-05", "1Day")
+            )
+        finally:
+            await runner.cleanup()
+
+    symbol, df = asyncio.run(fetch())
+
+    assert (symbol, n_requests) == ("AAA", 2)
+    assert df.empty
+    assert list_delays == [(429, 3.0)]
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from DataManager.database_layer.storage import BAR_DTYPE
+from DataManager.utils.resampler import Resampler
+
+DAY = 86400
+# Mon 2021-03-01 00:00 UTC
+MONDAY = 18687 * DAY
+
+
+def make_bars(epochs, close, volume=100, vmap=1.0):
+    bars = np.zeros(len(epochs), dtype=BAR_DTYPE)
+    bars["Epoch"] = epochs
+    bars["open"] = np.asarray(close) - 0.5
+    bars["high"] = np.asarray(close) + 1.0
+    bars["low"] = np.asarray(close) - 1.0
+    bars["close"] = close
+    bars["volume"] = volume
+    bars["trade_count"] = 10
+    bars["vmap"] = vmap
+    return bars
+
+
+def test_check_accepts_multiples_of_the_source_bars():
+    Resampler.check("1Min", "7Min")
+    Resampler.check("5Min", "1Hour")
+    Resampler.check("1Day", "1Month")
+
+
+@pytest.mark.parametrize(
+    "source, target, match",
+    [
+        ("1Day", "1Day", "coarser"),
+        ("1Day", "30Min", "coarser"),
+        ("2Min", "5Min", "multiple"),
+        ("1Day", "2Week", "1Week"),
+    ],
+)
+def test_check_rejects_targets_that_cannot_be_derived(source, target, match):
+    with pytest.raises(ValueError, match=match):
+        Resampler.check(source, target)
+
+
+def test_minute_bars_are_aggregated_into_hours():
+    epochs = MONDAY + 14 * 3600 + 30 * 60 + 60 * np.arange(90)
+    bars = make_bars(epochs, close=np.arange(90, dtype=np.float64), vmap=2.0)
+    bars["volume"][:30] = 0
+
+    hourly = Resampler.resample(bars, "1Hour")
+
+    assert list(hourly["Epoch"]) == [MONDAY + 14 * 3600, MONDAY + 15 * 3600]
+    assert list(hourly["open"]) == [-0.5, 29.5]
+    assert list(hourly["close"]) == [29.0, 89.0]
+    assert list(hourly["high"]) == [30.0, 90.0]
+    assert list(hourly["low"]) == [-1.0, 29.0]
+    assert list(hourly["volume"]) == [0, 6000]
+    assert list(hourly["trade_count"]) == [300, 600]
+    # Without volume the vmap falls back to the close
+    assert list(hourly["vmap"]) == [29.0, 2.0]
+
+
+def test_daily_bars_are_aggregated_into_weeks_starting_on_mondays():
+    # Tue 2021-03-02 to Wed 2021-03-10 sessions, skipping the weekend
+    days = np.array([1, 2, 3, 4, 7, 8, 9])
+    bars = make_bars(MONDAY + days * DAY, close=days.astype(np.float64))
+
+    weekly = Resampler.resample(bars, "1Week")
+
+    # Labelled with the session of their first bar
+    assert list(weekly["Epoch"]) == [MONDAY + DAY, MONDAY + 7 * DAY]
+    assert list(weekly["close"]) == [4.0, 9.0]
+    assert list(weekly["volume"]) == [400, 300]
+    assert Resampler.resample(bars[:0], "1Week").dtype == BAR_DTYPE
+
+
+def test_bucket_range_covers_whole_months():
+    start, end = Resampler.bucket_range(MONDAY + 3 * DAY, MONDAY + 3 * DAY, "1Month")
+
+    # 2021-03-01 to 2021-03-31 23:59:59
+    assert (start, end) == (MONDAY, MONDAY + 31 * DAY - 1)
@@ -0,0 +1,125 @@
+import os
+import resource
+
+import numpy as np
+import pytest
+
+from DataManager.database_layer.storage import (
+    BAR_DTYPE,
+    MemmapBackend,
+    create_storage_backend,
+)
+
+DAY = 86400
+
+
+def make_bars(first_day, n_days, close=1.0):
+    bars = np.zeros(n_days, dtype=BAR_DTYPE)
+    bars["Epoch"] = (first_day + np.arange(n_days)) * DAY
+    bars["open"] = bars["high"] = bars["low"] = 1.0
+    bars["close"] = close
+    bars["volume"] = 100
+    bars["trade_count"] = 10
+    bars["vmap"] = 1.0
+    return bars
+
+
+@pytest.fixture(params=["parquet", "memmap"])
+def backend(request, tmp_path):
+    if request.param == "parquet":
+        pytest.importorskip("pyarrow")
+    return create_storage_backend(request.param, str(tmp_path))
+
+
+def test_round_trip_across_partitions(backend):
+    # 2020-12-23 to 2021-01-11, split over two yearly Parquet partitions
+    bars = make_bars(18619, 20)
+    backend.write("AAA", "1D", bars)
+
+    dict_bars = backend.query(["AAA", "BBB"], "1D", 18619 * DAY, 18638 * DAY)
+    assert list(dict_bars) == ["AAA"]
+    assert dict_bars["AAA"].dtype == BAR_DTYPE
+    np.testing.assert_array_equal(dict_bars["AAA"], bars)
+    np.testing.assert_array_equal(backend.read_epochs("AAA", "1D"), bars["Epoch"])
+    assert backend.list_symbols("1D") == {"AAA"}
+    assert backend.list_symbols("1H") == set()
+
+
+def test_query_range_and_columns(backend):
+    backend.write("AAA", "1D", make_bars(18619, 20))
+
+    dict_bars = backend.query(
+        ["AAA"], "1D", 18626 * DAY, 18629 * DAY, columns=["close"]
+    )
+    assert dict_bars["AAA"].dtype.names == ("Epoch", "close")
+    assert list(dict_bars["AAA"]["Epoch"]) == [d * DAY for d in range(18626, 18630)]
+    assert backend.query(["AAA"], "1D", 18700 * DAY, 18710 * DAY) == {}
+
+
+def test_writes_append_and_replace_stored_epochs(backend):
+    backend.write("AAA", "1D", make_bars(18619, 10, close=1.0))
+    # Appended past the stored bars
+    backend.write("AAA", "1D", make_bars(18629, 5, close=2.0))
+    # Overlapping the stored bars, written out of order
+    backend.write("AAA", "1D", make_bars(18625, 6, close=3.0)[::-1])
+
+    bars = backend.query(["AAA"], "1D", 0, 20000 * DAY)["AAA"]
+    assert list(bars["Epoch"]) == [d * DAY for d in range(18619, 18634)]
+    assert list(bars["close"]) == [1.0] * 6 + [3.0] * 6 + [2.0] * 3
+
+
+def test_memmap_query_past_open_file_limit(tmp_path):
+    backend = MemmapBackend(str(tmp_path))
+    n_symbols = backend.MAX_OPEN_MAPS * 3
+    for i in range(n_symbols):
+        backend.write(f"S{i}", "1D", make_bars(18000, 5, close=i))
+
+    list_close = []
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, 256), hard))
+    try:
+        # Evicted maps are released once the views of each batch are dropped
+        for first in range(0, n_symbols, 64):
+            dict_bars = backend.query(
+                [f"S{i}" for i in range(first, first + 64)],
+                "1D",
+                18000 * DAY,
+                18010 * DAY,
+            )
+            list_close += [float(bars["close"][0]) for bars in dict_bars.values()]
+            del dict_bars
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+    assert list_close == list(range(n_symbols))
+    assert len(backend._maps) == backend.MAX_OPEN_MAPS
+
+
+def test_memmap_query_returns_views_of_the_map(tmp_path):
+    backend = MemmapBackend(str(tmp_path))
+    backend.write("AAA", "1D", make_bars(18000, 5))
+
+    bars = backend.query(["AAA"], "1D", 18001 * DAY, 18003 * DAY)["AAA"]
+    stored = backend._open(backend._path("AAA", "1D"))
+
+    assert len(bars) == 3
+    assert np.shares_memory(bars, stored)
+
+
+def test_memmap_torn_tail_is_ignored_and_cut_by_the_next_write(tmp_path):
+    backend = MemmapBackend(str(tmp_path))
+    backend.write("AAA", "1D", make_bars(18000, 3))
+    path = backend._path("AAA", "1D")
+    # An append interrupted halfway through a record
+    with open(path, "ab") as f:
+        f.write(make_bars(18003, 1).tobytes()[: BAR_DTYPE.itemsize // 2])
+    backend._close(path)
+
+    assert len(backend.query(["AAA"], "1D", 18000 * DAY, 18010 * DAY)["AAA"]) == 3
+
+    backend.write("AAA", "1D", make_bars(18003, 2))
+    backend._close(path)
+
+    assert os.path.getsize(path) == 5 * BAR_DTYPE.itemsize
+    epochs = backend.query(["AAA"], "1D", 18000 * DAY, 18010 * DAY)["AAA"]["Epoch"]
+    assert list(epochs) == [(18000 + i) * DAY for i in range(5)]
@@ -0,0 +1,227 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from DataManager.database_layer.tables import (
+    AssetTableManager,
+    CoverageTableManager,
+    DailyStockTableManager,
+)
+from DataManager.utils.trading_calendar import TradingCalendar
+
+DAY = 86400
+# Mon 2021-03-01, the first of the ten sessions up to Fri 2021-03-12
+MONDAY = 18687 * DAY
+
+
+def make_frame(start, end, skip=()):
+    # Daily bars are stamped at 05:00 UTC, like the ones returned by Alpaca
+    sessions = TradingCalendar.get("NYSE").days_in_range(start, end)
+    index = (sessions + pd.Timedelta(hours=5)).rename("timestamp")
+    df = pd.DataFrame(
+        {
+            "open": 1.0,
+            "high": 2.0,
+            "low": 0.5,
+            "close": np.arange(len(index), dtype=np.float64),
+            "volume": 10,
+            "trade_count": 3,
+            "vwap": 1.5,
+        },
+        index=index,
+    )
+    return df.drop(index[list(skip)])
+
+
+def make_stock_table(tmp_path, coverage_db_name="Coverage.db"):
+    return DailyStockTableManager(
+        "1Day",
+        coverage_db_name=str(tmp_path / coverage_db_name),
+        storage="parquet",
+        storage_path=str(tmp_path / "bars"),
+    )
+
+
+def make_asset(stock_symbol, **fields):
+    return {
+        "stockSymbol": stock_symbol,
+        "companyName": f"{stock_symbol} Inc.",
+        "exchangeName": "NYSE",
+        "isDelisted": False,
+        "isShortable": True,
+        "isSuspended": False,
+        **fields,
+    }
+
+
+def test_refresh_records_changes_and_delists_missing_assets(tmp_path):
+    asset_table = AssetTableManager(str(tmp_path / "AssetDB.db"))
+    list_changes = asset_table.refresh_assets(
+        [make_asset("AAA"), make_asset("BBB"), make_asset("CCC")],
+        "2021-03-01 00:00:00",
+    )
+    assert [c["changeType"] for c in list_changes] == ["listed"] * 3
+
+    # BBB is suspended, CCC is no longer listed
+    list_changes = asset_table.refresh_assets(
+        [make_asset("AAA"), make_asset("BBB", isSuspended=True)],
+        "2021-03-02 00:00:00",
+    )
+
+    assert sorted((c["stockSymbol"], c["changeType"]) for c in list_changes) == [
+        ("BBB", "suspended"),
+        ("CCC", "delisted"),
+    ]
+    assert asset_table.get_all_tradable_symbols() == ["AAA"]
+    assert asset_table.get_one_asset("CCC")["isDelisted"]
+    # Unchanged rows keep their date
+    assert asset_table.get_one_asset("AAA")["dateLastUpdated"] == "2021-03-01 00:00:00"
+
+    list_since = asset_table.get_asset_changes(since="2021-03-02 00:00:00")
+    assert sorted(c["stockSymbol"] for c in list_since) == ["BBB", "CCC"]
+    assert len(asset_table.get_asset_changes()) == 5
+
+    # Already delisted, nothing new is recorded
+    assert (
+        asset_table.refresh_assets(
+            [make_asset("AAA"), make_asset("BBB", isSuspended=True)],
+            "2021-03-03 00:00:00",
+        )
+        == []
+    )
+
+
+def test_coverage_is_kept_by_writes_and_reloaded(tmp_path):
+    stock_table = make_stock_table(tmp_path)
+    stock_table.update_daily_stock_data(
+        [("AAA", make_frame("2021-03-01", "2021-03-05"))], verbose=False
+    )
+
+    coverage = CoverageTableManager(str(tmp_path / "Coverage.db"))
+    assert coverage.get_coverage("AAA", "1D")[:3] == (MONDAY, MONDAY + 4 * DAY, 5)
+    assert coverage.get_intervals("AAA", "1D") == [(MONDAY, MONDAY + 4 * DAY)]
+    assert coverage.get_many_coverage(["AAA", "BBB"], "1D")["BBB"] is None
+    assert coverage.get_intervals("BBB", "1D") is None
+
+
+def test_coverage_of_bars_stored_before_the_index_is_rebuilt(tmp_path):
+    make_stock_table(tmp_path).update_daily_stock_data(
+        [("AAA", make_frame("2021-03-01", "2021-03-05"))], verbose=False
+    )
+
+    # Same bars, empty coverage index
+    stock_table = make_stock_table(tmp_path, "OtherCoverage.db")
+
+    assert stock_table.get_last_stored_epoch("AAA") == MONDAY + 4 * DAY
+    assert stock_table.coverage.get_coverage("AAA", "1D")[2] == 5
+
+
+def test_missing_windows_include_holes_inside_the_stored_range(tmp_path):
+    stock_table = make_stock_table(tmp_path)
+    # Thu 4 and Fri 5, then Wed 10 to Fri 12 are missing
+    stock_table.update_daily_stock_data(
+        [("AAA", make_frame("2021-03-01", "2021-03-12", skip=[3, 4, 7, 8, 9]))],
+        verbose=False,
+    )
+
+    dict_missing_windows = stock_table.get_many_missing_windows(
+        ["AAA", "BBB"], "2021-03-01 00:00:00", "2021-03-12 00:00:00"
+    )
+
+    assert dict_missing_windows["AAA"] == [
+        (datetime(2021, 3, 4), datetime(2021, 3, 5)),
+        (datetime(2021, 3, 10), datetime(2021, 3, 12)),
+    ]
+    assert dict_missing_windows["BBB"] == [
+        (datetime(2021, 3, 1), datetime(2021, 3, 12))
+    ]
+    assert stock_table.coverage.get_coverage("AAA", "1D")[2] == 5
+    assert (
+        stock_table.get_missing_windows(
+            "AAA", "2021-03-06 00:00:00", "2021-03-09 00:00:00"
+        )
+        == []
+    )
+
+
+def test_basket_queries_are_served_by_the_indexes(tmp_path):
+    asset_table = AssetTableManager(str(tmp_path / "AssetDB.db"))
+
+    for criteria, index_name in [
+        ({"isDelisted": False, "isSuspended": False}, "Assets_status"),
+        (
+            {"exchangeName": "NYSE", "isDelisted": False, "isSuspended": False},
+            "Assets_exchange",
+        ),
+        (
+            {"index_name": "SP500", "isDelisted": False, "isSuspended": False},
+            "Assets_index",
+        ),
+    ]:
+        where = " AND ".join(f"{column} = ?" for column in criteria)
+        plan = asset_table.db.connection.execute(
+            f'EXPLAIN QUERY PLAN SELECT stockSymbol FROM "Assets" WHERE {where}',
+            tuple(criteria.values()),
+        ).fetchall()
+        assert index_name in str(plan)
+
+
+def test_universe_cache_is_shared_and_cleared_on_writes(tmp_path):
+    db_name = str(tmp_path / "AssetDB.db")
+    asset_table = AssetTableManager(db_name)
+    asset_table.refresh_assets(
+        [make_asset("AAA"), make_asset("BBB", exchangeName="NASDAQ")],
+        "2021-03-01 00:00:00",
+    )
+    criteria = {"exchangeName": "NYSE", "isDelisted": False, "isSuspended": False}
+
+    assert asset_table.get_symbols_from_criteria(criteria) == ["AAA"]
+    # Served from the cache of the DB file, even to another manager
+    other_table = AssetTableManager(db_name)
+    other_table.db.connection.execute('DELETE FROM "Assets"')
+    assert other_table.get_symbols_from_criteria(criteria) == ["AAA"]
+
+    other_table.insert_assets(
+        [{**make_asset("CCC"), "dateLastUpdated": "2021-03-02 00:00:00"}]
+    )
+    assert asset_table.get_symbols_from_criteria(criteria) == ["CCC"]
+
+
+def test_refresh_only_rewrites_changed_assets(tmp_path):
+    asset_table = AssetTableManager(str(tmp_path / "AssetDB.db"))
+    asset_table.refresh_assets(
+        [
+            make_asset("AAA"),
+            make_asset("BBB", isSuspended=True),
+            make_asset("CCC", isDelisted=True),
+        ],
+        "2021-03-01 00:00:00",
+    )
+    asset_table.update_asset({"stockSymbol": "AAA", "index_name": "SP500"})
+
+    list_changes = asset_table.refresh_assets(
+        [
+            make_asset("AAA", companyName="AAA Corp."),
+            make_asset("BBB"),
+            make_asset("CCC"),
+        ],
+        "2021-03-02 00:00:00",
+    )
+
+    assert sorted((c["stockSymbol"], c["changeType"]) for c in list_changes) == [
+        ("AAA", "updated"),
+        ("BBB", "unsuspended"),
+        ("CCC", "relisted"),
+    ]
+    aaa = asset_table.get_one_asset("AAA")
+    assert aaa["companyName"] == "AAA Corp."
+    # Not part of the listing, kept as stored
+    assert aaa["index_name"] == "SP500"
+    assert aaa["dateLastUpdated"] == "2021-03-02 00:00:00"
+    # CCC was delisted when first seen, no listing was recorded
+    assert [
+        c["changeType"]
+        for c in asset_table.get_asset_changes()
+        if c["stockSymbol"] == "CCC"
+    ] == ["relisted"]
@@ -0,0 +1,23 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+from DataManager.utils.trading_calendar import TradingCalendar
+
+
+@pytest.mark.parametrize(
+    "now, expected",
+    [
+        ("2021-12-06 14:00", "2021-12-03"),  # Monday before the open
+        ("2021-12-06 20:59", "2021-12-03"),  # Monday before the close
+        ("2021-12-06 21:05", "2021-12-06"),
+        ("2021-12-05 12:00", "2021-12-03"),  # Sunday
+        ("2021-11-26 18:30", "2021-11-26"),  # after the 13:00 ET early close
+    ],
+)
+def test_last_completed_session(now, expected):
+    now_epoch = datetime.fromisoformat(now).replace(tzinfo=timezone.utc).timestamp()
+    assert TradingCalendar.get("NYSE").last_completed_session(
+        now_epoch
+    ) == pd.Timestamp(expected)